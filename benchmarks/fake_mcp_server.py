@@ -0,0 +1,51 @@
+"""
+Local stand-in for the GitHub MCP server, speaking MCP over stdio like the real one.
+
+The tools answer instantly with canned payloads so that a benchmark only measures profiling-cli's own overhead
+(process startup, tool discovery, tool calls). Point the CLI at it with
+PROFILE_MCP_SERVER_COMMAND="python benchmarks/fake_mcp_server.py".
+"""
+import base64
+import hashlib
+
+from mcp.server.fastmcp import FastMCP
+
+server = FastMCP("github")
+
+
+def _sha(*parts: str) -> str:
+    """Deterministic fake git SHA."""
+    return hashlib.sha1("/".join(parts).encode()).hexdigest()
+
+
+@server.tool()
+def get_file_contents(owner: str, repo: str, path: str, branch: str = "main") -> dict:
+    """Get the contents of a file or directory from a GitHub repository"""
+    content = f"def placeholder():\n    return '{owner}/{repo}/{path}'\n"
+    return {"path": path, "sha": _sha(owner, repo, path, branch), "encoding": "base64",
+            "content": base64.b64encode(content.encode()).decode()}
+
+
+@server.tool()
+def create_branch(owner: str, repo: str, branch: str, from_branch: str = "main") -> dict:
+    """Create a new branch in a GitHub repository"""
+    return {"ref": f"refs/heads/{branch}", "object": {"sha": _sha(owner, repo, from_branch)}}
+
+
+@server.tool()
+def create_or_update_file(owner: str, repo: str, path: str, content: str, message: str, branch: str,
+                          sha: str = "") -> dict:
+    """Create or update a single file in a GitHub repository"""
+    return {"content": {"path": path, "sha": _sha(owner, repo, path, branch, content)},
+            "commit": {"sha": _sha(message, branch), "message": message}}
+
+
+@server.tool()
+def create_pull_request(owner: str, repo: str, title: str, head: str, base: str, body: str = "") -> dict:
+    """Create a new pull request in a GitHub repository"""
+    return {"number": 1, "title": title, "head": head, "base": base,
+            "html_url": f"https://github.com/{owner}/{repo}/pull/1"}
+
+
+if __name__ == "__main__":
+    server.run()
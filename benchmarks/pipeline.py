@@ -0,0 +1,78 @@
+"""
+Entry point running the profiling-cli CLI with a local fake model in place of the model provider.
+
+It takes the same arguments as profiling-cli, e.g. python benchmarks/pipeline.py profile -c .env --timings
+"""
+import json
+import re
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from profiling_cli import cli as cli_module
+from profiling_cli.agent.routing import RoutedChatModel
+
+PR_PROMPT_MARKER = "please create a pull request"
+SUMMARY_PROMPT_MARKER = "Progressively summarize"
+# Tool calls the fake model makes for a PR, in order, each one answered by the fake MCP server
+PR_TOOL_CALLS = ["get_file_contents", "create_branch", "create_or_update_file", "create_pull_request"]
+
+
+def _action(action: str, action_input: Any) -> str:
+    """Format an action the way the structured chat agent parses it."""
+    return f'Action:\n```\n{json.dumps({"action": action, "action_input": action_input})}\n```'
+
+
+class FakeProfilingModel(BaseChatModel):
+    """
+    Deterministic chat model answering like a well behaved provider: an analysis with optimized code for the
+    first turn, the GitHub tool calls of a PR when asked for one and a short summary when the memory folds turns.
+    """
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-profiling-model"
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._respond(messages)))])
+
+    def _respond(self, messages: list[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if SUMMARY_PROMPT_MARKER in prompt:
+            return "The model analyzed the profiling results and proposed an optimized function."
+        if PR_PROMPT_MARKER in prompt.split("LATEST OPTIMIZED CODE")[-1]:
+            return self._pr_step(prompt.rsplit(PR_PROMPT_MARKER, 1)[-1])
+        function = re.search(r"Function (\w+) at line", prompt)
+        name = function.group(1) if function else "optimized_function"
+        return _action("Final Answer", f"Performance Analysis\n\nIssue 1: the loop dominates the run time.\n\n"
+                                       f"Optimized Function\n```python\ndef {name}(n):\n    return sum(range(n))\n```"
+                                       f"\n\nOptimization Details\n\nThe loop is replaced by a builtin.")
+
+    @staticmethod
+    def _pr_step(scratchpad: str) -> str:
+        """Next tool call of the PR, or the final answer once every call was observed."""
+        done = scratchpad.count("Observation")
+        if done >= len(PR_TOOL_CALLS):
+            return _action("Final Answer", "Created https://github.com/bench/synthetic/pull/1")
+        arguments = {"owner": "bench", "repo": "synthetic", "path": "synth/module_0.py", "branch": "opt-abcdefgh",
+                     "content": "def f(n):\n    return sum(range(n))\n", "message": "Optimize f", "sha": "0" * 40,
+                     "title": "Optimize f", "head": "opt-abcdefgh", "base": "main"}
+        tool = PR_TOOL_CALLS[done]
+        keys = {"get_file_contents": ["owner", "repo", "path"],
+                "create_branch": ["owner", "repo", "branch"],
+                "create_or_update_file": ["owner", "repo", "path", "content", "message", "branch", "sha"],
+                "create_pull_request": ["owner", "repo", "title", "head", "base"]}[tool]
+        return _action(tool, {key: arguments[key] for key in keys})
+
+
+def main() -> None:
+    """Run the CLI with the fake model, behind the router the CLI builds its model with."""
+    cli_module.initiate_router = lambda **kwargs: RoutedChatModel(models={"fake": FakeProfilingModel()})
+    cli_module.cli()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+End-to-end benchmark of the profiling-cli profile pipeline on synthetic projects of increasing size.
+
+Every run goes through the real CLI, pytest plugin, memray and agent session, with a local fake model and a
+fake GitHub MCP server standing in for the external services, and reports the --timings trace of each stage
+with the peak RSS. Usage: python benchmarks/run_benchmarks.py --size small --size medium --repeat 3
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import click
+from synthetic_project import PROJECT_SIZES, generate_project
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+TIMINGS_FILE = "timings.json"
+# The CLI prints the errors of the analysis session instead of exiting with an error code
+SESSION_ERROR_MARKER = "Sorry mate:"
+
+
+def run_pipeline(project_dir: Path, modules: list[str]) -> dict:
+    """
+    Profile a synthetic project with the CLI, in CI mode so that the session ends with a PR.
+
+    :param project_dir: Directory of the project
+    :param modules: Modules to profile
+    :return: The --timings trace of the run
+    """
+    config = project_dir / ".env"
+    config.write_text("ANTHROPIC_API_KEY=fake\nGITHUB_PERSONAL_ACCESS_TOKEN=fake\n")
+    env = {**os.environ, "CI": "true", "GITHUB_REPOSITORY": "bench/synthetic", "OPT_FUNC_REPO_PRIVATE": "false",
+           "OPT_FUNC_FILE_PATH": "synth/module_0.py",
+           "PROFILE_MCP_SERVER_COMMAND": f"{sys.executable} {BENCHMARKS_DIR / 'fake_mcp_server.py'}"}
+    cmd = [sys.executable, str(BENCHMARKS_DIR / "pipeline.py"), "profile", "-c", str(config), "-tp", "tests",
+           "-tm", "tests", "--timings-file", TIMINGS_FILE]
+    for module in modules:
+        cmd += ["-m", module]
+    # The CLI exits with the pytest exit code when the tests fail, checked here to report the output with it
+    process = subprocess.run(cmd, cwd=project_dir, env=env, capture_output=True, text=True, check=False)
+    timings_file = project_dir / TIMINGS_FILE
+    if process.returncode != 0 or not timings_file.is_file() or SESSION_ERROR_MARKER in process.stdout:
+        raise click.ClickException(f"Pipeline failed with exit code {process.returncode}:\n{process.stdout[-3000:]}"
+                                   f"{process.stderr[-3000:]}")
+    trace = json.loads(timings_file.read_text())
+    timings_file.unlink()
+    return trace
+
+
+def summarize(traces: list[dict]) -> dict:
+    """
+    Median of every stage over the repetitions, stages run several times in one run are summed.
+
+    :param traces: --timings traces of the repetitions
+    :return: Dict with stages (seconds by stage), total_seconds, peak_rss and children_peak_rss keys, the peak RSS
+             is None where the platform does not report it
+    """
+    stage_seconds = {}
+    for trace in traces:
+        run = {}
+        for stage in trace["stages"]:
+            run[stage["stage"]] = run.get(stage["stage"], 0.0) + stage["seconds"]
+        for name, seconds in run.items():
+            stage_seconds.setdefault(name, []).append(seconds)
+    return {"stages": {name: statistics.median(values) for name, values in stage_seconds.items()},
+            "total_seconds": statistics.median(trace["total_seconds"] for trace in traces),
+            "peak_rss": max((trace["peak_rss"] for trace in traces if trace["peak_rss"] is not None), default=None),
+            "children_peak_rss": max((trace["children_peak_rss"] for trace in traces
+                                      if trace["children_peak_rss"] is not None), default=None)}
+
+
+def format_results(results: dict[str, dict]) -> str:
+    """
+    Format the summaries of every size as a table, one column per size.
+
+    :param results: Summary of every size as returned by summarize
+    :return: The table
+    """
+    sizes = list(results)
+    stages = list(dict.fromkeys(name for summary in results.values() for name in summary["stages"]))
+    lines = [f"{'stage':<18}" + "".join(f"{size:>14}" for size in sizes)]
+    for name in stages:
+        lines.append(f"{name:<18}" + "".join(f"{results[size]['stages'].get(name, 0.0):>12.3f} s"
+                                             for size in sizes))
+    lines.append(f"{'total':<18}" + "".join(f"{results[size]['total_seconds']:>12.3f} s" for size in sizes))
+    for key, label in (("peak_rss", "peak RSS"), ("children_peak_rss", "pytest peak RSS")):
+        lines.append(f"{label:<18}" + "".join(f"{'n/a':>14}" if results[size][key] is None else
+                                              f"{results[size][key] / 1024 ** 2:>10.1f} MiB" for size in sizes))
+    return "\n".join(lines)
+
+
+@click.command()
+@click.option('--size', '-s', multiple=True, type=click.Choice(list(PROJECT_SIZES)),
+              help='Project size to benchmark (can be used multiple times, default all)')
+@click.option('--repeat', '-r', type=int, default=1, help='Runs per size, the median of every stage is reported')
+@click.option('--output', '-o', help='Also write the results as JSON to this file')
+def main(size: tuple[str, ...], repeat: int, output: str | None) -> None:
+    """Benchmark the profiling pipeline on synthetic projects."""
+    results = {}
+    for name in size or PROJECT_SIZES:
+        with tempfile.TemporaryDirectory(prefix=f"profiling-cli-bench-{name}-") as project_dir:
+            modules = generate_project(Path(project_dir), **PROJECT_SIZES[name])
+            click.echo(f"Benchmarking {name} project: {PROJECT_SIZES[name]}")
+            results[name] = summarize([run_pipeline(Path(project_dir), modules) for _ in range(repeat)])
+    click.echo(format_results(results))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
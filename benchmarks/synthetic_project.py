@@ -0,0 +1,67 @@
+"""
+Generator of synthetic projects to profile, their size drives the volume of the profiling pipeline: number of
+tests pytest runs, number of functions registered with the line profiler and lines of stats to parse and send.
+"""
+from pathlib import Path
+
+# modules, functions per module and tests per function of every preset
+PROJECT_SIZES = {
+    "small": {"modules": 2, "functions": 5, "tests": 2},
+    "medium": {"modules": 5, "functions": 10, "tests": 2},
+    "large": {"modules": 10, "functions": 20, "tests": 2},
+}
+
+PACKAGE = "synth"
+
+FUNCTION_TEMPLATE = '''
+
+def func_{index}(n):
+    total = 0
+    for k in range(n):
+        if k % {modulo} == 0:
+            total += k * {factor}
+        else:
+            total -= 1
+    items = [str(k) for k in range(n // 10)]
+    return total, len(items)
+'''
+
+TEST_TEMPLATE = '''
+
+def test_func_{index}_{case}():
+    total, count = module.func_{index}({n})
+    assert count == {n} // 10
+'''
+
+
+def generate_project(root: Path, modules: int, functions: int, tests: int) -> list[str]:
+    """
+    Write a project with a package of modules and a test per function and case.
+
+    :param root: Directory of the project, created if needed
+    :param modules: Number of modules of the package
+    :param functions: Number of functions of each module
+    :param tests: Number of tests of each function
+    :return: Names of the modules to profile
+    """
+    package_dir = root / PACKAGE
+    tests_dir = root / "tests"
+    package_dir.mkdir(parents=True, exist_ok=True)
+    tests_dir.mkdir(parents=True, exist_ok=True)
+    (package_dir / "__init__.py").write_text("")
+    (tests_dir / "__init__.py").write_text("")
+    # Stops the budgets lookup of the CLI from climbing into the directories the project is generated in
+    (root / "pyproject.toml").write_text('[project]\nname = "synthetic"\nversion = "0.0.0"\n')
+
+    module_names = []
+    for module_index in range(modules):
+        name = f"module_{module_index}"
+        (package_dir / f"{name}.py").write_text("".join(
+            FUNCTION_TEMPLATE.format(index=index, modulo=index + 2, factor=index + 1) for index in range(functions)
+        ).lstrip())
+        (tests_dir / f"test_{name}.py").write_text(f"from {PACKAGE} import {name} as module\n" + "".join(
+            TEST_TEMPLATE.format(index=index, case=case, n=1000 * (case + 1))
+            for index in range(functions) for case in range(tests)
+        ))
+        module_names.append(f"{PACKAGE}.{name}")
+    return module_names
@@ -0,0 +1,4 @@
+import time
+
+# First import of the package, the startup stage of --timings is measured from here
+IMPORT_TIME = time.perf_counter()
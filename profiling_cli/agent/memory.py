@@ -0,0 +1,151 @@
+import re
+from typing import Any
+
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from profiling_cli.consts import DEFAULT_MEMORY_TOKEN_LIMIT, DEFAULT_MEMORY_WINDOW_TURNS
+
+# Rough number of characters per token, good enough to keep the memory under its ceiling without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Replaces the profiling context in the stored first message, the context itself is pinned
+PINNED_CONTEXT_NOTE = "[profiling results, see the pinned profiling context]"
+
+CODE_BLOCK_PATTERN = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text.
+    :param text: The text
+    :return: Approximate number of tokens
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def extract_latest_code(text: str) -> str | None:
+    """
+    Extract the last fenced code block of a model response.
+    :param text: The model response
+    :return: The code, or None if the response has no code block
+    """
+    code_blocks = CODE_BLOCK_PATTERN.findall(text)
+    return code_blocks[-1].strip() if code_blocks else None
+
+
+class ProfilingSessionMemory(ConversationSummaryBufferMemory):
+    """
+    Bounded chat memory for the optimization session.
+
+    The compact profiling context and the latest optimized code are pinned, the most recent turns are kept
+    verbatim and older turns are folded into a running summary, so every request stays under max_token_limit
+    (estimated) however long the session gets. A profiling context over max_token_limit on its own is still pinned
+    whole, the limit then applies to what comes on top of it.
+    """
+
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    max_token_limit: int = DEFAULT_MEMORY_TOKEN_LIMIT
+    # Number of recent exchanges (question and answer) kept verbatim
+    window_turns: int = DEFAULT_MEMORY_WINDOW_TURNS
+    profiling_context: str = ""
+    optimized_code: str = ""
+
+    def load_memory_variables(self, inputs: dict[str, Any]) -> dict[str, Any]:
+        """Return the pinned context, summary and latest code followed by the recent turns."""
+        messages = self.chat_memory.messages
+        if not messages:
+            # First turn, the profiling context is part of the input itself
+            return {self.memory_key: []}
+        return {self.memory_key: self._pinned_messages() + list(messages)}
+
+    async def aload_memory_variables(self, inputs: dict[str, Any]) -> dict[str, Any]:
+        """Asynchronously return the pinned context, summary and latest code followed by the recent turns."""
+        return self.load_memory_variables(inputs)
+
+    def save_context(self, inputs: dict[str, Any], outputs: dict[str, str]) -> None:
+        """Save a turn, then fold the turns that no longer fit into the summary."""
+        self._add_turn(inputs, outputs)
+        self.prune()
+
+    async def asave_context(self, inputs: dict[str, Any], outputs: dict[str, str]) -> None:
+        """Asynchronously save a turn, then fold the turns that no longer fit into the summary."""
+        self._add_turn(inputs, outputs)
+        await self.aprune()
+
+    def prune(self) -> None:
+        """Summarize the turns that fall out of the window or over the token ceiling."""
+        pruned_messages = self._pop_overflow()
+        if pruned_messages:
+            self.moving_summary_buffer = self.predict_new_summary(pruned_messages, self.moving_summary_buffer)
+
+    async def aprune(self) -> None:
+        """Asynchronously summarize the turns that fall out of the window or over the token ceiling."""
+        pruned_messages = self._pop_overflow()
+        if pruned_messages:
+            self.moving_summary_buffer = await self.apredict_new_summary(pruned_messages,
+                                                                         self.moving_summary_buffer)
+
+    def pin_profiling_context(self, profiling_context: str) -> None:
+        """
+        Pin the profiling context, warning when it alone is over the token ceiling.
+        :param profiling_context: The compact profiling context of the first turn
+        :return: None
+        """
+        self.profiling_context = profiling_context
+        context_tokens = self._context_tokens()
+        if context_tokens > self.max_token_limit:
+            print(f"The profiling context takes about {context_tokens} tokens, more than the memory token limit of "
+                  f"{self.max_token_limit}: it is kept whole and the limit applies to the conversation on top of it, "
+                  f"raise --memory-token-limit to bound both")
+
+    def clear(self) -> None:
+        """Clear the turns, the summary and the latest code, the profiling context stays pinned."""
+        super().clear()
+        self.optimized_code = ""
+
+    def estimate_memory_tokens(self) -> int:
+        """
+        Estimate the tokens the memory adds to every request.
+        :return: Approximate number of tokens of the pinned message and the recent turns
+        """
+        return sum(estimate_tokens(str(message.content))
+                   for message in self._pinned_messages() + list(self.chat_memory.messages))
+
+    def _add_turn(self, inputs: dict[str, Any], outputs: dict[str, str]) -> None:
+        """Store a turn without the pinned profiling context and remember the latest optimized code."""
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        if self.profiling_context:
+            input_str = input_str.replace(self.profiling_context, PINNED_CONTEXT_NOTE)
+        self.chat_memory.add_messages([HumanMessage(content=input_str), AIMessage(content=output_str)])
+        code = extract_latest_code(output_str)
+        if code:
+            self.optimized_code = code
+
+    def _pop_overflow(self) -> list[BaseMessage]:
+        """Remove the oldest turns until the window and the token ceiling are respected, keeping the last one."""
+        messages = self.chat_memory.messages
+        # A context over the ceiling on its own would leave room for no turn at all, it is not counted then
+        context_tokens = self._context_tokens()
+        uncounted_tokens = context_tokens if context_tokens > self.max_token_limit else 0
+        pruned_messages = []
+        while len(messages) > 2 and (len(messages) > 2 * self.window_turns or
+                                     self.estimate_memory_tokens() - uncounted_tokens > self.max_token_limit):
+            pruned_messages += [messages.pop(0), messages.pop(0)]
+        return pruned_messages
+
+    def _context_tokens(self) -> int:
+        """Estimated tokens of the pinned profiling context."""
+        return estimate_tokens(self.profiling_context) if self.profiling_context else 0
+
+    def _pinned_messages(self) -> list[SystemMessage]:
+        """A system message holding the profiling context, the summary and the latest optimized code, if any."""
+        sections = []
+        if self.profiling_context:
+            sections.append(f"PINNED PROFILING CONTEXT:\n{self.profiling_context}")
+        if self.moving_summary_buffer:
+            sections.append(f"SUMMARY OF THE EARLIER CONVERSATION:\n{self.moving_summary_buffer}")
+        if self.optimized_code:
+            sections.append(f"LATEST OPTIMIZED CODE:\n```python\n{self.optimized_code}\n```")
+        return [SystemMessage(content="\n\n".join(sections))] if sections else []
@@ -0,0 +1,163 @@
+import asyncio
+import statistics
+import time
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field
+
+from profiling_cli.consts import DEFAULT_MODEL_MAX_RETRIES, MODEL_RETRY_BACKOFF_SECONDS
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model sending each request to several model providers, so that a slow or overloaded endpoint does not stall
+    the session.
+
+    The providers are tried in their fallback order, or raced with race=True and the first good answer (non-empty)
+    is kept while the other requests are cancelled. Every request gets request_timeout seconds and is retried
+    max_retries times with exponential backoff before the next provider is tried. The latency of every attempt is
+    printed and kept in latencies. Racing only applies to the asynchronous calls the agent makes, synchronous calls
+    follow the fallback order and rely on the timeout of the provider clients.
+    """
+
+    # Provider models by label e.g. ollama:llama3, in fallback order
+    models: dict[str, Any]
+    race: bool = False
+    request_timeout: float | None = None
+    max_retries: int = DEFAULT_MODEL_MAX_RETRIES
+    retry_backoff: float = MODEL_RETRY_BACKOFF_SECONDS
+    latencies: list[dict[str, Any]] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"models": list(self.models), "race": self.race}
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        """Ask the providers one after the other until one answers."""
+        errors = []
+        for label, model in self.models.items():
+            for attempt in range(self.max_retries + 1):
+                started = time.perf_counter()
+                try:
+                    message = to_ai_message(model.invoke(messages, stop=stop))
+                except Exception as e:  # noqa: BLE001 - every provider SDK has its own errors, the next one is asked
+                    errors.append(self._record(label, attempt, started, e))
+                    if attempt < self.max_retries:
+                        time.sleep(self.retry_backoff * 2 ** attempt)
+                    continue
+                self._record(label, attempt, started)
+                return ChatResult(generations=[ChatGeneration(message=message, generation_info={"model": label})])
+        raise RuntimeError(f"No model answered: {'; '.join(errors)}")
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        """Race the providers, or ask them one after the other, until one answers."""
+        if self.race and len(self.models) > 1:
+            label, message = await self._race(messages, stop)
+        else:
+            errors = []
+            for label, model in self.models.items():
+                try:
+                    label, message = await self._ask(label, model, messages, stop)
+                    break
+                except RuntimeError as e:
+                    errors.append(str(e))
+            else:
+                raise RuntimeError(f"No model answered: {'; '.join(errors)}")
+        return ChatResult(generations=[ChatGeneration(message=message, generation_info={"model": label})])
+
+    async def _race(self, messages: list[BaseMessage], stop: list[str] | None) -> tuple[str, AIMessage]:
+        """Ask all the providers at once and keep the first answer, the other requests are cancelled."""
+        tasks = [asyncio.ensure_future(self._ask(label, model, messages, stop))
+                 for label, model in self.models.items()]
+        errors = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except RuntimeError as e:
+                    errors.append(str(e))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        raise RuntimeError(f"No model answered: {'; '.join(errors)}")
+
+    async def _ask(self, label: str, model: Any, messages: list[BaseMessage],
+                   stop: list[str] | None) -> tuple[str, AIMessage]:
+        """Ask a provider, retrying with backoff, raising RuntimeError with the last error if it never answers."""
+        error = None
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                message = to_ai_message(await asyncio.wait_for(model.ainvoke(messages, stop=stop),
+                                                               self.request_timeout))
+            except asyncio.CancelledError:
+                # Lost the race
+                self.latencies.append({"model": label, "attempt": attempt, "status": "cancelled",
+                                       "seconds": time.perf_counter() - started})
+                raise
+            except Exception as e:  # noqa: BLE001 - every provider SDK has its own errors, recorded and retried
+                error = self._record(label, attempt, started, e)
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+                continue
+            self._record(label, attempt, started)
+            return label, message
+        raise RuntimeError(error)
+
+    def _record(self, label: str, attempt: int, started: float, error: Exception | None = None) -> str:
+        """Log and keep the latency of an attempt, return the error description."""
+        seconds = time.perf_counter() - started
+        if error is None:
+            status, description = "ok", ""
+            print(f"Model {label} answered in {seconds:.2f} s")
+        else:
+            timed_out = isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
+            status = "timeout" if timed_out else "error"
+            description = f"{label}: {'timed out' if timed_out else f'{type(error).__name__}: {error}'}"
+            print(f"Model {label} failed after {seconds:.2f} s (attempt {attempt + 1} of {self.max_retries + 1}), "
+                  f"{description}")
+        self.latencies.append({"model": label, "attempt": attempt, "status": status, "seconds": seconds})
+        return description
+
+
+def to_ai_message(output: Any) -> AIMessage:
+    """
+    Turn the output of a chat model or a completion model into the message of a good answer.
+
+    :param output: Message or text returned by the provider model
+    :return: The answer as an AIMessage
+    :raises ValueError: If the answer is empty
+    """
+    message = output if isinstance(output, AIMessage) else AIMessage(content=getattr(output, "content", output))
+    if not str(message.content).strip():
+        raise ValueError("Empty answer")
+    return message
+
+
+def format_latency_report(latencies: list[dict[str, Any]]) -> str:
+    """
+    Summarize the latency of the requests sent to every model provider.
+
+    :param latencies: Attempts as recorded by RoutedChatModel
+    :return: Human readable report, one line per provider
+    """
+    lines = ["Model latency:"]
+    for label in dict.fromkeys(latency["model"] for latency in latencies):
+        attempts = [latency for latency in latencies if latency["model"] == label]
+        answered = [latency["seconds"] for latency in attempts if latency["status"] == "ok"]
+        counts = {status: sum(latency["status"] == status for latency in attempts)
+                  for status in ("error", "timeout", "cancelled")}
+        median = f"median {statistics.median(answered):.2f} s, max {max(answered):.2f} s" if answered else "no answer"
+        lines.append(f"- {label}: {len(answered)} answers ({median}), {counts['error']} errors, "
+                     f"{counts['timeout']} timeouts, {counts['cancelled']} cancelled after losing a race")
+    return "\n".join(lines)
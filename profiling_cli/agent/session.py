@@ -1,15 +1,21 @@
 import os
+import shlex
+import time
 from typing import Any
 
 import click
 from langchain.agents import initialize_agent, AgentType
-from langchain.memory import ConversationBufferMemory
 from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_mcp_adapters.client import MultiServerMCPClient, StdioConnection
 
+from profiling_cli.agent.memory import ProfilingSessionMemory
 from profiling_cli.agent.tools import create_pr_with_optimized_function
-from profiling_cli.utils.plugin_utils import parse_line_profiler_output
+from profiling_cli.consts import TIMER_METRIC_LABELS, DEFAULT_MEMORY_TOKEN_LIMIT, TimerConst, \
+    PROFILE_MCP_SERVER_COMMAND, DEFAULT_MCP_SERVER_COMMAND, StageConst
+from profiling_cli.utils.memory_utils import attach_line_memory
+from profiling_cli.utils.plugin_utils import attach_cpu_times, parse_line_profiler_output, format_profile_data
+from profiling_cli.utils.timing_utils import StageTimer
 
 
 custom_prompt = ChatPromptTemplate.from_messages([
@@ -66,33 +72,88 @@ Optimization Details
 ])
 
 
-async def run_agent_session(profiler_stats: str, memray_stats: str, llm: Any) -> None:
+def format_additional_stats(additional_stats: dict[str, str] | None) -> str:
+    """
+    Format additional results as titled sections of the analysis prompt.
+    :param additional_stats: Extra results keyed by section title
+    :return: The sections, or an empty string if there are none
+    """
+    if not additional_stats:
+        return ""
+    return "".join(f"{title}: \n {content} \n" for title, content in additional_stats.items())
+
+
+def build_profiling_context(profile_data: list[dict], memray_stats: str | list[str], timer: str = TimerConst.WALL,
+                            metric_note: str = "", additional_stats: dict[str, str] | None = None) -> str:
+    """
+    Build the compact profiling context analyzed in the first turn and pinned in the session memory.
+    :param profile_data: Parsed line stats, the code of the functions is part of the table, with the memory of
+                         every line when it was tracked
+    :param memray_stats: Memory stats from memray, as text or report lines
+    :param timer: Timer the line stats were measured with, see TimerConst
+    :param metric_note: Optional note on how to read the line metrics
+    :param additional_stats: Optional extra results to analyze, keyed by section title
+    :return: The profiling context
+    """
+    memray_text = "".join(memray_stats) if isinstance(memray_stats, list) else memray_stats
+    has_memory = any('allocated' in line for function in profile_data for line in function['lines'])
+    # The per-line time and memory table comes first, the memray report only gives the allocation stacks behind it
+    title = "PER-LINE TIME AND MEMORY RESULTS (time metric" if has_memory else "LINE PROFILER RESULTS (metric"
+    return (f"{title}: {TIMER_METRIC_LABELS.get(timer, timer)}): \n"
+            f"{format_profile_data(profile_data)} \n"
+            f"{metric_note}"
+            f"MEMORY PROFILER RESULTS{' (ALLOCATION STACKS)' if has_memory else ''}: \n {memray_text} \n"
+            f"{format_additional_stats(additional_stats)}")
+
+
+def get_mcp_server_command() -> tuple[str, list[str]]:
+    """
+    Command starting the GitHub MCP server, the docker image unless PROFILE_MCP_SERVER_COMMAND is set.
+    :return: Tuple (command, arguments)
+    """
+    override = os.environ.get(PROFILE_MCP_SERVER_COMMAND)
+    command, *args = shlex.split(override) if override else DEFAULT_MCP_SERVER_COMMAND
+    return command, args
+
+
+async def run_agent_session(profiler_stats: str, memray_stats: str, llm: Any,
+                            additional_stats: dict[str, str] | None = None, timer: str = TimerConst.WALL,
+                            cpu_profiler_stats: str | None = None,
+                            memory_token_limit: int = DEFAULT_MEMORY_TOKEN_LIMIT,
+                            stage_timer: StageTimer | None = None,
+                            line_memory: dict[tuple[str, int], dict[str, int]] | None = None) -> None:
     """
     Run the agent session with the provided profiler and memory stats.
     :param profiler_stats: Profile stats from line_profiler
     :param memray_stats: Memory stats from memray
     :param llm: Language model instance
+    :param additional_stats: Optional extra results to analyze, keyed by section title
+    :param timer: Timer the line stats were measured with, see TimerConst
+    :param cpu_profiler_stats: CPU time line stats, when both timers were used
+    :param memory_token_limit: Approximate number of tokens the chat memory may add to each request
+    :param stage_timer: Optional trace the agent startup, parsing, payload, turn and PR stages are recorded in
+    :param line_memory: Optional memory of the lines as returned by load_line_memory, joined with their time
     :return: None
     """
     # Check if running in CI environment
     is_ci = True if os.environ.get("CI", "false") == "true" else False
     # Initialize environment variables
     env = os.environ.copy()
+    stage_timer = stage_timer or StageTimer()
+    mcp_command, mcp_args = get_mcp_server_command()
 
+    # The MCP server starts when entering the client, the agent startup stage ends once the agent is built
+    startup_started = time.perf_counter()
     async with MultiServerMCPClient(
             {
-                "github": StdioConnection(command="docker",
-                                          args=["run", "-i", "--rm", "-e", "GITHUB_PERSONAL_ACCESS_TOKEN",
-                                                "ghcr.io/github/github-mcp-server"],
+                "github": StdioConnection(command=mcp_command,
+                                          args=mcp_args,
                                           transport="stdio",
                                           env=env)
             }
     ) as client:
-        # Create memory
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # Create memory, bounded so that long sessions keep a flat per-turn cost
+        memory = ProfilingSessionMemory(llm=llm, max_token_limit=memory_token_limit)
         print("Fetching tools from MCP server")
         tools = client.get_tools()
         # Create a StructuredChatAgent which supports multi-input tools
@@ -109,25 +170,43 @@ async def run_agent_session(profiler_stats: str, memray_stats: str, llm: Any) ->
                 "prompt": custom_prompt
             }
         )
+        stage_timer.record(StageConst.AGENT_STARTUP, time.perf_counter() - startup_started)
 
         # Print header
         click.echo(click.style("ANALYSIS RESULTS", fg="bright_blue", bold=True))
         click.echo(click.style("═" * 80, fg="bright_blue"))
 
-        function_texts, profile_data = parse_line_profiler_output(profiler_stats)
-
-        # First interaction is with the stats to get the initial response.
-        first_input = F"""According to your instructions, please analyze the following functions. \n
-        FUNCTIONS: \n {function_texts} \n
-        LINE PROFILER RESULTS: \n {profile_data} \n
-        MEMORY PROFILER RESULTS: \n {memray_stats}. \n
+        with stage_timer.stage(StageConst.STATS_PARSING):
+            function_texts, profile_data = parse_line_profiler_output(profiler_stats)
+            metric_note = ""
+            if cpu_profiler_stats:
+                _, cpu_profile_data = parse_line_profiler_output(cpu_profiler_stats)
+                attach_cpu_times(profile_data, cpu_profile_data)
+                metric_note = ("Lines flagged io_bound spend most of their wall time waiting (I/O, sleeps, locks) "
+                               "rather than computing, under threads that includes waiting for the GIL. \n")
+            if line_memory:
+                attach_line_memory(profile_data, line_memory)
+                metric_note += ("allocated and allocs are the memory a line held at the peak, retained the memory it "
+                                "still held at the end, both include the functions it calls. A line can be memory "
+                                "heavy without being slow. \n")
+
+        with stage_timer.stage(StageConst.PAYLOAD_BUILDING):
+            # The profiling context is pinned in memory, later turns reference it instead of resending the first input
+            profiling_context = build_profiling_context(profile_data, memray_stats, timer=timer,
+                                                        metric_note=metric_note, additional_stats=additional_stats)
+            memory.pin_profiling_context(profiling_context)
+
+            # First interaction is with the stats to get the initial response.
+            first_input = F"""According to your instructions, please analyze the following functions. \n
+        {profiling_context}
         REMINDER: You MUST include a complete optimized version of the function in your response.
         Analysis alone is not sufficient.
         Reminder: You must not use your github tools for this analysis"""
         click.echo(first_input)
-        response = await agent_executor.ainvoke(
-            {"input": first_input}
-        )
+        with stage_timer.stage(StageConst.AGENT_TURN):
+            response = await agent_executor.ainvoke(
+                {"input": first_input}
+            )
 
         response.get("output", "I couldn't process that.")
         # Print footer
@@ -136,7 +215,8 @@ async def run_agent_session(profiler_stats: str, memray_stats: str, llm: Any) ->
 
         if is_ci:
             if function_texts != ['']:
-                await create_pr_with_optimized_function(agent_executor)
+                with stage_timer.stage(StageConst.PR_TOOLING):
+                    await create_pr_with_optimized_function(agent_executor)
                 print("Chatbot: Goodbye!")
                 return
             else:
@@ -152,11 +232,13 @@ async def run_agent_session(profiler_stats: str, memray_stats: str, llm: Any) ->
                 break
 
             elif user_input.lower() in ["create-pr", "createpr", "create pr", "/createpr"]:
-                await create_pr_with_optimized_function(agent_executor)
+                with stage_timer.stage(StageConst.PR_TOOLING):
+                    await create_pr_with_optimized_function(agent_executor)
             else:
-                response = await agent_executor.ainvoke(
-                    {"input": user_input}
-                )
+                with stage_timer.stage(StageConst.AGENT_TURN):
+                    response = await agent_executor.ainvoke(
+                        {"input": user_input}
+                    )
 
                 # Extract the output message
                 response.get("output", "I couldn't process that.")
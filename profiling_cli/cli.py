@@ -1,4 +1,5 @@
 import asyncio
+import json
 import os
 import shutil
 import subprocess
@@ -9,11 +10,32 @@ import click
 from dotenv import load_dotenv
 
 from profiling_cli.consts import PROFILE_MODULES, PROFILE_FUNCTIONS, PROFILE_OUTPUT_DIR, DEFAULT_OUTPUT_DIR, \
-    LINE_PROFILING_PLUGIN, LINE_PROFILING_PLUGIN_FILE, LINE_STATS_FILE, ModelProviderConst
+    LINE_PROFILING_PLUGIN, LINE_PROFILING_PLUGIN_FILE, LINE_STATS_FILE, PROFILE_SUBPROCESSES, PROFILE_THREADS, \
+    PROFILE_TIMER, PROFILE_TARGETS, PROFILE_BUDGETS, LINE_PROFILING_PLUGIN_MODULE, DEFAULT_BATCH_REPORT_FILE, \
+    DEFAULT_MEMORY_TOKEN_LIMIT, PROFILE_GC, PROFILE_GC_THRESHOLD, PROFILE_GC_FREEZE, GC_TUNED_DIR, ModelProviderConst, \
+    TimerConst, StageConst, STARTUP_STATS_FILE, LINE_STATS_RAW_FILE, PROFILE_LEAK_ITERATIONS, PROFILE_LEAK_WARMUP, \
+    PROFILE_LEAK_THRESHOLD, PROFILE_ENTRY_POINTS, PROFILE_MARKER, DEFAULT_MODEL_MAX_RETRIES, PROFILE_WATCH_INTERVAL, \
+    DEFAULT_WATCH_INTERVAL, WATCH_PLUGIN_MODULE, PROFILE_MEMORY
+from profiling_cli import IMPORT_TIME
 from profiling_cli.agent.session import run_agent_session
-from profiling_cli.utils.agent_utils import initiate_model
-from profiling_cli.utils.cli_utils import display_process_output, get_model_providers_names
+from profiling_cli.agent.routing import format_latency_report
+from profiling_cli.utils.agent_utils import initiate_router, parse_model_spec
+from profiling_cli.utils.cli_utils import get_model_providers_names, load_additional_stats, load_run_metadata, \
+    load_cpu_line_stats, run_pytest, build_batch_report, load_budget_results, budgets_exceeded, \
+    load_antipattern_report, run_repeated_pytest, combine_repeated_runs, default_jobs, run_pytest_pass, \
+    compare_gc_runs, load_leak_results, run_profiled_program, load_memory_report, load_line_table
+from profiling_cli.utils.budget_utils import format_budget_report, parse_memory_size
+from profiling_cli.utils.config_utils import find_pyproject, load_project_config, load_profiling_targets, load_budgets
+from profiling_cli.utils.gc_utils import parse_gc_threshold
+from profiling_cli.utils.memory_utils import load_line_memory
 from profiling_cli.utils.path_utils import find_tests_directory, infer_test_module
+from profiling_cli.utils.plugin_utils import merge_line_stats
+from profiling_cli.utils.run_utils import RUN_DRIVER_SOURCE, parse_program
+from profiling_cli.utils.selection_utils import select_profiled_tests
+from profiling_cli.utils.startup_utils import resolve_startup_target, run_import_passes, aggregate_import_runs, \
+    slowest_modules, profile_module_execution, find_heavy_statements, format_module_line_stats, \
+    format_startup_report, format_baseline_diff, load_startup_baseline, save_startup_baseline
+from profiling_cli.utils.timing_utils import StageTimer, format_bytes
 
 os.environ[PROFILE_OUTPUT_DIR] = DEFAULT_OUTPUT_DIR
 
@@ -25,8 +47,9 @@ def cli():
 
 
 @cli.command(name="profile")
-@click.option('--config', '-c', required=True,
-              help='Path to config file, must include ANTHROPIC_API_KEY and GITHUB_PERSONAL_ACCESS_TOKEN')
+@click.option('--config', '-c',
+              help='Path to config file, must include ANTHROPIC_API_KEY and GITHUB_PERSONAL_ACCESS_TOKEN '
+                   '(not needed with --no-llm)')
 @click.option('--module', '-m', multiple=True, help='Module to profile (can be used multiple times)')
 @click.option('--function', '-f', multiple=True, help='Function to profile (can be used multiple times)')
 @click.option('--test-path', '-tp', help='Path to test directory or file (auto detect)')
@@ -36,10 +59,76 @@ def cli():
 @click.option('--model-name', '-mn', help='Name of the LLM model e.g. claude-3-5-sonnet-20240620',
               default='claude-3-5-sonnet-20240620', )
 @click.option('--model-base-url', '-mbu', default=None)
-def profile(config: str, module: tuple[str, ...], function: tuple[str, ...],
+@click.option('--fallback-model', '-fm', multiple=True,
+              help='Model asked when the main one fails, provider:model or provider:model@base_url e.g. '
+                   'ollama:llama3@http://localhost:11434 (can be used multiple times, in fallback order)')
+@click.option('--race', is_flag=True, default=False,
+              help='Ask the main and the fallback models at once and keep the first answer')
+@click.option('--request-timeout', type=click.FloatRange(min=0, min_open=True),
+              help='Seconds a model may take to answer before it is retried or the next model is asked')
+@click.option('--max-retries', type=click.IntRange(min=0), default=DEFAULT_MODEL_MAX_RETRIES,
+              help='Retries with exponential backoff of every model before the next one is asked')
+@click.option('--profile-subprocesses', '-ps', is_flag=True, default=False,
+              help='Also profile the functions in child Python processes and merge their stats')
+@click.option('--thread-breakdown', '-tb', is_flag=True, default=False,
+              help='Report per-thread line stats with CPU vs wall time and GIL contention (slower tracer, before '
+                   'Python 3.12 threads already running when profiling starts are not traced)')
+@click.option('--timer', '-t', type=click.Choice([TimerConst.WALL, TimerConst.CPU, TimerConst.BOTH]),
+              default=TimerConst.WALL,
+              help='Measure lines with wall-clock time, per-thread CPU time or both (cpu and both use a slower tracer)')
+@click.option('--pyproject', '-pp', help='Path to the pyproject.toml declaring performance budgets (auto detect)')
+@click.option('--memory-token-limit', '-mtl', type=int, default=DEFAULT_MEMORY_TOKEN_LIMIT,
+              help='Approximate token ceiling of the chat memory, older turns are summarized to stay under it')
+@click.option('--no-llm', is_flag=True, default=False,
+              help='Skip the AI analysis, e.g. to only check the performance budgets in CI')
+@click.option('--select-tests', '-st', is_flag=True, default=False,
+              help='Only run the tests that reach the profiled functions, from a cached map of the functions each '
+                   'test runs')
+@click.option('--changed-since', '-cs',
+              help='Git revision, also select the tests reaching the functions changed since (implies --select-tests)')
+@click.option('--repeat', type=click.IntRange(min=1), default=1,
+              help='Profile the tests this many times and analyze the median, only robust hotspots are findings')
+@click.option('--warmup', type=click.IntRange(min=0), default=0,
+              help='Discarded passes run before the repeated ones to warm the caches')
+@click.option('--jobs', '-j', type=click.IntRange(min=1),
+              help='Number of repeated passes running at once (default half the CPUs)')
+@click.option('--gc-stats', '-gc', is_flag=True, default=False,
+              help='Record the garbage collector pauses by test and by innermost profiled function')
+@click.option('--gc-threshold', help='GC thresholds to compare with, e.g. 50000,20,20, in a second pass (implies '
+                                     '--gc-stats)')
+@click.option('--gc-freeze', is_flag=True, default=False,
+              help='Compare with a second pass where gc.freeze() moves the objects alive after the test collection '
+                   'out of the collections (implies --gc-stats)')
+@click.option('--leak-check', '-lc', is_flag=True, default=False,
+              help='Run the body of every passed test again and again and report the allocation sites whose retained '
+                   'memory grows at every iteration')
+@click.option('--leak-iterations', type=click.IntRange(min=2), default=10,
+              help='Number of measured iterations of the memory growth check')
+@click.option('--leak-warmup', type=click.IntRange(min=0), default=2,
+              help='Iterations run before the measured ones, to fill the caches the code legitimately keeps')
+@click.option('--leak-threshold', help='Fail the run when a test retains more than this per iteration, e.g. 10KiB '
+                                       '(implies --leak-check)')
+@click.option('--marked-only', '-mo', is_flag=True, default=False,
+              help=f'Only run the tests marked @pytest.mark.{PROFILE_MARKER}')
+@click.option('--entry-point', '-ep', multiple=True,
+              help='Only profile the calls made while this function runs, e.g. package.module.function or '
+                   'package.module.Class.method (can be used multiple times)')
+@click.option('--timings', is_flag=True, default=False,
+              help='Print how long each stage of the run took (startup, pytest, stats, agent, PR) and the peak RSS')
+@click.option('--timings-file', help='Also write the per-stage trace as JSON to this file')
+def profile(config: str | None, module: tuple[str, ...], function: tuple[str, ...],
             test_path: str | None = None, test_module: str | None = None,
             model_name: str = "", model_provider: str | ModelProviderConst = "",
-            model_base_url: str | None = None) -> None:
+            model_base_url: str | None = None, fallback_model: tuple[str, ...] = (), race: bool = False,
+            request_timeout: float | None = None, max_retries: int = DEFAULT_MODEL_MAX_RETRIES,
+            profile_subprocesses: bool = False, thread_breakdown: bool = False, timer: str = TimerConst.WALL,
+            pyproject: str | None = None,
+            no_llm: bool = False, memory_token_limit: int = DEFAULT_MEMORY_TOKEN_LIMIT, select_tests: bool = False,
+            changed_since: str | None = None, repeat: int = 1, warmup: int = 0, jobs: int | None = None,
+            gc_stats: bool = False, gc_threshold: str | None = None, gc_freeze: bool = False,
+            leak_check: bool = False, leak_iterations: int = 10, leak_warmup: int = 2,
+            leak_threshold: str | None = None, marked_only: bool = False, entry_point: tuple[str, ...] = (),
+            timings: bool = False, timings_file: str | None = None) -> None:
     """
     Run pytest with line profiling and memory profiling plugins enabled.
 
@@ -55,13 +144,68 @@ def profile(config: str, module: tuple[str, ...], function: tuple[str, ...],
     :param model_name: Optional name of the model e.g. claude-3
     :param model_provider: Optional name of the model provider e.g. anthropic
     :param model_base_url: Optional URL of the model provider instance
+    :param fallback_model: Tuple of models asked when the main one fails, provider:model[@base_url]
+    :param race: Whether to ask all the models at once and keep the first answer
+    :param request_timeout: Optional seconds a model may take to answer
+    :param max_retries: Number of retries of every model before the next one is asked
+    :param profile_subprocesses: Whether to propagate profiling into child Python processes
+    :param thread_breakdown: Whether to trace each thread separately with CPU and wall clocks
+    :param timer: Line timer, wall, cpu or both
+    :param pyproject: Optional path to the pyproject.toml declaring performance budgets
+    :param no_llm: Whether to skip the AI analysis
+    :param memory_token_limit: Approximate token ceiling of the chat memory
+    :param select_tests: Whether to only run the tests reaching the profiled functions
+    :param changed_since: Optional git revision, the tests reaching the functions changed since are run too
+    :param repeat: Number of profiling passes aggregated into median line stats
+    :param warmup: Number of discarded passes run before the repeated ones
+    :param jobs: Number of repeated passes running at once, half the CPUs if not provided
+    :param gc_stats: Whether to record the garbage collector pauses
+    :param gc_threshold: Optional GC thresholds a second pass is compared with
+    :param gc_freeze: Whether a second pass freezes the objects alive after the test collection
+    :param leak_check: Whether to check the memory growth across repeated iterations of every test
+    :param leak_iterations: Number of measured iterations of the memory growth check
+    :param leak_warmup: Number of iterations run before the measured ones
+    :param leak_threshold: Optional growth per iteration, e.g. 10KiB, over which the run fails
+    :param marked_only: Whether to only run the tests marked as profiled
+    :param entry_point: Tuple of functions the profiled calls must be made under
+    :param timings: Whether to print the per-stage trace of the run
+    :param timings_file: Optional path the per-stage trace is written to as JSON
     :return: None
     """
+    stage_timer = start_stage_timer()
+    if not no_llm and not config:
+        click.echo("Error: --config is required unless --no-llm is used")
+        sys.exit(1)
+    check_fallback_models(fallback_model)
+    if gc_threshold:
+        try:
+            parse_gc_threshold(gc_threshold)
+        except ValueError as e:
+            click.echo(f"Error: {e}")
+            sys.exit(1)
+    try:
+        leak_threshold_bytes = parse_memory_size(leak_threshold) if leak_threshold else None
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
     # Load the config file
-    load_dotenv(config)
+    if config:
+        load_dotenv(config)
+    export_budgets(pyproject)
     # Update the plugin's configuration
     os.environ[PROFILE_MODULES] = ','.join(module)
     os.environ[PROFILE_FUNCTIONS] = ','.join(function)
+    os.environ[PROFILE_SUBPROCESSES] = "1" if profile_subprocesses else ""
+    os.environ[PROFILE_THREADS] = "1" if thread_breakdown else ""
+    os.environ[PROFILE_TIMER] = timer
+    # The tuned GC settings only apply to the comparison pass
+    os.environ[PROFILE_GC] = "1" if gc_stats or gc_threshold or gc_freeze else ""
+    os.environ[PROFILE_GC_THRESHOLD] = ""
+    os.environ[PROFILE_GC_FREEZE] = ""
+    os.environ[PROFILE_LEAK_ITERATIONS] = str(leak_iterations) if leak_check or leak_threshold else ""
+    os.environ[PROFILE_LEAK_WARMUP] = str(leak_warmup)
+    os.environ[PROFILE_LEAK_THRESHOLD] = "" if leak_threshold_bytes is None else str(leak_threshold_bytes)
+    os.environ[PROFILE_ENTRY_POINTS] = ','.join(entry_point)
 
     # Infer test path if not provided
     if not test_path:
@@ -79,6 +223,20 @@ def profile(config: str, module: tuple[str, ...], function: tuple[str, ...],
         test_module = infer_test_module(test_path=test_path)
         click.echo(f"Test module is {test_module}")
 
+    test_args = [test_path]
+    if select_tests or changed_since:
+        with stage_timer.stage(StageConst.TEST_SELECTION):
+            try:
+                test_args = select_profiled_tests(test_path, list(module), list(function), root=Path.cwd(),
+                                                  changed_since=changed_since)
+            except RuntimeError as e:
+                click.echo(f"Error: {e}")
+                sys.exit(1)
+        if not test_args:
+            click.echo(f"Error: No test in {test_path} runs the profiled functions")
+            sys.exit(1)
+        click.echo(f"Selected tests: {' '.join(test_args)}")
+
     # Handle python test files
     if test_path.endswith('.py'):
         test_path = "/".join(test_path[:-3].split("/")[:-1])
@@ -98,41 +256,598 @@ def profile(config: str, module: tuple[str, ...], function: tuple[str, ...],
             sys.executable,  # Use the current Python interpreter
             '-m', 'pytest',  # Run pytest as a module
             '-p', module_name,  # Enable the plugin
-            test_path,  # Specify the test path
+            *test_args,  # Specify the test path, or the selected tests
             '-v',  # Verbose output
             '--memray',
             '--most-allocations=20',
             '--stacks=10'
         ]
+        if marked_only:
+            # The unmarked tests are deselected rather than run unprofiled
+            cmd += ['-m', PROFILE_MARKER]
 
-        # Run the process and display output in real-time while also capturing it
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1  # Line buffered
-        )
-
-        memray_output = display_process_output(process=process)
-
-        # Wait for process to complete
-        process.wait()
+        if repeat > 1 or warmup:
+            # Independent passes in parallel processes, aggregated into median stats and robust hotspots
+            jobs = jobs or default_jobs(repeat)
+            click.echo(f"Running {warmup} warmup and {repeat} measured profiling passes, {jobs} at a time")
+            with stage_timer.stage(StageConst.PYTEST_RUN):
+                returncode, memray_output, run_dirs = run_repeated_pytest(cmd, DEFAULT_OUTPUT_DIR, repeat,
+                                                                          warmup=warmup, jobs=jobs)
+            with stage_timer.stage(StageConst.STATS_AGGREGATION):
+                repeat_report = combine_repeated_runs(run_dirs, DEFAULT_OUTPUT_DIR)
+            if repeat_report:
+                click.echo(f"\n{repeat_report}")
+        else:
+            # Run the process and display output in real-time while also capturing it
+            with stage_timer.stage(StageConst.PYTEST_RUN):
+                returncode, memray_output = run_pytest(cmd)
+        budget_results = load_budget_results(DEFAULT_OUTPUT_DIR)
+        over_budget = budgets_exceeded(returncode, budget_results)
+        leak_results = load_leak_results(DEFAULT_OUTPUT_DIR)
+        leaking = budgets_exceeded(returncode, leak_results)
 
-        if process.returncode == 0:
+        if returncode == 0 or over_budget or leaking:
             click.echo(f"\n Line profiling results saved to {DEFAULT_OUTPUT_DIR}")
         else:
-            click.echo(f"Tests failed with exit code {process.returncode}")
-            sys.exit(process.returncode)
+            click.echo(f"Tests failed with exit code {returncode}")
+            sys.exit(returncode)
+        if gc_threshold or gc_freeze:
+            click.echo("\nRunning a second profiling pass with the tuned GC settings")
+            tuned_dir = os.path.join(DEFAULT_OUTPUT_DIR, GC_TUNED_DIR)
+            with stage_timer.stage(StageConst.GC_TUNED_RUN):
+                run_pytest_pass(cmd, tuned_dir, {PROFILE_GC_THRESHOLD: gc_threshold or "",
+                                                 PROFILE_GC_FREEZE: "1" if gc_freeze else ""})
+                gc_comparison = compare_gc_runs(DEFAULT_OUTPUT_DIR, tuned_dir)
+            click.echo(f"\n{gc_comparison or 'The GC pauses of the tuned pass were not recorded'}")
+        if no_llm:
+            click.echo(f"\n{load_line_table(DEFAULT_OUTPUT_DIR) or ''}")
+            click.echo(f"\n{load_antipattern_report(DEFAULT_OUTPUT_DIR) or ''}")
+            report_gates(budget_results, over_budget, leak_results, leaking)
+            return
         # Send the results to anthropic
-        with open(DEFAULT_OUTPUT_DIR + f"/{LINE_STATS_FILE}") as f:
-            results_data = f.read()
-        llm = initiate_model(model=model_name, model_provider=model_provider, base_url=model_base_url)
+        with stage_timer.stage(StageConst.STATS_LOADING):
+            with open(DEFAULT_OUTPUT_DIR + f"/{LINE_STATS_FILE}") as f:
+                results_data = f.read()
+            additional_stats = load_additional_stats(DEFAULT_OUTPUT_DIR)
+            run_metadata = load_run_metadata(DEFAULT_OUTPUT_DIR)
+            cpu_profiler_stats = load_cpu_line_stats(DEFAULT_OUTPUT_DIR)
+            line_memory = load_line_memory(DEFAULT_OUTPUT_DIR)
+        llm = initiate_router(model=model_name, model_provider=model_provider, base_url=model_base_url,
+                              fallback_models=fallback_model, race=race, request_timeout=request_timeout,
+                              max_retries=max_retries)
         click.echo("\n Lets ask the AI what is going on under the hood..")
 
-        asyncio.run(run_agent_session(profiler_stats=results_data, memray_stats=memray_output, llm=llm))
+        asyncio.run(run_agent_session(profiler_stats=results_data, memray_stats=memray_output, llm=llm,
+                                      additional_stats=additional_stats, timer=run_metadata["timer"],
+                                      cpu_profiler_stats=cpu_profiler_stats,
+                                      memory_token_limit=memory_token_limit, stage_timer=stage_timer,
+                                      line_memory=line_memory))
+        click.echo(f"\n{format_latency_report(llm.latencies)}")
+        report_gates(budget_results, over_budget, leak_results, leaking)
     except Exception as e:
         click.echo(f"Sorry mate: {e}")
     finally:
         os.unlink(target_path)
         shutil.rmtree(os.environ.get(f'{PROFILE_OUTPUT_DIR}'))
+        report_timings(stage_timer, timings, timings_file)
+
+
+@cli.command(name="batch")
+@click.option('--config', '-c', help='Path to config file with the model API keys, not needed with --no-llm')
+@click.option('--pyproject', '-pp', help='Path to the pyproject.toml declaring the targets (auto detect)')
+@click.option('--target', '-tg', multiple=True,
+              help='Name of a target to run (can be used multiple times, default all)')
+@click.option('--report', '-r', default=DEFAULT_BATCH_REPORT_FILE, help='Path of the combined report')
+@click.option('--no-llm', is_flag=True, default=False, help='Only write the combined report, skip the AI analysis')
+@click.option('--timings', is_flag=True, default=False,
+              help='Print how long each stage of the run took (startup, pytest, stats, agent, PR) and the peak RSS')
+@click.option('--timings-file', help='Also write the per-stage trace as JSON to this file')
+@click.option('--memory-token-limit', '-mtl', type=int, default=DEFAULT_MEMORY_TOKEN_LIMIT,
+              help='Approximate token ceiling of the chat memory, older turns are summarized to stay under it')
+@click.option('--model-provider', '-mp', type=click.Choice(get_model_providers_names()),
+              help="Name of the model provider e.g. anthropic", default=ModelProviderConst.ANTHROPIC)
+@click.option('--model-name', '-mn', help='Name of the LLM model e.g. claude-3-5-sonnet-20240620',
+              default='claude-3-5-sonnet-20240620', )
+@click.option('--model-base-url', '-mbu', default=None)
+@click.option('--fallback-model', '-fm', multiple=True,
+              help='Model asked when the main one fails, provider:model or provider:model@base_url e.g. '
+                   'ollama:llama3@http://localhost:11434 (can be used multiple times, in fallback order)')
+@click.option('--race', is_flag=True, default=False,
+              help='Ask the main and the fallback models at once and keep the first answer')
+@click.option('--request-timeout', type=click.FloatRange(min=0, min_open=True),
+              help='Seconds a model may take to answer before it is retried or the next model is asked')
+@click.option('--max-retries', type=click.IntRange(min=0), default=DEFAULT_MODEL_MAX_RETRIES,
+              help='Retries with exponential backoff of every model before the next one is asked')
+@click.option('--profile-subprocesses', '-ps', is_flag=True, default=False,
+              help='Also profile the functions in child Python processes and merge their stats')
+@click.option('--timer', '-t', type=click.Choice([TimerConst.WALL, TimerConst.CPU, TimerConst.BOTH]),
+              default=TimerConst.WALL,
+              help='Measure lines with wall-clock time, per-thread CPU time or both (cpu and both use a slower tracer)')
+def batch(config: str | None = None, pyproject: str | None = None, target: tuple[str, ...] = (),
+          report: str = DEFAULT_BATCH_REPORT_FILE, no_llm: bool = False,
+          memory_token_limit: int = DEFAULT_MEMORY_TOKEN_LIMIT,
+          model_name: str = "", model_provider: str | ModelProviderConst = "",
+          model_base_url: str | None = None, fallback_model: tuple[str, ...] = (), race: bool = False,
+          request_timeout: float | None = None, max_retries: int = DEFAULT_MODEL_MAX_RETRIES,
+          profile_subprocesses: bool = False, timer: str = TimerConst.WALL, timings: bool = False,
+          timings_file: str | None = None) -> None:
+    """
+    Profile every target declared in the [tool.profiling-cli] table of pyproject.toml in one pytest session.
+
+    Tests are collected and modules imported once for all targets, each target only records the stats of its
+    own functions while its own tests run. The results are written to a single combined report and analyzed
+    in a single AI session.
+
+    :param config: Optional path to configuration file containing required API keys
+    :param pyproject: Optional path to the pyproject.toml declaring the targets
+    :param target: Names of the targets to run, all targets if empty
+    :param report: Path of the combined report
+    :param no_llm: Whether to skip the AI analysis
+    :param memory_token_limit: Approximate token ceiling of the chat memory
+    :param model_name: Optional name of the model e.g. claude-3
+    :param model_provider: Optional name of the model provider e.g. anthropic
+    :param model_base_url: Optional URL of the model provider instance
+    :param fallback_model: Tuple of models asked when the main one fails, provider:model[@base_url]
+    :param race: Whether to ask all the models at once and keep the first answer
+    :param request_timeout: Optional seconds a model may take to answer
+    :param max_retries: Number of retries of every model before the next one is asked
+    :param profile_subprocesses: Whether to propagate profiling into child Python processes
+    :param timer: Line timer, wall, cpu or both
+    :param timings: Whether to print the per-stage trace of the run
+    :param timings_file: Optional path the per-stage trace is written to as JSON
+    :return: None
+    """
+    stage_timer = start_stage_timer()
+    if not no_llm and not config:
+        click.echo("Error: --config is required unless --no-llm is used")
+        sys.exit(1)
+    check_fallback_models(fallback_model)
+    if config:
+        load_dotenv(config)
+
+    pyproject_path = Path(pyproject) if pyproject else find_pyproject()
+    if pyproject_path is None or not pyproject_path.is_file():
+        click.echo("Error: Could not find pyproject.toml. Please specify with --pyproject")
+        sys.exit(1)
+    try:
+        targets = load_profiling_targets(load_project_config(pyproject_path), base_dir=pyproject_path.parent,
+                                         names=target)
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    click.echo(f"Profiling targets: {', '.join(t['name'] for t in targets)}")
+    export_budgets(str(pyproject_path))
+
+    # Update the plugin's configuration
+    os.environ[PROFILE_TARGETS] = json.dumps(targets)
+    os.environ[PROFILE_SUBPROCESSES] = "1" if profile_subprocesses else ""
+    os.environ[PROFILE_TIMER] = timer
+
+    # One pytest session over the tests of every target, the installed plugin is loaded by module name
+    test_paths = list(dict.fromkeys(test for t in targets for test in t['tests']))
+    cmd = [sys.executable, '-m', 'pytest', '-p', LINE_PROFILING_PLUGIN_MODULE, *test_paths, '-v',
+           '--memray', '--most-allocations=20', '--stacks=10']
+
+    try:
+        with stage_timer.stage(StageConst.PYTEST_RUN):
+            returncode, memray_output = run_pytest(cmd)
+        budget_results = load_budget_results(DEFAULT_OUTPUT_DIR)
+        over_budget = budgets_exceeded(returncode, budget_results)
+        if returncode != 0 and not over_budget:
+            click.echo(f"Tests failed with exit code {returncode}")
+            sys.exit(returncode)
+
+        with stage_timer.stage(StageConst.STATS_LOADING):
+            batch_report = build_batch_report(targets, DEFAULT_OUTPUT_DIR, memray_output)
+            with open(report, 'w') as f:
+                f.write(batch_report)
+        click.echo(f"\n Combined profiling report saved to {report}")
+        if no_llm:
+            report_gates(budget_results, over_budget)
+            return
+
+        with stage_timer.stage(StageConst.STATS_LOADING):
+            with open(DEFAULT_OUTPUT_DIR + f"/{LINE_STATS_FILE}") as f:
+                results_data = f.read()
+            additional_stats = {"PER-TARGET PROFILING REPORT": batch_report}
+            run_metadata = load_run_metadata(DEFAULT_OUTPUT_DIR)
+            cpu_profiler_stats = load_cpu_line_stats(DEFAULT_OUTPUT_DIR)
+            line_memory = load_line_memory(DEFAULT_OUTPUT_DIR)
+        llm = initiate_router(model=model_name, model_provider=model_provider, base_url=model_base_url,
+                              fallback_models=fallback_model, race=race, request_timeout=request_timeout,
+                              max_retries=max_retries)
+        click.echo("\n Lets ask the AI what is going on under the hood..")
+
+        asyncio.run(run_agent_session(profiler_stats=results_data, memray_stats=memray_output, llm=llm,
+                                      additional_stats=additional_stats, timer=run_metadata["timer"],
+                                      cpu_profiler_stats=cpu_profiler_stats,
+                                      memory_token_limit=memory_token_limit, stage_timer=stage_timer,
+                                      line_memory=line_memory))
+        click.echo(f"\n{format_latency_report(llm.latencies)}")
+        report_gates(budget_results, over_budget)
+    finally:
+        shutil.rmtree(os.environ.get(f'{PROFILE_OUTPUT_DIR}'), ignore_errors=True)
+        report_timings(stage_timer, timings, timings_file)
+
+
+@cli.command(name="startup")
+@click.argument('target')
+@click.option('--config', '-c', help='Path to config file with the model API keys, not needed with --no-llm')
+@click.option('--repeat', type=click.IntRange(min=1), default=5,
+              help='Number of fresh interpreters the import is measured in')
+@click.option('--top', type=click.IntRange(min=1), default=15, help='Number of slowest modules reported')
+@click.option('--profile-top', type=click.IntRange(min=0), default=3,
+              help='Line profile the module-level statements of this many of the slowest project modules')
+@click.option('--module', '-m', multiple=True,
+              help='Also line profile the module-level statements of this module (can be used multiple times)')
+@click.option('--baseline', '-b', help='Baseline file to compare the import times with')
+@click.option('--save-baseline', help='Save the import times to this file, to compare later runs with')
+@click.option('--no-llm', is_flag=True, default=False, help='Only print the import time report, skip the AI analysis')
+@click.option('--timings', is_flag=True, default=False,
+              help='Print how long each stage of the run took (startup, imports, agent, PR) and the peak RSS')
+@click.option('--timings-file', help='Also write the per-stage trace as JSON to this file')
+@click.option('--memory-token-limit', '-mtl', type=int, default=DEFAULT_MEMORY_TOKEN_LIMIT,
+              help='Approximate token ceiling of the chat memory, older turns are summarized to stay under it')
+@click.option('--model-provider', '-mp', type=click.Choice(get_model_providers_names()),
+              help="Name of the model provider e.g. anthropic", default=ModelProviderConst.ANTHROPIC)
+@click.option('--model-name', '-mn', help='Name of the LLM model e.g. claude-3-5-sonnet-20240620',
+              default='claude-3-5-sonnet-20240620', )
+@click.option('--model-base-url', '-mbu', default=None)
+@click.option('--fallback-model', '-fm', multiple=True,
+              help='Model asked when the main one fails, provider:model or provider:model@base_url e.g. '
+                   'ollama:llama3@http://localhost:11434 (can be used multiple times, in fallback order)')
+@click.option('--race', is_flag=True, default=False,
+              help='Ask the main and the fallback models at once and keep the first answer')
+@click.option('--request-timeout', type=click.FloatRange(min=0, min_open=True),
+              help='Seconds a model may take to answer before it is retried or the next model is asked')
+@click.option('--max-retries', type=click.IntRange(min=0), default=DEFAULT_MODEL_MAX_RETRIES,
+              help='Retries with exponential backoff of every model before the next one is asked')
+def startup(target: str, config: str | None = None, repeat: int = 5, top: int = 15, profile_top: int = 3,
+            module: tuple[str, ...] = (), baseline: str | None = None, save_baseline: str | None = None,
+            no_llm: bool = False, memory_token_limit: int = DEFAULT_MEMORY_TOKEN_LIMIT,
+            model_name: str = "", model_provider: str | ModelProviderConst = "",
+            model_base_url: str | None = None, fallback_model: tuple[str, ...] = (), race: bool = False,
+            request_timeout: float | None = None, max_retries: int = DEFAULT_MODEL_MAX_RETRIES,
+            timings: bool = False, timings_file: str | None = None) -> None:
+    """
+    Profile the import time of a module, the cold start of a CLI or a serverless function.
+
+    The module is imported in fresh interpreters with -X importtime, the median import tree shows the slowest
+    modules. The module-level statements of the slowest project modules are then line profiled while they are
+    imported, and the results are analyzed in the AI session like line stats.
+
+    :param target: Module, entry point (module:function) or console script whose import is measured
+    :param config: Optional path to configuration file containing required API keys
+    :param repeat: Number of fresh interpreters the import is measured in
+    :param top: Number of slowest modules reported
+    :param profile_top: Number of slowest project modules whose module-level statements are line profiled
+    :param module: Modules whose module-level statements are line profiled too
+    :param baseline: Optional baseline file to compare the import times with
+    :param save_baseline: Optional file the import times are saved to
+    :param no_llm: Whether to skip the AI analysis
+    :param memory_token_limit: Approximate token ceiling of the chat memory
+    :param model_name: Optional name of the model e.g. claude-3
+    :param model_provider: Optional name of the model provider e.g. anthropic
+    :param model_base_url: Optional URL of the model provider instance
+    :param fallback_model: Tuple of models asked when the main one fails, provider:model[@base_url]
+    :param race: Whether to ask all the models at once and keep the first answer
+    :param request_timeout: Optional seconds a model may take to answer
+    :param max_retries: Number of retries of every model before the next one is asked
+    :param timings: Whether to print the per-stage trace of the run
+    :param timings_file: Optional path the per-stage trace is written to as JSON
+    :return: None
+    """
+    stage_timer = start_stage_timer()
+    if not no_llm and not config:
+        click.echo("Error: --config is required unless --no-llm is used")
+        sys.exit(1)
+    check_fallback_models(fallback_model)
+    if config:
+        load_dotenv(config)
+    if baseline and not os.path.isfile(baseline):
+        click.echo(f"Error: Baseline file {baseline} not found")
+        sys.exit(1)
+
+    module_name = resolve_startup_target(target)
+    click.echo(f"Measuring the import of {module_name} in {repeat} fresh interpreters")
+    os.makedirs(DEFAULT_OUTPUT_DIR, exist_ok=True)
+    try:
+        with stage_timer.stage(StageConst.IMPORT_PROFILING):
+            try:
+                aggregate = aggregate_import_runs(run_import_passes(module_name, repeat))
+            except RuntimeError as e:
+                click.echo(f"Error: {e}")
+                sys.exit(1)
+
+        # The slowest modules of the project are line profiled along with the requested ones
+        profiled_modules = list(dict.fromkeys(list(module) + slowest_modules(aggregate, profile_top,
+                                                                             root=str(Path.cwd()))))
+        module_stats = None
+        if profiled_modules:
+            click.echo(f"Line profiling the module-level statements of {', '.join(profiled_modules)}")
+            with stage_timer.stage(StageConst.MODULE_PROFILING):
+                stats_list = [profile_module_execution(name, os.path.join(DEFAULT_OUTPUT_DIR,
+                                                                          f"{name}_{LINE_STATS_RAW_FILE}"))
+                              for name in profiled_modules]
+                stats_list = [stats for stats in stats_list if stats is not None]
+                module_stats = merge_line_stats(stats_list) if stats_list else None
+
+        report = format_startup_report(module_name, aggregate, top,
+                                       find_heavy_statements(module_stats) if module_stats else None)
+        if baseline:
+            report += f"\n\n{format_baseline_diff(aggregate, load_startup_baseline(baseline), top)}"
+        if save_baseline:
+            save_startup_baseline(aggregate, save_baseline)
+            click.echo(f"Import times saved to {save_baseline}")
+        with open(os.path.join(DEFAULT_OUTPUT_DIR, STARTUP_STATS_FILE), 'w') as f:
+            f.write(report)
+        click.echo(f"\n{report}")
+        if no_llm:
+            return
+
+        with stage_timer.stage(StageConst.STATS_LOADING):
+            results_data = format_module_line_stats(module_stats) if module_stats else ""
+            additional_stats = load_additional_stats(DEFAULT_OUTPUT_DIR)
+        llm = initiate_router(model=model_name, model_provider=model_provider, base_url=model_base_url,
+                              fallback_models=fallback_model, race=race, request_timeout=request_timeout,
+                              max_retries=max_retries)
+        click.echo("\n Lets ask the AI what is going on under the hood..")
+
+        asyncio.run(run_agent_session(profiler_stats=results_data, memray_stats="", llm=llm,
+                                      additional_stats=additional_stats, memory_token_limit=memory_token_limit,
+                                      stage_timer=stage_timer))
+        click.echo(f"\n{format_latency_report(llm.latencies)}")
+    finally:
+        shutil.rmtree(os.environ.get(f'{PROFILE_OUTPUT_DIR}'), ignore_errors=True)
+        report_timings(stage_timer, timings, timings_file)
+
+
+@cli.command(name="run", context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False})
+@click.argument('program', nargs=-1, required=True, type=click.UNPROCESSED)
+@click.option('--config', '-c', help='Path to config file with the model API keys, not needed with --no-llm')
+@click.option('--module', '-m', multiple=True, help='Module to profile (can be used multiple times)')
+@click.option('--function', '-f', multiple=True, help='Function to profile (can be used multiple times)')
+@click.option('--no-memory', is_flag=True, default=False, help='Do not track the memory of the program with memray')
+@click.option('--profile-subprocesses', '-ps', is_flag=True, default=False,
+              help='Also profile the functions in child Python processes and merge their stats')
+@click.option('--thread-breakdown', '-tb', is_flag=True, default=False,
+              help='Report per-thread line stats with CPU vs wall time and GIL contention (slower tracer, before '
+                   'Python 3.12 threads already running when profiling starts are not traced)')
+@click.option('--timer', '-t', type=click.Choice([TimerConst.WALL, TimerConst.CPU, TimerConst.BOTH]),
+              default=TimerConst.WALL,
+              help='Measure lines with wall-clock time, per-thread CPU time or both (cpu and both use a slower tracer)')
+@click.option('--no-llm', is_flag=True, default=False, help='Only save the profiling results, skip the AI analysis')
+@click.option('--timings', is_flag=True, default=False,
+              help='Print how long each stage of the run took (startup, program, stats, agent, PR) and the peak RSS')
+@click.option('--timings-file', help='Also write the per-stage trace as JSON to this file')
+@click.option('--memory-token-limit', '-mtl', type=int, default=DEFAULT_MEMORY_TOKEN_LIMIT,
+              help='Approximate token ceiling of the chat memory, older turns are summarized to stay under it')
+@click.option('--model-provider', '-mp', type=click.Choice(get_model_providers_names()),
+              help="Name of the model provider e.g. anthropic", default=ModelProviderConst.ANTHROPIC)
+@click.option('--model-name', '-mn', help='Name of the LLM model e.g. claude-3-5-sonnet-20240620',
+              default='claude-3-5-sonnet-20240620', )
+@click.option('--model-base-url', '-mbu', default=None)
+@click.option('--fallback-model', '-fm', multiple=True,
+              help='Model asked when the main one fails, provider:model or provider:model@base_url e.g. '
+                   'ollama:llama3@http://localhost:11434 (can be used multiple times, in fallback order)')
+@click.option('--race', is_flag=True, default=False,
+              help='Ask the main and the fallback models at once and keep the first answer')
+@click.option('--request-timeout', type=click.FloatRange(min=0, min_open=True),
+              help='Seconds a model may take to answer before it is retried or the next model is asked')
+@click.option('--max-retries', type=click.IntRange(min=0), default=DEFAULT_MODEL_MAX_RETRIES,
+              help='Retries with exponential backoff of every model before the next one is asked')
+def run(program: tuple[str, ...], config: str | None = None, module: tuple[str, ...] = (),
+        function: tuple[str, ...] = (), no_memory: bool = False, profile_subprocesses: bool = False,
+        thread_breakdown: bool = False, timer: str = TimerConst.WALL, no_llm: bool = False,
+        memory_token_limit: int = DEFAULT_MEMORY_TOKEN_LIMIT, model_name: str = "",
+        model_provider: str | ModelProviderConst = "", model_base_url: str | None = None,
+        fallback_model: tuple[str, ...] = (), race: bool = False, request_timeout: float | None = None,
+        max_retries: int = DEFAULT_MODEL_MAX_RETRIES, timings: bool = False, timings_file: str | None = None) -> None:
+    """
+    Profile a program instead of tests, e.g. profiling-cli run -m mypkg.job -- python -m mypkg.job args.
+
+    The program runs in the same way as with the python command, with the given functions line profiled and its
+    memory tracked. Its results are saved when it ends, is interrupted (Ctrl+C) or terminated, and are analyzed in
+    the AI session like the results of the tests.
+
+    :param program: python -m module, python -c code or python script.py, a script, a console script or an entry
+                    point (package.module:function), followed by the arguments of the program
+    :param config: Optional path to configuration file containing required API keys
+    :param module: Tuple of module names to profile
+    :param function: Tuple of function names to profile
+    :param no_memory: Whether to skip the memory tracking
+    :param profile_subprocesses: Whether to propagate profiling into child Python processes
+    :param thread_breakdown: Whether to trace each thread separately with CPU and wall clocks
+    :param timer: Line timer, wall, cpu or both
+    :param no_llm: Whether to skip the AI analysis
+    :param memory_token_limit: Approximate token ceiling of the chat memory
+    :param model_name: Optional name of the model e.g. claude-3
+    :param model_provider: Optional name of the model provider e.g. anthropic
+    :param model_base_url: Optional URL of the model provider instance
+    :param fallback_model: Tuple of models asked when the main one fails, provider:model[@base_url]
+    :param race: Whether to ask all the models at once and keep the first answer
+    :param request_timeout: Optional seconds a model may take to answer
+    :param max_retries: Number of retries of every model before the next one is asked
+    :param timings: Whether to print the per-stage trace of the run
+    :param timings_file: Optional path the per-stage trace is written to as JSON
+    :return: None
+    """
+    stage_timer = start_stage_timer()
+    if not no_llm and not config:
+        click.echo("Error: --config is required unless --no-llm is used")
+        sys.exit(1)
+    check_fallback_models(fallback_model)
+    try:
+        parse_program(list(program))
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        sys.exit(1)
+    if config:
+        load_dotenv(config)
+    # Update the runner's configuration
+    os.environ[PROFILE_MODULES] = ','.join(module)
+    os.environ[PROFILE_FUNCTIONS] = ','.join(function)
+    os.environ[PROFILE_SUBPROCESSES] = "1" if profile_subprocesses else ""
+    os.environ[PROFILE_THREADS] = "1" if thread_breakdown else ""
+    os.environ[PROFILE_TIMER] = timer
+    os.environ[PROFILE_MEMORY] = "" if no_memory else "1"
+
+    try:
+        with stage_timer.stage(StageConst.PROGRAM_RUN):
+            returncode = run_profiled_program([sys.executable, '-c', RUN_DRIVER_SOURCE, *program])
+        if not os.path.exists(os.path.join(DEFAULT_OUTPUT_DIR, LINE_STATS_FILE)):
+            click.echo(f"Error: The program exited with code {returncode} without saving its profiling results")
+            sys.exit(returncode or 1)
+        if returncode:
+            click.echo(f"\n Program exited with code {returncode}, analyzing the results it saved")
+        click.echo(f"\n Line profiling results saved to {DEFAULT_OUTPUT_DIR}")
+        if no_llm:
+            click.echo(f"\n{load_line_table(DEFAULT_OUTPUT_DIR) or ''}")
+            click.echo(f"\n{load_antipattern_report(DEFAULT_OUTPUT_DIR) or ''}")
+            sys.exit(returncode)
+
+        with stage_timer.stage(StageConst.STATS_LOADING):
+            with open(DEFAULT_OUTPUT_DIR + f"/{LINE_STATS_FILE}") as f:
+                results_data = f.read()
+            memray_output = load_memory_report(DEFAULT_OUTPUT_DIR)
+            additional_stats = load_additional_stats(DEFAULT_OUTPUT_DIR)
+            run_metadata = load_run_metadata(DEFAULT_OUTPUT_DIR)
+            cpu_profiler_stats = load_cpu_line_stats(DEFAULT_OUTPUT_DIR)
+            line_memory = load_line_memory(DEFAULT_OUTPUT_DIR)
+        llm = initiate_router(model=model_name, model_provider=model_provider, base_url=model_base_url,
+                              fallback_models=fallback_model, race=race, request_timeout=request_timeout,
+                              max_retries=max_retries)
+        click.echo("\n Lets ask the AI what is going on under the hood..")
+
+        asyncio.run(run_agent_session(profiler_stats=results_data, memray_stats=memray_output, llm=llm,
+                                      additional_stats=additional_stats, timer=run_metadata["timer"],
+                                      cpu_profiler_stats=cpu_profiler_stats,
+                                      memory_token_limit=memory_token_limit, stage_timer=stage_timer,
+                                      line_memory=line_memory))
+        click.echo(f"\n{format_latency_report(llm.latencies)}")
+        sys.exit(returncode)
+    finally:
+        shutil.rmtree(os.environ.get(f'{PROFILE_OUTPUT_DIR}'), ignore_errors=True)
+        report_timings(stage_timer, timings, timings_file)
+
+
+@cli.command(name="watch")
+@click.option('--module', '-m', multiple=True, help='Module to profile (can be used multiple times)')
+@click.option('--function', '-f', multiple=True, help='Function to profile (can be used multiple times)')
+@click.option('--test-path', '-tp', help='Path to test directory or file (auto detect)')
+@click.option('--interval', type=click.FloatRange(min=0.05), default=DEFAULT_WATCH_INTERVAL,
+              help='Seconds between two checks of the watched files')
+def watch(module: tuple[str, ...], function: tuple[str, ...], test_path: str | None = None,
+          interval: float = DEFAULT_WATCH_INTERVAL) -> None:
+    """
+    Profile the tests, then profile them again on every saved change, in a warm pytest process.
+
+    The process keeps the project imported and the tests collected. On every save the changed modules are
+    reloaded in place, only the tests that ran the changed code run again and the time of the profiled functions
+    before and after the change is printed, line by line for the edited ones.
+
+    :param module: Tuple of module names to profile
+    :param function: Tuple of function names to profile
+    :param test_path: Optional path to test directory or file
+    :param interval: Seconds between two checks of the watched files
+    :return: None
+    """
+    if not test_path:
+        tests_dir = find_tests_directory(start_path=Path.cwd())
+        if not tests_dir:
+            click.echo("Error: Could not find tests directory. Please specify with --test-path")
+            sys.exit(1)
+        test_path = str(tests_dir)
+    os.environ[PROFILE_MODULES] = ','.join(module)
+    os.environ[PROFILE_FUNCTIONS] = ','.join(function)
+    os.environ[PROFILE_WATCH_INTERVAL] = str(interval)
+    cmd = [sys.executable, '-m', 'pytest', '-p', WATCH_PLUGIN_MODULE, test_path, '-v']
+    process = subprocess.Popen(cmd)
+    try:
+        process.wait()
+    except KeyboardInterrupt:
+        # The worker got the interrupt too and stops watching
+        process.wait()
+
+
+def export_budgets(pyproject: str | None) -> None:
+    """
+    Load the performance budgets of the project config into the plugin's configuration.
+
+    :param pyproject: Path to the pyproject.toml, auto detected from the current directory if not provided
+    :return: None
+    """
+    pyproject_path = Path(pyproject) if pyproject else find_pyproject()
+    if pyproject_path is None:
+        os.environ[PROFILE_BUDGETS] = ""
+        return
+    try:
+        os.environ[PROFILE_BUDGETS] = json.dumps(load_budgets(load_project_config(pyproject_path),
+                                                              base_dir=pyproject_path.parent))
+    except (OSError, ValueError) as e:
+        click.echo(f"Error: Invalid performance budgets in {pyproject_path}: {e}")
+        sys.exit(1)
+
+
+def report_gates(budget_results: dict | None, over_budget: bool, leak_results: dict | None = None,
+                 leaking: bool = False) -> None:
+    """
+    Print the performance budgets diff, then fail the command when a budget was exceeded or a test retained more
+    memory per iteration than the threshold. Both failures are reported before exiting.
+
+    :param budget_results: Results as returned by load_budget_results
+    :param over_budget: Whether the tests passed but a budget was exceeded
+    :param leak_results: Results as returned by load_leak_results
+    :param leaking: Whether the tests passed but a test grew over the threshold
+    :return: None
+    """
+    if budget_results:
+        click.echo(f"\n{format_budget_report(budget_results['results'])}")
+    if over_budget:
+        click.echo("Error: Performance budgets exceeded")
+    if leaking:
+        click.echo(f"Error: {leak_results['exceeded']} tests retain more than "
+                   f"{format_bytes(leak_results['threshold'])} per iteration")
+    if over_budget or leaking:
+        sys.exit(1)
+
+
+def check_fallback_models(fallback_models: tuple[str, ...]) -> None:
+    """
+    Fail the command before the profiling run when a fallback model is malformed.
+
+    :param fallback_models: Models as given with --fallback-model
+    :return: None
+    """
+    for spec in fallback_models:
+        try:
+            parse_model_spec(spec)
+        except ValueError as e:
+            click.echo(f"Error: {e}")
+            sys.exit(1)
+
+
+def start_stage_timer() -> StageTimer:
+    """
+    Start the per-stage trace of a command, its startup stage covers the imports since the package was loaded.
+
+    :return: The trace
+    """
+    stage_timer = StageTimer(start=IMPORT_TIME)
+    stage_timer.record(StageConst.STARTUP, stage_timer.since_start())
+    return stage_timer
+
+
+def report_timings(stage_timer: StageTimer, timings: bool, timings_file: str | None) -> None:
+    """
+    Print and save the per-stage trace of the run, when requested.
+
+    :param stage_timer: The trace of the run
+    :param timings: Whether to print the trace
+    :param timings_file: Optional path the trace is written to as JSON
+    :return: None
+    """
+    if timings:
+        click.echo(f"\n{stage_timer.format()}")
+    if timings_file:
+        stage_timer.write_json(timings_file)
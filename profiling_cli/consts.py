@@ -1,11 +1,155 @@
 PROFILE_OUTPUT_DIR = "PROFILE_OUTPUT_DIR"
 PROFILE_FUNCTIONS = "PROFILE_FUNCTIONS"
 PROFILE_MODULES = "PROFILE_MODULES"
+PROFILE_SUBPROCESSES = "PROFILE_SUBPROCESSES"
+PROFILE_THREADS = "PROFILE_THREADS"
+PROFILE_TIMER = "PROFILE_TIMER"
+PROFILE_TARGETS = "PROFILE_TARGETS"
+PROFILE_BUDGETS = "PROFILE_BUDGETS"
+PROFILE_MCP_SERVER_COMMAND = "PROFILE_MCP_SERVER_COMMAND"
+PROFILE_TEST_MAP_FILE = "PROFILE_TEST_MAP_FILE"
+PROFILE_GC = "PROFILE_GC"
+PROFILE_GC_THRESHOLD = "PROFILE_GC_THRESHOLD"
+PROFILE_GC_FREEZE = "PROFILE_GC_FREEZE"
+PROFILE_LEAK_ITERATIONS = "PROFILE_LEAK_ITERATIONS"
+PROFILE_LEAK_WARMUP = "PROFILE_LEAK_WARMUP"
+PROFILE_LEAK_THRESHOLD = "PROFILE_LEAK_THRESHOLD"
+PROFILE_ENTRY_POINTS = "PROFILE_ENTRY_POINTS"
+PROFILE_WATCH_INTERVAL = "PROFILE_WATCH_INTERVAL"
+PROFILE_MEMORY = "PROFILE_MEMORY"
 
 DEFAULT_OUTPUT_DIR = "line_profile_results"
 LINE_PROFILING_PLUGIN = "line_profiling_plugin"
 LINE_PROFILING_PLUGIN_FILE = "line_profiling_plugin.py"
+LINE_PROFILING_PLUGIN_MODULE = "profiling_cli.plugins.line_profiling_plugin"
+TEST_MAP_PLUGIN_MODULE = "profiling_cli.plugins.test_map_plugin"
+WATCH_PLUGIN_MODULE = "profiling_cli.plugins.watch_plugin"
+CACHE_DIR = ".profiling_cli_cache"
+TEST_MAP_FILE = "test_map.json"
+PROJECT_CONFIG_TABLE = "profiling-cli"
+DEFAULT_BATCH_REPORT_FILE = "profiling_report.txt"
 LINE_STATS_FILE = "line_stats.txt"
+CPU_LINE_STATS_FILE = "line_stats_cpu.txt"
+LINE_STATS_RAW_FILE = "line_stats.lprof"
+CPU_LINE_STATS_RAW_FILE = "line_stats_cpu.lprof"
+RUN_METADATA_FILE = "run_metadata.json"
+PROCESS_STATS_FILE = "process_stats.txt"
+THREAD_STATS_FILE = "thread_stats.txt"
+CHILD_STATS_DIR = "child_stats"
+SUBPROCESS_BOOTSTRAP_DIR = "subprocess_bootstrap"
+TARGETS_DIR = "targets"
+ANTIPATTERNS_FILE = "antipatterns.txt"
+BUDGET_REPORT_FILE = "budget_report.txt"
+BUDGET_RESULTS_FILE = "budget_results.json"
+PERF_BUDGET_MARKER = "perf_budget"
+PROFILE_MARKER = "profile"
+REPEATS_DIR = "repeats"
+REPEAT_STATS_FILE = "repeat_stats.txt"
+PYTEST_LOG_FILE = "pytest.log"
+GC_STATS_FILE = "gc_stats.txt"
+GC_RESULTS_FILE = "gc_results.json"
+GC_TUNED_DIR = "gc_tuned"
+STARTUP_STATS_FILE = "startup_stats.txt"
+LEAK_REPORT_FILE = "leak_report.txt"
+LEAK_RESULTS_FILE = "leak_results.json"
+MEMORY_RESULT_FILE = "memory.bin"
+MEMORY_REPORT_FILE = "memory_report.txt"
+LINE_MEMORY_FILE = "line_memory.json"
+LINE_TABLE_FILE = "line_table.txt"
+
+# Seconds between two checks of the files watched by the watch command
+DEFAULT_WATCH_INTERVAL = 0.5
+
+# Allocations listed in the memory report of a profiled program, with this many frames of their stack
+MEMORY_REPORT_TOP_ALLOCATIONS = 10
+MEMORY_REPORT_STACK_FRAMES = 5
+
+# Bounds of the chat memory of the optimization session
+DEFAULT_MEMORY_TOKEN_LIMIT = 8000
+DEFAULT_MEMORY_WINDOW_TURNS = 6
+
+# Routing of the analysis requests across the model providers
+DEFAULT_MODEL_MAX_RETRIES = 2
+MODEL_RETRY_BACKOFF_SECONDS = 1.0
+# Idle connections to the model providers stay open between the turns of the session, a user may read for minutes
+MODEL_KEEPALIVE_SECONDS = 600
+MODEL_MAX_KEEPALIVE_CONNECTIONS = 10
+
+# GitHub MCP server started for the agent, PROFILE_MCP_SERVER_COMMAND overrides it
+DEFAULT_MCP_SERVER_COMMAND = ["docker", "run", "-i", "--rm", "-e", "GITHUB_PERSONAL_ACCESS_TOKEN",
+                              "ghcr.io/github/github-mcp-server"]
+
+# Additional result files written by the plugin and the title they get in the analysis
+ADDITIONAL_STATS_SECTIONS = {
+    PROCESS_STATS_FILE: "PER-PROCESS BREAKDOWN",
+    THREAD_STATS_FILE: "PER-THREAD BREAKDOWN (CPU VS WALL TIME AND GIL CONTENTION)",
+    BUDGET_REPORT_FILE: "PERFORMANCE BUDGETS",
+    ANTIPATTERNS_FILE: "STATIC ANTI-PATTERN FINDINGS (DETECTED LOCALLY ON THE HOT LINES)",
+    LEAK_REPORT_FILE: "MEMORY GROWTH ACROSS REPEATED TEST ITERATIONS (STEADILY GROWING ALLOCATION SITES ARE LEAKS)",
+    GC_STATS_FILE: "GARBAGE COLLECTION PAUSES (BY TEST AND BY INNERMOST PROFILED FUNCTION)",
+    STARTUP_STATS_FILE: "IMPORT TIME (COLD START IN FRESH INTERPRETERS, THE LINE STATS ARE MODULE-LEVEL STATEMENTS)",
+    REPEAT_STATS_FILE: "REPEATED-RUN STATISTICS (ONLY THE ROBUST HOTSPOTS ARE FINDINGS, THE REST IS RUN-TO-RUN NOISE)",
+}
+
+
+class TimerConst:
+    """Line timer constants."""
+    WALL = "wall"
+    CPU = "cpu"
+    BOTH = "both"
+
+
+# How the primary line stats of each timer are described to the model
+TIMER_METRIC_LABELS = {
+    TimerConst.WALL: "wall-clock time",
+    TimerConst.CPU: "CPU time (per-thread CPU clock)",
+    TimerConst.BOTH: "wall-clock time, with the per-thread CPU time of each line as cpu_time",
+}
+
+
+class BudgetConst:
+    """Performance budget limits, as written in the project config."""
+    MAX_TIME_PER_CALL = "max-time-per-call"
+    MAX_TIME_SHARE = "max-time-share"
+    MAX_PEAK_MEMORY = "max-peak-memory"
+    MAX_ALLOCATIONS = "max-allocations"
+
+
+# Name of the metric each budget limits
+BUDGET_METRIC_LABELS = {
+    BudgetConst.MAX_TIME_PER_CALL: "time per call",
+    BudgetConst.MAX_TIME_SHARE: "time share",
+    BudgetConst.MAX_PEAK_MEMORY: "peak memory",
+    BudgetConst.MAX_ALLOCATIONS: "allocations",
+}
+
+
+class AntiPatternConst:
+    """Performance anti-patterns flagged by the static pass over the hot lines."""
+    LIST_MEMBERSHIP = "list-membership-in-loop"
+    STRING_CONCATENATION = "string-concatenation-in-loop"
+    REPEATED_LOOKUP = "repeated-lookup-in-loop"
+    LIST_POP_FRONT = "list-pop-front"
+    REGEX_COMPILE = "regex-compiled-per-call"
+    QUADRATIC_SCAN = "quadratic-nested-scan"
+
+
+class StageConst:
+    """Stages of a profiling-cli run reported by --timings."""
+    STARTUP = "startup"
+    TEST_SELECTION = "test selection"
+    PYTEST_RUN = "pytest run"
+    STATS_AGGREGATION = "stats aggregation"
+    STATS_LOADING = "stats loading"
+    STATS_PARSING = "stats parsing"
+    AGENT_STARTUP = "agent startup"
+    PAYLOAD_BUILDING = "payload building"
+    AGENT_TURN = "agent turn"
+    PR_TOOLING = "pr tooling"
+    GC_TUNED_RUN = "gc tuned run"
+    IMPORT_PROFILING = "import profiling"
+    MODULE_PROFILING = "module profiling"
+    PROGRAM_RUN = "program run"
 
 
 class ModelProviderConst:
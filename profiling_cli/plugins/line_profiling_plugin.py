@@ -1,83 +1,327 @@
-import pytest
-import importlib
 import inspect
+import json
 import os
-from line_profiler import LineProfiler
+import time
+
+import pytest
+from line_profiler.line_profiler import LineStats
 
-from profiling_cli.consts import LINE_STATS_FILE, PROFILE_MODULES, PROFILE_FUNCTIONS, PROFILE_OUTPUT_DIR
+from profiling_cli.consts import LINE_STATS_FILE, PROFILE_OUTPUT_DIR, PROFILE_SUBPROCESSES, PROFILE_THREADS, \
+    DEFAULT_OUTPUT_DIR, TARGETS_DIR, BUDGET_REPORT_FILE, BUDGET_RESULTS_FILE, PERF_BUDGET_MARKER, PROFILE_GC, \
+    GC_STATS_FILE, GC_RESULTS_FILE, LEAK_REPORT_FILE, LEAK_RESULTS_FILE, PROFILE_MARKER
+from profiling_cli.utils.budget_utils import normalize_budget, measure_functions, measure_test, memory_by_function, \
+    check_budget, format_budget_report
+from profiling_cli.utils.gating_utils import EntryPointGate
+from profiling_cli.utils.gc_utils import GCRecorder, apply_gc_settings, summarize_gc, format_gc_report
+from profiling_cli.utils.leak_utils import track_heap_growth, find_growing_sites, attribute_sites, \
+    summarize_test_growth, format_leak_report
+from profiling_cli.utils.memory_utils import measure_line_memory
+from profiling_cli.utils.plugin_utils import create_profiler, get_profile_targets, register_functions, \
+    merge_line_stats, write_line_stats, get_batch_targets, is_target_test, filter_line_stats, subtract_line_stats, \
+    get_budgets, get_gc_settings, get_leak_settings, get_entry_points
+from profiling_cli.utils.results_utils import write_line_profiling_results
+from profiling_cli.utils.subprocess_utils import enable_subprocess_profiling
 
 # Configuration (will be populated from environment variables or defaults)
-PROFILE_OUTPUT_DIR_LOCATION = os.environ.get(f'{PROFILE_OUTPUT_DIR}')
+PROFILE_OUTPUT_DIR_LOCATION = os.path.abspath(os.environ.get(f'{PROFILE_OUTPUT_DIR}', DEFAULT_OUTPUT_DIR))
+PROFILE_SUBPROCESSES_ENABLED = bool(os.environ.get(f'{PROFILE_SUBPROCESSES}'))
+PROFILE_THREADS_ENABLED = bool(os.environ.get(f'{PROFILE_THREADS}'))
+PROFILE_GC_ENABLED = bool(os.environ.get(f'{PROFILE_GC}'))
+
+# Global line profiler, a thread aware tracer when a thread breakdown or a CPU timer is requested
+line_profiler = create_profiler()
+
+# Batch profiling targets, each one only collects the stats of its own functions while its own tests run
+batch_targets = get_batch_targets()
+target_functions = {}
+target_stats = {}
+
+# Qualified name of every registered function by (file, first line)
+registered_functions = {}
 
-# Global line profiler
-line_profiler = LineProfiler()
+# Performance budgets from the project config and the perf_budget markers, with what is needed to check them
+budgets = get_budgets()
+test_budgets = {}
+test_function_budgets = {}
+test_function_stats = {}
+test_durations = {}
+
+# Memory growth check, every test body runs again this many times once it passed
+leak_iterations, leak_warmup, leak_threshold = get_leak_settings()
+leak_results = []
+# Seconds the memory growth check took in the call phase of every test, not part of the test's duration
+leak_check_durations = {}
 
 
 def find_and_register_functions():
     """Find target functions and register them with the line profiler."""
-    modules_to_profile = os.environ.get(f'{PROFILE_MODULES}').split(',') if os.environ.get(f'{PROFILE_MODULES}') else []
-    functions_to_profile = os.environ.get(f'{PROFILE_FUNCTIONS}').split(',') if os.environ.get(
-        f'{PROFILE_FUNCTIONS}') else []
+    if batch_targets:
+        for target in batch_targets:
+            print(f"Target {target['name']}: modules {target['modules']}, functions {target['functions']}")
+            functions = register_functions(line_profiler, target['modules'], target['functions'])
+            target_functions[target['name']] = set(functions)
+            registered_functions.update(functions)
+        return
+
+    modules_to_profile, functions_to_profile = get_profile_targets()
     print(f"Modules to profile : {modules_to_profile}")
     print(f"Functions to profile : {functions_to_profile}")
-    for module_name in modules_to_profile:
-        try:
-            # Import the module
-            module = importlib.import_module(module_name)
-
-            # If specific functions are listed, profile only those
-            if functions_to_profile:
-                for func_name in functions_to_profile:
-                    # Check if it's a class method (contains a dot)
-                    if '.' in func_name:
-                        class_name, method_name = func_name.split('.')
-
-                        # Get the class from the module
-                        if hasattr(module, class_name):
-                            cls = getattr(module, class_name)
-                            if inspect.isclass(cls) and hasattr(cls, method_name):
-                                method = getattr(cls, method_name)
-                                if callable(method):
-                                    line_profiler.add_function(method)
-                                    print(f"Registered class method: {module_name}.{func_name} for line profiling")
-                    elif hasattr(module, func_name):
-                        func = getattr(module, func_name)
-                        line_profiler.add_function(func)
-                        print(f"Registered function {module_name}.{func_name} for line profiling")
-            else:
-                # Otherwise, profile all non-private functions in the module
-                print("No function to profile")
-                for name, obj in inspect.getmembers(module):
-                    if inspect.isfunction(obj) and not name.startswith('_'):
-                        line_profiler.add_function(obj)
-                        print(f"Registered {module_name}.{name} for line profiling")
-        except Exception as e:
-            print(f"Error registering module {module_name}: {e}")
+    registered_functions.update(register_functions(line_profiler, modules_to_profile, functions_to_profile))
 
 
 # Register functions when plugin is loaded
 find_and_register_functions()
 
+# Only record the calls made while an entry point runs, the profiler stays off the rest of the test
+entry_point_gate = None
+if get_entry_points():
+    entry_point_gate = EntryPointGate(line_profiler)
+    try:
+        entry_point_gate.install(get_entry_points())
+    except (TypeError, ValueError) as e:
+        raise pytest.UsageError(str(e))
+    print(f"Entry points gating the profiler : {get_entry_points()}")
+
+# Propagate the profiler configuration into child processes
+if PROFILE_SUBPROCESSES_ENABLED:
+    enable_subprocess_profiling(line_profiler, PROFILE_OUTPUT_DIR_LOCATION)
+
+# Record the garbage collector pauses, by test and by innermost registered function
+gc_recorder = GCRecorder(registered_functions) if PROFILE_GC_ENABLED else None
+if gc_recorder:
+    gc_recorder.start()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        f"{PERF_BUDGET_MARKER}(max_time_per_call=None, max_time_share=None, max_peak_memory=None, "
+        f"max_allocations=None, functions=None): fail the run when the test, or the given functions while it "
+        f"runs, exceed these performance budgets"
+    )
+    config.addinivalue_line(
+        "markers",
+        f"{PROFILE_MARKER}: part of the profiled run when only the marked tests are profiled (--marked-only)"
+    )
+
+
+def pytest_collection_finish(session):
+    # Tune the garbage collector once the test modules are imported, so that a freeze covers them
+    apply_gc_settings(*get_gc_settings())
+
+
+def pytest_runtest_logstart(nodeid, location):
+    if gc_recorder:
+        gc_recorder.current_test = nodeid
+
+
+def pytest_runtest_logfinish(nodeid, location):
+    if gc_recorder:
+        gc_recorder.current_test = None
+
+
+def collect_test_budgets(item):
+    """Record the budgets of a test from the project config and its marker, return its function budgets."""
+    budget = {}
+    for test, config_budget in budgets["tests"].items():
+        if is_target_test(str(item.path), item.nodeid, {"tests": [test]}):
+            budget.update(config_budget)
+    function_budgets = {}
+    marker = item.get_closest_marker(PERF_BUDGET_MARKER)
+    if marker:
+        marker_budget = dict(marker.kwargs)
+        function_budgets = {name: normalize_budget(function_budget, f"function {name} in {item.nodeid}")
+                            for name, function_budget in (marker_budget.pop("functions", None) or {}).items()}
+        budget.update(normalize_budget(marker_budget, f"test {item.nodeid}"))
+    if budget:
+        test_budgets[item.nodeid] = budget
+    if function_budgets:
+        test_function_budgets[item.nodeid] = function_budgets
+    return function_budgets
+
+
+def pytest_runtest_logreport(report):
+    # Setup, call and teardown time of every test
+    duration = report.duration - (leak_check_durations.pop(report.nodeid, 0.0) if report.when == "call" else 0.0)
+    test_durations[report.nodeid] = test_durations.get(report.nodeid, 0.0) + duration
+
 
 @pytest.hookimpl(hookwrapper=True)
 def pytest_runtest_protocol(item, nextitem):
-    # Enable profiling before each test
-    line_profiler.enable_by_count()
+    function_budgets = collect_test_budgets(item)
+    targets = None
+    if batch_targets:
+        targets = [target for target in batch_targets if is_target_test(str(item.path), item.nodeid, target)]
+        if not targets:
+            # The test is not part of any target, run it without profiling
+            yield
+            return
+    stats_before = line_profiler.get_stats() if targets or function_budgets else None
+
+    # Enable profiling before each test, or only while its entry points run
+    if entry_point_gate:
+        entry_point_gate.open = True
+    else:
+        line_profiler.enable_by_count()
 
     # Run the test
     yield
 
     # Disable profiling after test
-    line_profiler.disable_by_count()
+    if entry_point_gate:
+        entry_point_gate.open = False
+    else:
+        line_profiler.disable_by_count()
+
+    if stats_before is not None:
+        # Attribute what this test recorded to its targets and function budgets
+        test_stats = subtract_line_stats(line_profiler.get_stats(), stats_before)
+        if function_budgets:
+            test_function_stats[item.nodeid] = test_stats
+        for target in targets or []:
+            stats = filter_line_stats(test_stats, target_functions[target['name']])
+            previous = target_stats.get(target['name'])
+            target_stats[target['name']] = merge_line_stats([previous, stats]) if previous else stats
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    outcome = yield
+    if leak_iterations and outcome.excinfo is None and isinstance(item, pytest.Function):
+        check_memory_growth(item)
+
+
+def check_memory_growth(item):
+    """Run the body of a passed test again and again, recording the allocation sites that keep growing."""
+    if inspect.iscoroutinefunction(item.obj):
+        return
+    arguments = {name: item.funcargs[name] for name in item._fixtureinfo.argnames}
+    # The extra iterations are neither line profiled nor counted as GC pauses of the test
+    profiling = line_profiler.enable_count > 0
+    if profiling:
+        line_profiler.disable_by_count()
+    gated = entry_point_gate is not None and entry_point_gate.open
+    if gated:
+        entry_point_gate.open = False
+    if gc_recorder:
+        gc_recorder.stop()
+    started = time.perf_counter()
+    try:
+        sizes = track_heap_growth(lambda: item.obj(**arguments), leak_iterations, leak_warmup)
+    except Exception as e:  # noqa: BLE001 - the test may raise anything when run again, its result stands
+        print(f"Memory growth check of {item.nodeid} stopped: {e}")
+        return
+    finally:
+        # The extra iterations run in the call phase, they are taken out of its duration
+        leak_check_durations[item.nodeid] = time.perf_counter() - started
+        if profiling:
+            line_profiler.enable_by_count()
+        if gated:
+            entry_point_gate.open = True
+        if gc_recorder:
+            gc_recorder.start()
+    sites = find_growing_sites(sizes)
+    attribute_sites(sites, registered_functions)
+    leak_results.append(summarize_test_growth(item.nodeid, sites, leak_iterations, leak_warmup, leak_threshold))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # Save the results once all tests ran and their child processes exited
+    os.makedirs(PROFILE_OUTPUT_DIR_LOCATION, exist_ok=True)
+
+    memray_results = get_memray_results(session)
+    line_memory = measure_line_memory(list(memray_results.values()), registered_functions) \
+        if memray_results and registered_functions else None
+    stats, children = write_line_profiling_results(line_profiler, PROFILE_OUTPUT_DIR_LOCATION,
+                                                    profile_subprocesses=PROFILE_SUBPROCESSES_ENABLED,
+                                                    profile_threads=PROFILE_THREADS_ENABLED,
+                                                    line_memory=line_memory)
+
+    # Save the stats of each batch target, child processes are attributed by the functions they ran
+    for target in batch_targets or []:
+        functions = target_functions[target['name']]
+        stats_list = [target_stats[target['name']]] if target['name'] in target_stats else []
+        stats_list += [filter_line_stats(child["stats"], functions) for child in children]
+        target_dir = f"{PROFILE_OUTPUT_DIR_LOCATION}/{TARGETS_DIR}/{target['name']}"
+        os.makedirs(target_dir, exist_ok=True)
+        write_line_stats(merge_line_stats(stats_list), f"{target_dir}/{LINE_STATS_FILE}")
+
+    if budgets["functions"] or test_budgets or test_function_budgets:
+        check_performance_budgets(session, stats, memray_results)
+
+    if gc_recorder:
+        gc_recorder.stop()
+        write_gc_stats()
+
+    if leak_iterations:
+        write_leak_report(session, exitstatus)
+
+    print(f"Line profiling results saved to {PROFILE_OUTPUT_DIR_LOCATION}/{LINE_STATS_FILE}")
+
+
+def write_gc_stats():
+    """Save the garbage collection pauses, as a report and as JSON to compare runs."""
+    summary = summarize_gc(gc_recorder.collections, test_durations)
+    report = format_gc_report(summary)
+    with open(f"{PROFILE_OUTPUT_DIR_LOCATION}/{GC_STATS_FILE}", 'w') as f:
+        f.write(report)
+    with open(f"{PROFILE_OUTPUT_DIR_LOCATION}/{GC_RESULTS_FILE}", 'w') as f:
+        json.dump(summary, f)
+    print(f"\n{report}")
+
+
+def write_leak_report(session, exitstatus):
+    """Save the memory growth of the tests, failing the session when a test grows over the threshold."""
+    report = format_leak_report(leak_results)
+    exceeded = [result for result in leak_results if result["exceeded"]]
+    with open(f"{PROFILE_OUTPUT_DIR_LOCATION}/{LEAK_REPORT_FILE}", 'w') as f:
+        f.write(report)
+    with open(f"{PROFILE_OUTPUT_DIR_LOCATION}/{LEAK_RESULTS_FILE}", 'w') as f:
+        json.dump({"tests_exit_status": int(exitstatus), "exceeded": len(exceeded), "threshold": leak_threshold,
+                   "results": leak_results}, f)
+    print(f"\n{report}")
+
+    if exceeded and session.exitstatus == pytest.ExitCode.OK:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def get_memray_results(session):
+    """Memray result file of every test by node id, empty when pytest-memray is not enabled."""
+    memray_manager = session.config.pluginmanager.get_plugin("memray_manager")
+    return {test_id: str(result.result_file)
+            for test_id, result in (memray_manager.results if memray_manager else {}).items()}
+
+
+def check_performance_budgets(session, stats, memray_results):
+    """Compare the run with the performance budgets, failing the session when one is exceeded."""
+    total_time = sum(test_durations.values())
 
-    # After all tests run, we'll save the results
-    if nextitem is None:  # Last test
-        # Create output directory
-        os.makedirs(PROFILE_OUTPUT_DIR_LOCATION, exist_ok=True)
+    results = []
+    if budgets["functions"]:
+        memory = memory_by_function(list(memray_results.values()), registered_functions) if memray_results else None
+        metrics = measure_functions(stats, registered_functions, total_time, memory)
+        for name, budget in budgets["functions"].items():
+            results += check_budget("function", name, budget, metrics.get(name))
+    for nodeid, budget in test_budgets.items():
+        metrics = measure_test(test_durations.get(nodeid, 0.0), total_time, memray_results.get(nodeid)) \
+            if nodeid in test_durations else None
+        results += check_budget("test", nodeid, budget, metrics)
+    for nodeid, function_budgets in test_function_budgets.items():
+        # Function budgets of a marker only cover the calls made while that test ran
+        memory = memory_by_function([memray_results[nodeid]], registered_functions) \
+            if nodeid in memray_results else None
+        metrics = measure_functions(test_function_stats.get(nodeid, LineStats({}, stats.unit)),
+                                    registered_functions, test_durations.get(nodeid, 0.0), memory)
+        for name, budget in function_budgets.items():
+            results += check_budget("function", f"{name} in {nodeid}", budget, metrics.get(name))
 
-        # Save the profiling stats
-        stats_file = f"{PROFILE_OUTPUT_DIR_LOCATION}/{LINE_STATS_FILE}"
-        with open(stats_file, 'w') as f:
-            line_profiler.print_stats(stream=f, stripzeros=True)
+    report = format_budget_report(results)
+    exceeded = [result for result in results if result["exceeded"]]
+    with open(f"{PROFILE_OUTPUT_DIR_LOCATION}/{BUDGET_REPORT_FILE}", 'w') as f:
+        f.write(report)
+    with open(f"{PROFILE_OUTPUT_DIR_LOCATION}/{BUDGET_RESULTS_FILE}", 'w') as f:
+        json.dump({"tests_exit_status": int(session.exitstatus), "exceeded": len(exceeded), "results": results}, f)
+    print(f"\n{report}")
 
-        print(f"Line profiling results saved to {stats_file}")
+    if exceeded and session.exitstatus == pytest.ExitCode.OK:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+from profiling_cli.consts import PROFILE_TEST_MAP_FILE
+from profiling_cli.utils.selection_utils import FunctionCallRecorder
+
+# Functions of the project each test runs, keyed by node id with an absolute path
+recorder = FunctionCallRecorder(os.getcwd())
+test_functions = {}
+
+
+def pytest_sessionstart(session):
+    recorder.start()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    # Setup and teardown count, fixtures may be what reaches the profiled code
+    recorder.reset()
+    yield
+    nodeid = f"{item.path}::{item.nodeid.split('::', 1)[1]}" if "::" in item.nodeid else str(item.path)
+    test_functions[nodeid] = {"path": str(item.path), "functions": sorted(recorder.reset())}
+
+
+def pytest_sessionfinish(session, exitstatus):
+    recorder.stop()
+    with open(os.environ[PROFILE_TEST_MAP_FILE], 'w') as f:
+        json.dump(test_functions, f)
+    print(f"\nMapped the functions run by {len(test_functions)} tests")
@@ -0,0 +1,179 @@
+import os
+import time
+import traceback
+from pathlib import Path
+
+import pytest
+
+from profiling_cli.consts import DEFAULT_WATCH_INTERVAL, PROFILE_WATCH_INTERVAL
+from profiling_cli.utils.plugin_utils import (
+    create_profiler,
+    get_profile_targets,
+    register_functions,
+    subtract_line_stats,
+)
+from profiling_cli.utils.selection_utils import FunctionCallRecorder, function_spans
+from profiling_cli.utils.watch_utils import (
+    changed_function_names,
+    format_function_delta,
+    function_lines,
+    line_time_delta,
+    project_modules,
+    reload_module,
+)
+
+modules_to_profile, functions_to_profile = get_profile_targets()
+watch_interval = float(os.environ.get(PROFILE_WATCH_INTERVAL) or DEFAULT_WATCH_INTERVAL)
+root = os.getcwd()
+recorder = FunctionCallRecorder(root)
+
+# Functions of the project each test ran, and the seconds spent on every line of the profiled functions it ran
+test_functions = {}
+test_line_times = {}
+# (file, qualified name) and lines of the measured version of every profiled function
+profiled_functions = {}
+profiled_lines = {}
+# Content and modification time of the project files, as of the last run
+file_sources = {}
+file_mtimes = {}
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtestloop(session):
+    if session.config.option.collectonly or session.testsfailed:
+        # Let pytest report the collection
+        return None
+    recorder.start()
+    try:
+        # Changes saved while the tests run are caught too, the modules imported by the tests are added after
+        snapshot_files()
+        run_tests(session.items)
+        snapshot_files()
+        print(f"\nWatching {len(file_mtimes)} files of the project, save a change to profile the tests reaching it "
+              f"again (Ctrl+C to stop)")
+        while True:
+            time.sleep(watch_interval)
+            changed = [path for path, mtime in file_mtimes.items() if _mtime(path) != mtime]
+            if changed:
+                profile_change(session, changed)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        recorder.stop()
+    return True
+
+
+def run_tests(items, rerun=False):
+    """Run tests with a new profiler registering the current version of the functions."""
+    profiler = create_profiler()
+    registered = register_functions(profiler, modules_to_profile, functions_to_profile, verbose=not rerun)
+    for filename in {filename for filename, _ in registered}:
+        source = Path(filename).read_text()
+        lines = function_lines(filename, source)
+        for qualname, first_line, _ in function_spans(filename, source):
+            if (filename, first_line) in registered:
+                profiled_functions[registered[(filename, first_line)]] = (filename, qualname)
+                profiled_lines[registered[(filename, first_line)]] = lines[qualname]
+    for index, item in enumerate(items):
+        nextitem = items[index + 1] if index + 1 < len(items) else None
+        if rerun and isinstance(item, pytest.Function):
+            reset_test(item)
+        stats_before = profiler.get_stats()
+        recorder.reset()
+        profiler.enable_by_count()
+        item.config.hook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+        profiler.disable_by_count()
+        test_functions[item.nodeid] = recorder.reset()
+        stats = subtract_line_stats(profiler.get_stats(), stats_before)
+        test_line_times[item.nodeid] = {
+            registered[key[:2]]: {lineno: time_value * stats.unit for lineno, _, time_value in entries}
+            for key, entries in stats.timings.items() if key[:2] in registered}
+
+
+def reset_test(item):
+    """
+    Give a test that ran already fresh fixture values and captured output, as for a first run.
+
+    pytest has no public API to run a test twice in a session, this relies on the private Function._initrequest and
+    Item._report_sections, present in pytest 7.0 to 9.1.
+    """
+    item._initrequest()
+    item._report_sections.clear()
+
+
+def snapshot_files():
+    """Remember the content of the project files imported so far, they are the ones watched."""
+    for path in project_modules(root):
+        if path not in file_mtimes:
+            file_mtimes[path] = _mtime(path)
+            file_sources[path] = Path(path).read_text()
+
+
+def profile_change(session, paths):
+    """Reload the changed modules, run the tests reaching them again and print the time delta."""
+    started = time.perf_counter()
+    modules = project_modules(root)
+    # Changed functions by file, None when only module-level code changed
+    changed = {}
+    for path in paths:
+        file_mtimes[path] = _mtime(path)
+        try:
+            source = Path(path).read_text()
+        except OSError:
+            continue
+        if source == file_sources[path]:
+            continue
+        try:
+            for module in modules.get(path, []):
+                reload_module(module)
+        except Exception:  # noqa: BLE001 - a half saved module may raise anything, watching goes on
+            print(f"\nCould not reload {os.path.relpath(path, root)}:")
+            traceback.print_exc()
+            continue
+        changed[path] = changed_function_names(path, file_sources[path], source) or None
+        file_sources[path] = source
+    if not changed:
+        return
+
+    items = [item for item in session.items
+             if any(path in changed and (changed[path] is None or qualname in changed[path])
+                    for path, qualname in test_functions.get(item.nodeid, ()))]
+    files = ", ".join(os.path.relpath(path, root) for path in changed)
+    if not items:
+        print(f"\nNo test runs the code changed in {files}")
+        return
+    before_times = {item.nodeid: test_line_times.get(item.nodeid, {}) for item in items}
+    before_lines = dict(profiled_lines)
+    print(f"\nChanged {files}, running the {len(items)} tests reaching it again")
+    run_tests(items, rerun=True)
+    snapshot_files()
+
+    report = []
+    for name in sorted({name for nodeid in before_times for name in before_times[nodeid]} |
+                       {name for item in items for name in test_line_times.get(item.nodeid, {})}):
+        before, after = _sum_line_times(before_times.values(), name), _sum_line_times(
+            [test_line_times.get(item.nodeid, {}) for item in items], name)
+        path, qualname = profiled_functions.get(name, (None, None))
+        edited = path in changed and (changed[path] is None or qualname in changed[path])
+        rows = line_time_delta(before, before_lines.get(name, {}), after, profiled_lines.get(name, {})) \
+            if edited else None
+        report.append(format_function_delta(name, len(items), before, after, rows))
+    print(f"\nProfiled again in {time.perf_counter() - started:.2f} s")
+    print("\n\n".join(report) if report else "The tests did not run any profiled function")
+
+
+def _sum_line_times(tests_line_times, name):
+    """Seconds spent on every line of a function over several tests."""
+    totals = {}
+    for line_times in tests_line_times:
+        for lineno, seconds in line_times.get(name, {}).items():
+            totals[lineno] = totals.get(lineno, 0.0) + seconds
+    return totals
+
+
+def _mtime(path):
+    """Modification time of a file, None once deleted."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -1,31 +1,99 @@
 import os
 
+import httpx
 from langchain_anthropic import ChatAnthropic
 from langchain_ollama import OllamaLLM
 from langchain_openai import ChatOpenAI
 
-from profiling_cli.consts import ModelProviderConst, ErrorMessages
+from profiling_cli.agent.routing import RoutedChatModel
+from profiling_cli.consts import ModelProviderConst, ErrorMessages, DEFAULT_MODEL_MAX_RETRIES, \
+    MODEL_KEEPALIVE_SECONDS, MODEL_MAX_KEEPALIVE_CONNECTIONS
 
 
 def initiate_model(model: str, model_provider: str | ModelProviderConst,
-                   base_url: str | None = None) -> ChatAnthropic | ChatOpenAI | OllamaLLM:
+                   base_url: str | None = None, request_timeout: float | None = None, max_retries: int | None = None,
+                   http_limits: httpx.Limits | None = None) -> ChatAnthropic | ChatOpenAI | OllamaLLM:
     """
     Initiate the model with the given model name and provider.
     :param model: Model name e.g. claude-3-5-sonnet-20240620
     :param model_provider: Model provider name e.g. anthropic
     :param base_url: Base URL e.g. https://example.com if needed for the model provider such as Ollama
+    :param request_timeout: Optional timeout of every request in seconds
+    :param max_retries: Optional number of retries of the provider client itself
+    :param http_limits: Optional connection pool limits of the HTTP clients the model keeps for the whole session
     :return: LLM model instance
     """
+    options = {} if request_timeout is None else {"timeout": request_timeout}
+    if max_retries is not None:
+        options["max_retries"] = max_retries
     # Initialize the language model
     if model_provider == ModelProviderConst.ANTHROPIC:
         assert os.environ.get("ANTHROPIC_API_KEY"), ErrorMessages.MISSING_ANTHROPIC_KEY
-        llm = ChatAnthropic(model=model, verbose=True)
+        if base_url:
+            options["anthropic_api_url"] = base_url
+        # The Anthropic client keeps its own pooled HTTP client for the lifetime of the model
+        llm = ChatAnthropic(model=model, verbose=True, **options)
     elif model_provider == ModelProviderConst.OLLAMA:
-        llm = OllamaLLM(base_url=base_url, model=model, verbose=True)
+        client_kwargs = {"limits": http_limits} if http_limits else {}
+        if request_timeout is not None:
+            client_kwargs["timeout"] = request_timeout
+        llm = OllamaLLM(base_url=base_url, model=model, verbose=True, client_kwargs=client_kwargs)
     elif model_provider == ModelProviderConst.OPENAI:
         assert os.environ.get("OPENAI_API_KEY"), ErrorMessages.MISSING_OPENAI_KEY
-        llm = ChatOpenAI(model=model, verbose=True)
+        if base_url:
+            options["base_url"] = base_url
+        if http_limits:
+            options["http_client"] = httpx.Client(limits=http_limits)
+            options["http_async_client"] = httpx.AsyncClient(limits=http_limits)
+        llm = ChatOpenAI(model=model, verbose=True, **options)
     else:
         raise ValueError(f"Unknown model provider {model_provider}")
     print(f"Initialized model: {model} with provider {model_provider}")
     return llm
+
+
+def parse_model_spec(spec: str) -> tuple[str, str, str | None]:
+    """
+    Parse a model given on the command line.
+
+    :param spec: provider:model or provider:model@base_url e.g. ollama:llama3@http://localhost:11434
+    :return: Tuple (provider, model, base URL or None)
+    :raises ValueError: If the spec is malformed or the provider unknown
+    """
+    provider, _, model = spec.partition(":")
+    model, _, base_url = model.partition("@")
+    providers = [value for key, value in ModelProviderConst.__dict__.items() if not key.startswith("_")]
+    if not model or provider not in providers:
+        raise ValueError(f"Invalid model {spec}, expected provider:model or provider:model@base_url with a provider "
+                         f"among {', '.join(providers)}")
+    return provider, model, base_url or None
+
+
+def initiate_router(model: str, model_provider: str | ModelProviderConst, base_url: str | None = None,
+                    fallback_models: list[str] | tuple[str, ...] = (), race: bool = False,
+                    request_timeout: float | None = None,
+                    max_retries: int = DEFAULT_MODEL_MAX_RETRIES) -> RoutedChatModel:
+    """
+    Initiate the main model and its fallbacks behind a router.
+
+    The provider clients do not retry on their own, the router does, and their connections stay open between the
+    turns of the session.
+
+    :param model: Model name of the main model
+    :param model_provider: Model provider name of the main model
+    :param base_url: Optional base URL of the main model
+    :param fallback_models: Models asked when the main one fails, provider:model or provider:model@base_url
+    :param race: Whether to ask all the models at once and keep the first answer
+    :param request_timeout: Optional timeout of every request in seconds
+    :param max_retries: Number of retries of every model before the next one is asked
+    :return: The routed model
+    """
+    http_limits = httpx.Limits(max_keepalive_connections=MODEL_MAX_KEEPALIVE_CONNECTIONS,
+                               keepalive_expiry=MODEL_KEEPALIVE_SECONDS)
+    models = {}
+    for provider, name, url in [(model_provider, model, base_url)] + [parse_model_spec(spec)
+                                                                     for spec in fallback_models]:
+        label = f"{provider}:{name}" if f"{provider}:{name}" not in models else f"{provider}:{name}@{url}"
+        models[label] = initiate_model(name, provider, base_url=url, request_timeout=request_timeout, max_retries=0,
+                                       http_limits=http_limits)
+    return RoutedChatModel(models=models, race=race, request_timeout=request_timeout, max_retries=max_retries)
@@ -0,0 +1,285 @@
+import ast
+import builtins
+from typing import Any
+
+from profiling_cli.consts import AntiPatternConst
+from profiling_cli.utils.plugin_utils import parse_function_source
+
+# Lines taking at least this share of their function's time are hot
+HOT_LINE_PERCENT = 5.0
+
+# Loops with at most this many statements in their body are tight loops
+TIGHT_LOOP_STATEMENTS = 5
+
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)
+LIST_METHODS_SCANNING = {"index", "count", "remove"}
+REGEX_MODULES = {"re", "regex"}
+
+
+def find_antipatterns(profile_data: list[dict], hot_percent: float = HOT_LINE_PERCENT) -> list[dict[str, Any]]:
+    """
+    Flag common performance anti-patterns on the hot lines of the profiled functions with a static AST pass.
+
+    :param profile_data: Parsed stats as returned by parse_line_profiler_output
+    :param hot_percent: Lines under this share of their function's time are not checked
+    :return: One finding per anti-pattern with function, file, line, percent_time, pattern and message keys
+    """
+    findings = []
+    for function in profile_data:
+        hot_lines = {line['line_number']: line['percent_time'] for line in function['lines']
+                     if (line['percent_time'] or 0.0) >= hot_percent}
+        if not hot_lines:
+            continue
+        node = parse_function_source(function['file'], function['line_number']) if function['file'] else None
+        node = node or _parse_profiled_code(function)
+        if node is None:
+            continue
+        visitor = _AntiPatternVisitor(node)
+        for statement in node.body:
+            visitor.visit(statement)
+        for line_number, pattern, message in visitor.findings:
+            if line_number in hot_lines:
+                findings.append({'function': function['function_name'], 'file': function['file'],
+                                 'line': line_number, 'percent_time': hot_lines[line_number],
+                                 'pattern': pattern, 'message': message})
+    return findings
+
+
+def format_antipattern_report(findings: list[dict[str, Any]]) -> str:
+    """
+    Format the anti-pattern findings.
+
+    :param findings: Findings as returned by find_antipatterns
+    :return: Human readable report
+    """
+    if not findings:
+        return "No known performance anti-pattern found on the hot lines"
+    lines = [(f"{len(findings)} known performance anti-patterns found on the hot lines. These are textbook fixes, "
+              "apply them and focus the analysis on the remaining hotspots.")]
+    for finding in findings:
+        lines.append(f"{finding['function']} line {finding['line']} ({finding['percent_time']:.1f}% of its time) "
+                     f"[{finding['pattern']}]: {finding['message']}")
+    return "\n".join(lines)
+
+
+class _AntiPatternVisitor(ast.NodeVisitor):
+    """Collect the anti-patterns of a function body, nested functions and classes are not visited."""
+
+    def __init__(self, function: ast.FunctionDef | ast.AsyncFunctionDef) -> None:
+        self.findings: list[tuple[int, str, str]] = []
+        # Enclosing loops and comprehensions, innermost last
+        self.loops: list[ast.AST] = []
+        self.list_names, self.str_names, self.local_names = _collect_names(function)
+        self._reported: set[tuple[int, str, str]] = set()
+
+    def _report(self, node: ast.AST, pattern: str, message: str) -> None:
+        key = (node.lineno, pattern, message)
+        if key not in self._reported:
+            self._reported.add(key)
+            self.findings.append(key)
+
+    def generic_visit(self, node: ast.AST) -> None:
+        if isinstance(node, FUNCTION_NODES):
+            return
+        super().generic_visit(node)
+
+    def visit_For(self, node: ast.For | ast.AsyncFor) -> None:
+        self.visit(node.iter)
+        self._check_nested_scan(node, node.iter, node.body)
+        self.loops.append(node)
+        self.visit(node.target)
+        for statement in node.body:
+            self.visit(statement)
+        self.loops.pop()
+        for statement in node.orelse:
+            self.visit(statement)
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node: ast.While) -> None:
+        self.loops.append(node)
+        self.visit(node.test)
+        for statement in node.body:
+            self.visit(statement)
+        self.loops.pop()
+        for statement in node.orelse:
+            self.visit(statement)
+
+    def visit_comprehension_node(self, node: ast.AST) -> None:
+        # The first iterable is evaluated once, before the comprehension loops
+        self.visit(node.generators[0].iter)
+        for index, generator in enumerate(node.generators):
+            if index:
+                self.visit(generator.iter)
+                self._check_nested_scan(generator, generator.iter, generator.ifs)
+            self.loops.append(generator)
+            for condition in generator.ifs:
+                self.visit(condition)
+        for element in [getattr(node, 'elt', None), getattr(node, 'key', None), getattr(node, 'value', None)]:
+            if element is not None:
+                self.visit(element)
+        del self.loops[-len(node.generators):]
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_comprehension_node
+
+    def visit_Compare(self, node: ast.Compare) -> None:
+        if self.loops:
+            for operator, comparator in zip(node.ops, node.comparators):
+                if isinstance(operator, (ast.In, ast.NotIn)) and self._is_list(comparator):
+                    self._report(node, AntiPatternConst.LIST_MEMBERSHIP,
+                                 f"'in {_source(comparator)}' scans a list on every iteration, "
+                                 f"build a set once before the loop for O(1) lookups")
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node: ast.AugAssign) -> None:
+        if self.loops and isinstance(node.op, ast.Add) and isinstance(node.target, ast.Name) and \
+                (node.target.id in self.str_names or _is_str(node.value)):
+            self._report(node, AntiPatternConst.STRING_CONCATENATION,
+                         f"'{node.target.id} +=' copies the string on every iteration, "
+                         f"append the parts to a list and ''.join() them after the loop")
+        self.generic_visit(node)
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        value = node.value
+        if self.loops and isinstance(value, ast.BinOp) and isinstance(value.op, ast.Add) and \
+                isinstance(value.left, ast.Name) and value.left.id in self.str_names and \
+                any(isinstance(target, ast.Name) and target.id == value.left.id for target in node.targets):
+            self._report(node, AntiPatternConst.STRING_CONCATENATION,
+                         f"'{value.left.id} = {value.left.id} + ...' copies the string on every iteration, "
+                         f"append the parts to a list and ''.join() them after the loop")
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            if func.attr == "pop" and len(node.args) == 1 and isinstance(node.args[0], ast.Constant) and \
+                    node.args[0].value == 0:
+                self._report(node, AntiPatternConst.LIST_POP_FRONT,
+                             f"{_source(func.value)}.pop(0) shifts every element of a list, "
+                             f"use a collections.deque and popleft()")
+            elif func.attr == "compile" and isinstance(func.value, ast.Name) and func.value.id in REGEX_MODULES \
+                    and func.value.id not in self.local_names:
+                self._report(node, AntiPatternConst.REGEX_COMPILE,
+                             f"{func.value.id}.compile() runs on every call, compile the pattern once at module "
+                             f"level")
+            elif self.loops and func.attr in LIST_METHODS_SCANNING and self._is_list(func.value):
+                self._report(node, AntiPatternConst.QUADRATIC_SCAN,
+                             f"{_source(func.value)}.{func.attr}() scans the list on every iteration, making the "
+                             f"loop quadratic, index the items in a dict or set before the loop")
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        if self._in_tight_loop() and isinstance(node.ctx, ast.Load):
+            dotted = _dotted_name(node)
+            if dotted:
+                parts = dotted.split(".")
+                if len(parts) > 2 or parts[0] not in self.local_names:
+                    self._report(node, AntiPatternConst.REPEATED_LOOKUP,
+                                 f"{dotted} is looked up on every iteration, bind it to a local variable "
+                                 f"before the loop")
+                    return
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if self._in_tight_loop() and isinstance(node.ctx, ast.Load) and node.id not in self.local_names and \
+                not hasattr(builtins, node.id):
+            self._report(node, AntiPatternConst.REPEATED_LOOKUP,
+                         f"global {node.id} is looked up on every iteration, bind it to a local variable "
+                         f"before the loop")
+
+    def _in_tight_loop(self) -> bool:
+        """Whether the innermost enclosing loop is a comprehension or has a small body."""
+        if not self.loops:
+            return False
+        loop = self.loops[-1]
+        return isinstance(loop, ast.comprehension) or len(loop.body) <= TIGHT_LOOP_STATEMENTS
+
+    def _is_list(self, node: ast.AST) -> bool:
+        """Whether an expression is a list literal, list comprehension or a local known to hold a list."""
+        return isinstance(node, (ast.List, ast.ListComp)) or \
+            (isinstance(node, ast.Name) and node.id in self.list_names)
+
+    def _check_nested_scan(self, node: ast.AST, iterable: ast.AST, body: list[ast.AST]) -> None:
+        """Flag an inner loop over a collection that looks for matches of the outer loop items."""
+        if not any(isinstance(loop, (ast.For, ast.AsyncFor, ast.comprehension)) for loop in self.loops):
+            return
+        if not isinstance(iterable, (ast.Name, ast.Attribute, ast.Subscript)):
+            return
+        compares = [child for statement in body for child in ast.walk(statement) if isinstance(child, ast.Compare)]
+        if any(isinstance(operator, (ast.Eq, ast.Is, ast.In)) for compare in compares for operator in compare.ops):
+            self._report(getattr(node, 'target', node), AntiPatternConst.QUADRATIC_SCAN,
+                         f"nested loop over {_source(iterable)} searches it for every outer item, making the scan "
+                         f"quadratic, index it in a dict or set before the outer loop")
+
+
+def _collect_names(function: ast.FunctionDef | ast.AsyncFunctionDef) -> tuple[set[str], set[str], set[str]]:
+    """Names of the function's locals holding lists and strings, and of all its locals."""
+    arguments = function.args
+    local_names = {argument.arg for argument in arguments.posonlyargs + arguments.args + arguments.kwonlyargs}
+    local_names |= {argument.arg for argument in [arguments.vararg, arguments.kwarg] if argument}
+    list_names = set()
+    str_names = set()
+    for node in ast.walk(function):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            local_names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            local_names |= {alias.asname or alias.name.split(".")[0] for alias in node.names}
+        elif isinstance(node, ast.arg):
+            local_names.add(node.arg)
+
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = {target.id for target in targets if isinstance(target, ast.Name)}
+            if _is_list_value(node.value):
+                list_names |= names
+            elif _is_str(node.value):
+                str_names |= names
+    return list_names, str_names, local_names
+
+
+def _is_list_value(node: ast.AST) -> bool:
+    """Whether an expression builds a list."""
+    return isinstance(node, (ast.List, ast.ListComp)) or \
+        (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("list", "sorted"))
+
+
+def _is_str(node: ast.AST) -> bool:
+    """Whether an expression is a string literal, f-string or str() call."""
+    return (isinstance(node, ast.Constant) and isinstance(node.value, str)) or isinstance(node, ast.JoinedStr) or \
+        (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "str")
+
+
+def _dotted_name(node: ast.AST) -> str | None:
+    """Dotted name of an attribute chain on a plain name e.g. self.items.append, None for other expressions."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    return ".".join([node.id] + parts[::-1])
+
+
+def _source(node: ast.AST, max_length: int = 40) -> str:
+    """Short source of an expression for the messages."""
+    source = ast.unparse(node)
+    return source if len(source) <= max_length else source[:max_length - 3] + "..."
+
+
+def _parse_profiled_code(function: dict[str, Any]) -> ast.FunctionDef | ast.AsyncFunctionDef | None:
+    """Parse the function code included in the line profiler output, when its source file is unavailable."""
+    code_lines = [line for line in function['lines'] if line['code']]
+    if not code_lines:
+        return None
+    base_indentation = min(line['indentation'] for line in code_lines)
+    first_line = min(line['line_number'] for line in function['lines'])
+    source = [""] * (max(line['line_number'] for line in function['lines']) - first_line + 1)
+    for line in code_lines:
+        source[line['line_number'] - first_line] = " " * (line['indentation'] - base_indentation) + line['code']
+    try:
+        tree = ast.parse("\n".join(source))
+    except SyntaxError:
+        return None
+    if not tree.body or not isinstance(tree.body[-1], (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return None
+    return ast.increment_lineno(tree.body[-1], first_line - 1)
@@ -0,0 +1,211 @@
+import ast
+import re
+from typing import Any
+
+from line_profiler.line_profiler import LineStats
+from memray import FileReader
+
+from profiling_cli.consts import BUDGET_METRIC_LABELS, BudgetConst
+from profiling_cli.utils.plugin_utils import parse_function_source
+from profiling_cli.utils.timing_utils import format_bytes
+
+# Units accepted in memory budgets, e.g. "50MiB" or "1.5 GB", plain numbers are bytes
+MEMORY_UNITS = {"": 1, "b": 1, "kb": 1000, "kib": 1024, "mb": 1000 ** 2, "mib": 1024 ** 2, "gb": 1000 ** 3,
+                "gib": 1024 ** 3}
+
+# Statements whose first line runs more than once per call
+REPEATED_STATEMENTS = (ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try)
+
+
+def parse_memory_size(value: float | str) -> int:
+    """
+    Convert a memory budget to bytes.
+
+    :param value: Number of bytes or a size with a unit, e.g. "50MiB"
+    :return: Size in bytes
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or match.group(2).lower() not in MEMORY_UNITS:
+        raise ValueError(f"Invalid memory size {value!r}, expected a number of bytes or a size like 50MiB")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).lower()])
+
+
+def normalize_budget(budget: dict[str, Any], owner: str) -> dict[str, float]:
+    """
+    Validate a budget and convert its limits to seconds, percents, bytes and counts.
+
+    :param budget: Limits by name, config style (max-time-per-call) or marker style (max_time_per_call)
+    :param owner: Function or test the budget belongs to, used in error messages
+    :return: Limits keyed by BudgetConst values
+    """
+    normalized = {}
+    for key, value in budget.items():
+        key = key.replace("_", "-")
+        if key not in BUDGET_METRIC_LABELS:
+            raise ValueError(f"Unknown budget {key} for {owner}, expected one of {sorted(BUDGET_METRIC_LABELS)}")
+        normalized[key] = parse_memory_size(value) if key == BudgetConst.MAX_PEAK_MEMORY else float(value)
+    return normalized
+
+
+def estimate_call_counts(stats: LineStats) -> dict[tuple, int]:
+    """
+    Estimate how many times each profiled function was called from its line hits.
+
+    line_profiler does not count calls, but the first top-level statement of a function that is not a loop,
+    with or try header runs exactly once per call, so its hits are the number of calls.
+
+    :param stats: Line profiler stats
+    :return: Estimated number of calls by stats key, functions whose source is unavailable use their first line
+    """
+    calls = {}
+    for key, entries in stats.timings.items():
+        hits = {lineno: nhits for lineno, nhits, _ in entries if nhits}
+        if not hits:
+            continue
+        lineno = _first_statement_line(key[0], key[1])
+        calls[key] = hits[lineno] if lineno in hits else hits[min(hits)]
+    return calls
+
+
+def measure_functions(stats: LineStats, function_names: dict[tuple[str, int], str], total_time: float,
+                      memory: dict[str, dict[str, int]] | None = None) -> dict[str, dict[str, float]]:
+    """
+    Measure the profiled functions against the budget limits.
+
+    :param stats: Line profiler stats
+    :param function_names: Qualified name of every registered function by (file, first line)
+    :param total_time: Wall time the time share is relative to, in seconds
+    :param memory: Peak memory and allocations of the functions as returned by memory_by_function
+    :return: Metrics of each function by qualified name, keyed by the budget limiting them
+    """
+    calls = estimate_call_counts(stats)
+    metrics = {}
+    for key, entries in stats.timings.items():
+        name = function_names.get(key[:2])
+        if name is None:
+            continue
+        seconds = sum(entry[2] for entry in entries) * stats.unit
+        function = {BudgetConst.MAX_TIME_SHARE: 100 * seconds / total_time if total_time else 0.0}
+        if calls.get(key):
+            function[BudgetConst.MAX_TIME_PER_CALL] = seconds / calls[key]
+        metrics[name] = function
+    for name, function_memory in (memory or {}).items():
+        metrics.setdefault(name, {}).update(function_memory)
+    return metrics
+
+
+def memory_by_function(result_files: list[str],
+                       function_names: dict[tuple[str, int], str]) -> dict[str, dict[str, int]]:
+    """
+    Attribute the memory live at the peak of each test to the registered functions on its allocation stacks.
+
+    :param result_files: Memray result files, one per test
+    :param function_names: Qualified name of every registered function by (file, first line)
+    :return: Peak memory and allocations of each function, for the test where it held the most memory
+    """
+    frames = {(filename, name.rsplit(".", 1)[-1]): name for (filename, _), name in function_names.items()}
+    memory = {}
+    for result_file in result_files:
+        test_memory = {}
+        for record in FileReader(result_file).get_high_watermark_allocation_records(merge_threads=True):
+            try:
+                stack = record.stack_trace()
+            except NotImplementedError:
+                continue
+            for name in {frames.get((filename, function)) for function, filename, _ in stack} - {None}:
+                size_and_count = test_memory.setdefault(name, [0, 0])
+                size_and_count[0] += record.size
+                size_and_count[1] += record.n_allocations
+        for name, (size, count) in test_memory.items():
+            if size > memory.get(name, {}).get(BudgetConst.MAX_PEAK_MEMORY, -1):
+                memory[name] = {BudgetConst.MAX_PEAK_MEMORY: size, BudgetConst.MAX_ALLOCATIONS: count}
+    return memory
+
+
+def measure_test(duration: float, total_time: float, result_file: str | None = None) -> dict[str, float]:
+    """
+    Measure a test against the budget limits.
+
+    :param duration: Setup, call and teardown time of the test, in seconds
+    :param total_time: Time of all the tests of the session, in seconds
+    :param result_file: Memray result file of the test, if it ran under memray
+    :return: Metrics of the test, keyed by the budget limiting them
+    """
+    metrics = {BudgetConst.MAX_TIME_PER_CALL: duration,
+               BudgetConst.MAX_TIME_SHARE: 100 * duration / total_time if total_time else 0.0}
+    if result_file:
+        metadata = FileReader(result_file).metadata
+        metrics[BudgetConst.MAX_PEAK_MEMORY] = metadata.peak_memory
+        metrics[BudgetConst.MAX_ALLOCATIONS] = metadata.total_allocations
+    return metrics
+
+
+def check_budget(kind: str, name: str, budget: dict[str, float], metrics: dict[str, float] | None) -> list[dict]:
+    """
+    Compare the measured metrics of a function or test with its budget.
+
+    :param kind: function or test
+    :param name: Qualified function name or test node id
+    :param budget: Normalized budget
+    :param metrics: Measured metrics, None if it never ran
+    :return: One result per limit with kind, name, budget, limit, actual (None if not measured) and exceeded keys
+    """
+    results = []
+    for key, limit in budget.items():
+        actual = (metrics or {}).get(key)
+        results.append({"kind": kind, "name": name, "budget": key, "limit": limit, "actual": actual,
+                        "exceeded": actual is not None and actual > limit})
+    return results
+
+
+def format_budget_report(results: list[dict]) -> str:
+    """
+    Format the budget results as a diff of the limits against the measured values.
+
+    :param results: Results as returned by check_budget
+    :return: Human readable report, exceeded budgets first
+    """
+    exceeded = [result for result in results if result["exceeded"]]
+    unmeasured = [result for result in results if result["actual"] is None]
+    lines = [(f"Performance budgets: {len(exceeded)} exceeded, "
+              f"{len(results) - len(exceeded) - len(unmeasured)} met, {len(unmeasured)} not measured")]
+    for result in sorted(results, key=lambda r: (not r["exceeded"], r["actual"] is None)):
+        label = BUDGET_METRIC_LABELS[result["budget"]]
+        limit = _format_value(result["budget"], result["limit"])
+        if result["actual"] is None:
+            lines.append(f"?          {result['kind']} {result['name']}: {label} not measured (budget {limit})")
+            continue
+        actual = _format_value(result["budget"], result["actual"])
+        change = f" ({100 * (result['actual'] / result['limit'] - 1):+.1f}%)" if result["limit"] else ""
+        status, operator = ("- EXCEEDED", ">") if result["exceeded"] else ("+ ok      ", "<=")
+        lines.append(f"{status} {result['kind']} {result['name']}: {label} {actual} {operator} budget {limit}"
+                     f"{change}")
+    return "\n".join(lines)
+
+
+def _format_value(budget: str, value: float) -> str:
+    """Format a measured value or limit in the unit of its budget."""
+    if budget == BudgetConst.MAX_TIME_PER_CALL:
+        return f"{value * 1000:.3f} ms"
+    if budget == BudgetConst.MAX_TIME_SHARE:
+        return f"{value:.1f}%"
+    if budget == BudgetConst.MAX_PEAK_MEMORY:
+        return format_bytes(value)
+    return f"{int(value)}"
+
+
+def _first_statement_line(filename: str, firstlineno: int) -> int | None:
+    """Line of the first top-level statement of a function that runs once per call, None if unknown."""
+    function = parse_function_source(filename, firstlineno)
+    if function is None:
+        return None
+
+    body = function.body
+    if ast.get_docstring(function, clean=False) is not None:
+        body = body[1:]
+    # Only the first statement surely runs, a later one can be skipped by an early return. The first line of a
+    # multi-line statement can be reported again once its last lines ran, the calls are then overestimated
+    statement = next((statement for statement in body if not isinstance(statement, REPEATED_STATEMENTS)), None)
+    return statement.lineno if statement else None
@@ -1,7 +1,22 @@
-from typing import List
+from typing import List, Any
+import json
+import os
+import shutil
+import signal
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-from profiling_cli.consts import ModelProviderConst
+from profiling_cli.consts import ModelProviderConst, ADDITIONAL_STATS_SECTIONS, RUN_METADATA_FILE, TimerConst, \
+    CPU_LINE_STATS_FILE, LINE_STATS_FILE, TARGETS_DIR, BUDGET_RESULTS_FILE, ANTIPATTERNS_FILE, PROFILE_OUTPUT_DIR, \
+    REPEATS_DIR, PYTEST_LOG_FILE, LINE_STATS_RAW_FILE, CPU_LINE_STATS_RAW_FILE, REPEAT_STATS_FILE, GC_STATS_FILE, \
+    GC_RESULTS_FILE, LEAK_RESULTS_FILE, MEMORY_REPORT_FILE, LINE_TABLE_FILE
+from profiling_cli.utils.antipattern_utils import find_antipatterns, format_antipattern_report
+from profiling_cli.utils.gc_utils import format_gc_comparison
+from profiling_cli.utils.memory_utils import attach_line_memory, load_line_memory
+from profiling_cli.utils.plugin_utils import load_line_stats, write_line_stats, parse_line_profiler_output, \
+    format_profile_data
+from profiling_cli.utils.results_utils import write_line_table
+from profiling_cli.utils.stats_utils import aggregate_line_stats, format_repeat_report
 
 
 def display_process_output(process: subprocess.Popen) -> List[str]:
@@ -38,6 +53,351 @@ def display_process_output(process: subprocess.Popen) -> List[str]:
     return memray_section
 
 
+def run_pytest(cmd: list[str]) -> tuple[int, list[str]]:
+    """
+    Run pytest, displaying its output in real-time while capturing the Memray report.
+
+    :param cmd: The pytest command line
+    :return: Tuple (return code, Memray report lines)
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1  # Line buffered
+    )
+    memray_output = display_process_output(process=process)
+    process.wait()
+    return process.returncode, memray_output
+
+
+def run_profiled_program(cmd: list[str]) -> int:
+    """
+    Run a profiled program in the foreground until it ends and saves its results.
+
+    An interrupt (Ctrl+C) reaches the program too, which stops and saves its results, the CLI waits for it and goes
+    on with the analysis. A terminate signal sent to the CLI is forwarded to the program.
+
+    :param cmd: The command line of the program runner
+    :return: The return code of the program
+    """
+    process = subprocess.Popen(cmd)
+    previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: process.send_signal(signum))
+    try:
+        while True:
+            try:
+                return process.wait()
+            except KeyboardInterrupt:
+                continue
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+
+
+def run_pytest_pass(cmd: list[str], run_dir: str, env: dict[str, str] | None = None) -> int:
+    """
+    Run a pytest pass profiling into its own directory, its output is logged there instead of displayed.
+
+    :param cmd: The pytest command line
+    :param run_dir: Output directory of the pass
+    :param env: Optional environment variables overriding the current ones
+    :return: The return code of the pass
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, PYTEST_LOG_FILE), 'w') as log:
+        returncode = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, check=False,
+                                    env={**os.environ, **(env or {}), PROFILE_OUTPUT_DIR: run_dir}).returncode
+    print(f"Profiling pass {os.path.basename(run_dir)} finished with exit code {returncode}")
+    return returncode
+
+
+def default_jobs(repeat: int) -> int:
+    """
+    Number of pytest passes to run at once, half the CPUs so that concurrent passes do not slow each other down.
+
+    :param repeat: Number of measured passes
+    :return: Number of parallel processes, at least 1
+    """
+    return max(1, min(repeat, (os.cpu_count() or 1) // 2))
+
+
+def run_repeated_pytest(cmd: list[str], output_dir: str, repeat: int, warmup: int = 0,
+                        jobs: int = 1) -> tuple[int, list[str], list[str]]:
+    """
+    Run independent pytest passes in parallel processes, each one profiling into its own directory.
+
+    Warmup passes run first and are discarded, they warm the bytecode, file system and import caches the measured
+    passes then share. The output of the first measured pass is displayed, the others are kept in their logs.
+
+    :param cmd: The pytest command line
+    :param output_dir: The profiling output directory, passes write to its repeats subdirectory
+    :param repeat: Number of measured passes
+    :param warmup: Number of warmup passes
+    :param jobs: Number of passes running at once
+    :return: Tuple (return code of the first failing measured pass or 0, Memray report lines of the first
+             measured pass, output directories of the measured passes)
+    """
+    repeats_dir = os.path.abspath(os.path.join(output_dir, REPEATS_DIR))
+    warmup_dirs = [os.path.join(repeats_dir, f"warmup_{index}") for index in range(warmup)]
+    run_dirs = [os.path.join(repeats_dir, f"run_{index}") for index in range(repeat)]
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(lambda run_dir: run_pytest_pass(cmd, run_dir), warmup_dirs))
+        returncodes = list(executor.map(lambda run_dir: run_pytest_pass(cmd, run_dir), run_dirs))
+
+    with open(os.path.join(run_dirs[0], PYTEST_LOG_FILE)) as f:
+        output = f.readlines()
+    memray_start = next((index for index, line in enumerate(output) if "MEMRAY REPORT" in line), len(output))
+    print("".join(output[:memray_start]), end='')
+    return next((returncode for returncode in returncodes if returncode), 0), output[memray_start:], run_dirs
+
+
+def combine_repeated_runs(run_dirs: list[str], output_dir: str) -> str | None:
+    """
+    Write the median line stats of repeated passes to the output directory, with their statistics report.
+
+    The other results (memory, budgets, breakdowns) are those of the first pass, the anti-pattern findings are
+    computed again on the median stats.
+
+    :param run_dirs: Output directories of the measured passes
+    :param output_dir: The profiling output directory
+    :return: The statistics report, or None if no pass saved its stats
+    """
+    for file_name in os.listdir(run_dirs[0]):
+        if os.path.isfile(os.path.join(run_dirs[0], file_name)):
+            shutil.copy2(os.path.join(run_dirs[0], file_name), output_dir)
+
+    cpu_paths = [os.path.join(run_dir, CPU_LINE_STATS_RAW_FILE) for run_dir in run_dirs]
+    if all(os.path.exists(path) for path in cpu_paths):
+        cpu_aggregate = aggregate_line_stats([load_line_stats(path) for path in cpu_paths])
+        write_line_stats(cpu_aggregate["stats"], os.path.join(output_dir, CPU_LINE_STATS_FILE))
+
+    stats_paths = [os.path.join(run_dir, LINE_STATS_RAW_FILE) for run_dir in run_dirs]
+    if not all(os.path.exists(path) for path in stats_paths):
+        return None
+    aggregate = aggregate_line_stats([load_line_stats(path) for path in stats_paths])
+    stats_file = os.path.join(output_dir, LINE_STATS_FILE)
+    write_line_stats(aggregate["stats"], stats_file)
+    report = format_repeat_report(aggregate)
+    with open(os.path.join(output_dir, REPEAT_STATS_FILE), 'w') as f:
+        f.write(report)
+
+    with open(stats_file) as f:
+        _, profile_data = parse_line_profiler_output(f.read())
+    with open(os.path.join(output_dir, ANTIPATTERNS_FILE), 'w') as f:
+        f.write(format_antipattern_report(find_antipatterns(profile_data)))
+    write_line_table(output_dir)
+    return report
+
+
+def compare_gc_runs(output_dir: str, tuned_dir: str) -> str | None:
+    """
+    Compare the garbage collection of the profiling run with the one of a pass with tuned GC settings, the
+    comparison is appended to the GC report of the profiling run.
+
+    :param output_dir: The profiling output directory
+    :param tuned_dir: Output directory of the pass with tuned GC settings
+    :return: The comparison, or None if either run did not record its collections
+    """
+    results = []
+    for run_dir in (output_dir, tuned_dir):
+        results_path = os.path.join(run_dir, GC_RESULTS_FILE)
+        if not os.path.exists(results_path):
+            return None
+        with open(results_path) as f:
+            results.append(json.load(f))
+    comparison = format_gc_comparison(*results)
+    with open(os.path.join(output_dir, GC_STATS_FILE), 'a') as f:
+        f.write(f"\n\n{comparison}")
+    return comparison
+
+
+def filter_line_stats_text(stats_text: str, min_percent_time: float) -> str:
+    """
+    Drop the lines of a line_profiler text report that took less than a share of their function's time.
+
+    :param stats_text: Stats in line_profiler text format
+    :param min_percent_time: Lines under this % Time are dropped, along with lines that never ran
+    :return: The filtered report, unchanged when the threshold is 0
+    """
+    if min_percent_time <= 0:
+        return stats_text
+    kept = []
+    for line in stats_text.splitlines():
+        parts = line.split()
+        if parts and parts[0].isdigit():
+            try:
+                if float(parts[4]) < min_percent_time:
+                    continue
+            except (IndexError, ValueError):
+                # Lines that never ran have no metrics
+                continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def build_batch_report(targets: list[dict[str, Any]], output_dir: str, memray_output: list[str]) -> str:
+    """
+    Combine the line stats of every batch profiling target into a single report.
+
+    :param targets: Targets as returned by config_utils.load_profiling_targets
+    :param output_dir: The profiling output directory
+    :param memray_output: Memray report lines of the shared pytest session
+    :return: Human readable report, followed by the additional results of the session
+    """
+    line_memory = load_line_memory(output_dir)
+    sections = []
+    for target in targets:
+        header = (f"=== Target {target['name']} ===\n"
+                  f"Tests: {', '.join(target['tests'])}\n"
+                  f"Modules: {', '.join(target['modules'])}\n"
+                  f"Functions: {', '.join(target['functions']) or 'all public functions'}")
+        if target['min_percent_time']:
+            header += f"\nLines under {target['min_percent_time']}% of their function's time are omitted"
+        stats_path = os.path.join(output_dir, TARGETS_DIR, target['name'], LINE_STATS_FILE)
+        stats_text = ""
+        if os.path.exists(stats_path):
+            with open(stats_path) as f:
+                stats_text = filter_line_stats_text(f.read(), target['min_percent_time']).strip()
+            if line_memory and stats_text:
+                # The time and the memory of every line in one table
+                _, profile_data = parse_line_profiler_output(stats_text)
+                attach_line_memory(profile_data, line_memory)
+                stats_text = format_profile_data(profile_data)
+        sections.append(f"{header}\n\n{stats_text or 'No profiled function ran during the target tests'}")
+    if memray_output:
+        sections.append("=== Memory profiler results (all targets) ===\n" + "".join(memray_output).strip())
+    for title, content in load_additional_stats(output_dir).items():
+        sections.append(f"=== {title.capitalize()} ===\n{content.strip()}")
+    return "\n\n".join(sections) + "\n"
+
+
+def load_additional_stats(output_dir: str) -> dict[str, str]:
+    """
+    Load the optional result files the plugin wrote next to the line profiler stats.
+
+    :param output_dir: The profiling output directory
+    :return: Mapping of section title to file content, for every result file that exists
+    """
+    additional_stats = {}
+    for file_name, title in ADDITIONAL_STATS_SECTIONS.items():
+        file_path = os.path.join(output_dir, file_name)
+        if os.path.exists(file_path):
+            with open(file_path) as f:
+                additional_stats[title] = f.read()
+    return additional_stats
+
+
+def load_run_metadata(output_dir: str) -> dict[str, Any]:
+    """
+    Load the metadata the plugin recorded about how the run was measured.
+
+    :param output_dir: The profiling output directory
+    :return: The run metadata, e.g. {"timer": "wall"}
+    """
+    metadata_path = os.path.join(output_dir, RUN_METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return {"timer": TimerConst.WALL}
+    with open(metadata_path) as f:
+        return json.load(f)
+
+
+def load_cpu_line_stats(output_dir: str) -> str | None:
+    """
+    Load the CPU time line stats written when both timers are used.
+
+    :param output_dir: The profiling output directory
+    :return: The CPU time stats in line_profiler text format, or None if they were not measured
+    """
+    stats_path = os.path.join(output_dir, CPU_LINE_STATS_FILE)
+    if not os.path.exists(stats_path):
+        return None
+    with open(stats_path) as f:
+        return f.read()
+
+
+def load_antipattern_report(output_dir: str) -> str | None:
+    """
+    Load the static anti-pattern findings on the hot lines.
+
+    :param output_dir: The profiling output directory
+    :return: The findings report, or None if the plugin did not write one
+    """
+    report_path = os.path.join(output_dir, ANTIPATTERNS_FILE)
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path) as f:
+        return f.read()
+
+
+def load_memory_report(output_dir: str) -> list[str]:
+    """
+    Load the memory report of a profiled program.
+
+    :param output_dir: The profiling output directory
+    :return: The report lines, as captured from the pytest-memray report, empty if the memory was not tracked
+    """
+    report_path = os.path.join(output_dir, MEMORY_REPORT_FILE)
+    if not os.path.exists(report_path):
+        return []
+    with open(report_path) as f:
+        return f.readlines()
+
+
+def load_line_table(output_dir: str) -> str | None:
+    """
+    Load the table joining the time and the memory of every profiled line.
+
+    :param output_dir: The profiling output directory
+    :return: The table, or None if no line stats were saved
+    """
+    table_path = os.path.join(output_dir, LINE_TABLE_FILE)
+    if not os.path.exists(table_path):
+        return None
+    with open(table_path) as f:
+        return f.read()
+
+
+def load_budget_results(output_dir: str) -> dict[str, Any] | None:
+    """
+    Load the performance budget results written by the plugin.
+
+    :param output_dir: The profiling output directory
+    :return: Dict with tests_exit_status, exceeded and results keys, or None if no budget was checked
+    """
+    results_path = os.path.join(output_dir, BUDGET_RESULTS_FILE)
+    if not os.path.exists(results_path):
+        return None
+    with open(results_path) as f:
+        return json.load(f)
+
+
+def load_leak_results(output_dir: str) -> dict[str, Any] | None:
+    """
+    Load the memory growth results written by the plugin.
+
+    :param output_dir: The profiling output directory
+    :return: Dict with tests_exit_status, exceeded, threshold and results keys, or None if the growth was not checked
+    """
+    results_path = os.path.join(output_dir, LEAK_RESULTS_FILE)
+    if not os.path.exists(results_path):
+        return None
+    with open(results_path) as f:
+        return json.load(f)
+
+
+def budgets_exceeded(returncode: int, budget_results: dict[str, Any] | None) -> bool:
+    """
+    Check whether pytest only failed because performance budgets, or the memory growth threshold, were exceeded.
+
+    :param returncode: The pytest exit code
+    :param budget_results: Results as returned by load_budget_results or load_leak_results
+    :return: True when the tests passed but at least one budget was exceeded
+    """
+    return bool(returncode != 0 and budget_results and budget_results["exceeded"]
+                and budget_results["tests_exit_status"] == 0)
+
+
 # Define available actions the LLM can recognize and perform
 actions = {
     "create_pr": {
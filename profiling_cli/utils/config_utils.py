@@ -0,0 +1,134 @@
+import sys
+from pathlib import Path
+from typing import Any
+
+from profiling_cli.consts import PROJECT_CONFIG_TABLE
+from profiling_cli.utils.budget_utils import normalize_budget
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+# Keys a profiling target may declare in the project config
+TARGET_KEYS = {"name", "tests", "modules", "functions", "min-percent-time"}
+
+
+def find_pyproject(start_path: Path | None = None) -> Path | None:
+    """
+    Find the closest pyproject.toml, starting from the given path and climbing up the directory tree.
+
+    :param start_path: Path to start the search from. If None, uses current working directory.
+    :return: Path to the pyproject.toml if found, None otherwise.
+    """
+    start_path = Path(start_path or Path.cwd()).resolve()
+    for directory in [start_path] + list(start_path.parents):
+        pyproject = directory / "pyproject.toml"
+        if pyproject.is_file():
+            return pyproject
+    return None
+
+
+def load_project_config(pyproject_path: Path | str | None = None) -> dict[str, Any]:
+    """
+    Load the profiling-cli table of a pyproject.toml.
+
+    :param pyproject_path: Path to the pyproject.toml, auto detected from the current directory if not provided
+    :return: The [tool.profiling-cli] table, empty if there is none
+    """
+    pyproject_path = Path(pyproject_path) if pyproject_path else find_pyproject()
+    if pyproject_path is None:
+        return {}
+    with open(pyproject_path, "rb") as f:
+        pyproject = tomllib.load(f)
+    return pyproject.get("tool", {}).get(PROJECT_CONFIG_TABLE, {})
+
+
+def load_profiling_targets(project_config: dict[str, Any], base_dir: Path | str,
+                           names: tuple[str, ...] = ()) -> list[dict[str, Any]]:
+    """
+    Read and validate the profiling targets declared in the project config.
+
+    Each target declares the tests to run, the modules and functions to profile while running them and an
+    optional min-percent-time threshold under which lines are left out of the report:
+
+        [[tool.profiling-cli.targets]]
+        name = "parser"
+        tests = ["tests/test_parser.py"]
+        modules = ["mypkg.parser"]
+        functions = ["parse", "Parser.feed"]
+        min-percent-time = 5.0
+
+    :param project_config: The [tool.profiling-cli] table
+    :param base_dir: Directory relative test paths are resolved against, usually the pyproject.toml directory
+    :param names: Only return the targets with these names, all targets if empty
+    :return: One dict per target with name, tests (absolute paths), modules, functions and min_percent_time keys
+    """
+    raw_targets = project_config.get("targets", [])
+    if not isinstance(raw_targets, list) or not raw_targets:
+        raise ValueError(f"No profiling targets found, declare them as [[tool.{PROJECT_CONFIG_TABLE}.targets]]")
+
+    targets = []
+    for index, raw_target in enumerate(raw_targets):
+        unknown_keys = set(raw_target) - TARGET_KEYS
+        if unknown_keys:
+            raise ValueError(f"Unknown keys {sorted(unknown_keys)} in profiling target {index + 1}")
+        name = raw_target.get("name") or f"target_{index + 1}"
+        if any(target["name"] == name for target in targets):
+            raise ValueError(f"Duplicate profiling target name {name}")
+        if not raw_target.get("modules"):
+            raise ValueError(f"Profiling target {name} must declare the modules to profile")
+
+        tests = raw_target.get("tests", [])
+        tests = [tests] if isinstance(tests, str) else tests
+        if not tests:
+            raise ValueError(f"Profiling target {name} must declare the tests to run")
+
+        targets.append({
+            "name": name,
+            "tests": [_resolve_test_path(test, base_dir) for test in tests],
+            "modules": list(raw_target["modules"]),
+            "functions": list(raw_target.get("functions", [])),
+            "min_percent_time": float(raw_target.get("min-percent-time", 0.0))
+        })
+
+    if names:
+        missing = set(names) - {target["name"] for target in targets}
+        if missing:
+            raise ValueError(f"Unknown profiling targets {sorted(missing)}")
+        targets = [target for target in targets if target["name"] in names]
+    return targets
+
+
+def load_budgets(project_config: dict[str, Any], base_dir: Path | str) -> dict[str, dict[str, dict[str, float]]]:
+    """
+    Read and validate the performance budgets declared in the project config.
+
+    Functions are keyed by their qualified name, tests by path, optionally followed by ::test_name:
+
+        [tool.profiling-cli.budgets.functions]
+        "mypkg.parser.parse" = { max-time-per-call = 0.002, max-time-share = 40 }
+
+        [tool.profiling-cli.budgets.tests]
+        "tests/test_parser.py::test_big_file" = { max-peak-memory = "50MiB", max-allocations = 10000 }
+
+    :param project_config: The [tool.profiling-cli] table
+    :param base_dir: Directory relative test paths are resolved against, usually the pyproject.toml directory
+    :return: Dict with functions and tests keys, mapping each one to its normalized budget
+    """
+    raw_budgets = project_config.get("budgets", {})
+    unknown_keys = set(raw_budgets) - {"functions", "tests"}
+    if unknown_keys:
+        raise ValueError(f"Unknown budget tables {sorted(unknown_keys)}, expected functions and tests")
+    return {
+        "functions": {name: normalize_budget(budget, f"function {name}")
+                      for name, budget in raw_budgets.get("functions", {}).items()},
+        "tests": {_resolve_test_path(test, base_dir): normalize_budget(budget, f"test {test}")
+                  for test, budget in raw_budgets.get("tests", {}).items()}
+    }
+
+
+def _resolve_test_path(test: str, base_dir: Path | str) -> str:
+    """Make a test path, optionally followed by ::test_name, absolute."""
+    path, separator, test_name = test.partition("::")
+    return str((Path(base_dir) / path).resolve()) + separator + test_name
@@ -0,0 +1,99 @@
+import functools
+import importlib
+import inspect
+import sys
+from collections.abc import Callable
+from typing import Any
+
+
+class EntryPointGate:
+    """
+    Turns a profiler on only while an entry-point function runs, so that the registered functions only record the
+    calls made on its behalf. Outside of it the profiler stays off and the registered functions run at full speed.
+
+    The gate is closed outside of the tests, an entry point called then runs without profiling. Coroutine entry
+    points keep the profiler on while they are suspended, other tasks running meanwhile are recorded too.
+    """
+
+    def __init__(self, profiler: Any):
+        """
+        :param profiler: Profiler exposing enable_by_count and disable_by_count e.g. LineProfiler
+        """
+        self.profiler = profiler
+        self.open = False
+
+    def install(self, names: list[str]) -> None:
+        """
+        Replace the entry-point functions with gated wrappers, wherever a module already holds a reference to them.
+
+        :param names: Qualified names, module.function or module.Class.method
+        :return: None
+        :raises ValueError: If an entry point cannot be found
+        :raises TypeError: If an entry point is not a function
+        """
+        for name in names:
+            owner, attribute = resolve_entry_point(name)
+            raw = inspect.getattr_static(owner, attribute)
+            if isinstance(raw, (staticmethod, classmethod)):
+                setattr(owner, attribute, type(raw)(self._wrap(raw.__func__)))
+                continue
+            function = getattr(owner, attribute)
+            if not callable(function):
+                raise TypeError(f"Entry point {name} is not a function")
+            wrapper = self._wrap(function)
+            setattr(owner, attribute, wrapper)
+            # Modules that imported the function by name before the plugin loaded call it through their own reference
+            for module in list(sys.modules.values()):
+                for module_attribute, value in list(getattr(module, "__dict__", {}).items()):
+                    if value is function:
+                        setattr(module, module_attribute, wrapper)
+
+    def _wrap(self, function: Callable) -> Callable:
+        """Wrapper enabling the profiler while the function runs, when the gate is open."""
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not self.open:
+                    return await function(*args, **kwargs)
+                self.profiler.enable_by_count()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.profiler.disable_by_count()
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not self.open:
+                return function(*args, **kwargs)
+            self.profiler.enable_by_count()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.profiler.disable_by_count()
+        return wrapper
+
+
+def resolve_entry_point(name: str) -> tuple[Any, str]:
+    """
+    Find the object holding an entry-point function.
+
+    :param name: Qualified name, module.function or module.Class.method
+    :return: Tuple (module or class, attribute name of the function)
+    :raises ValueError: If the entry point cannot be found
+    """
+    parts = name.split(".")
+    for index in range(len(parts) - 1, 0, -1):
+        try:
+            owner = importlib.import_module(".".join(parts[:index]))
+        except ImportError:
+            continue
+        try:
+            for part in parts[index:-1]:
+                owner = getattr(owner, part)
+        except AttributeError:
+            break
+        if hasattr(owner, parts[-1]):
+            return owner, parts[-1]
+        break
+    raise ValueError(f"Could not find the entry point {name}, expected module.function or module.Class.method")
@@ -0,0 +1,193 @@
+import gc
+import sys
+import threading
+import time
+from typing import Any
+
+# Number of entries listed in each part of the report
+TOP_ENTRIES = 10
+
+
+class GCRecorder:
+    """
+    Records every garbage collection with gc.callbacks: generation, pause, objects collected and uncollectable,
+    attributed to the running test and to the innermost registered function on the stack of the collecting thread.
+    """
+
+    def __init__(self, registered_functions: dict[tuple[str, int], str]):
+        """
+        :param registered_functions: Qualified name of every registered function by (file, first line)
+        """
+        self.registered_functions = registered_functions
+        self.current_test = None
+        self.collections = []
+        self._started = {}
+
+    def start(self) -> None:
+        """Start recording collections."""
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def stop(self) -> None:
+        """Stop recording collections."""
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+    def _callback(self, phase: str, info: dict[str, int]) -> None:
+        if phase == "start":
+            self._started[threading.get_ident()] = (time.perf_counter(), self.current_test,
+                                                    self._innermost_function())
+            return
+        started = self._started.pop(threading.get_ident(), None)
+        if started is None:
+            return
+        start_time, test, function = started
+        self.collections.append({"generation": info["generation"], "seconds": time.perf_counter() - start_time,
+                                 "collected": info["collected"], "uncollectable": info["uncollectable"],
+                                 "test": test, "function": function})
+
+    def _innermost_function(self) -> str | None:
+        """Qualified name of the innermost registered function on the stack, None if none is running."""
+        frame = sys._getframe(2)
+        while frame is not None:
+            name = self.registered_functions.get((frame.f_code.co_filename, frame.f_code.co_firstlineno))
+            if name is not None:
+                return name
+            frame = frame.f_back
+        return None
+
+
+def apply_gc_settings(threshold: str | None, freeze: bool) -> None:
+    """
+    Apply tuned garbage collector settings.
+
+    :param threshold: Comma separated thresholds of the generations, e.g. "50000,20,20"
+    :param freeze: Whether to move every object alive now to the permanent generation, out of later collections
+    :return: None
+    """
+    if threshold:
+        gc.set_threshold(*parse_gc_threshold(threshold))
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+
+def parse_gc_threshold(threshold: str) -> tuple[int, ...]:
+    """
+    :param threshold: Comma separated thresholds, e.g. "50000,20,20", one to three values
+    :return: The thresholds
+    """
+    try:
+        values = tuple(int(value) for value in threshold.split(","))
+    except ValueError:
+        values = ()
+    if not 1 <= len(values) <= 3 or any(value < 0 for value in values):
+        raise ValueError(f"Invalid GC threshold {threshold!r}, expected up to three comma separated integers")
+    return values
+
+
+def summarize_gc(collections: list[dict[str, Any]], test_durations: dict[str, float]) -> dict[str, Any]:
+    """
+    Summarize the recorded collections.
+
+    The time share only counts the pauses while tests ran, those during the imports and the test collection are
+    startup costs.
+
+    :param collections: Collections as recorded by GCRecorder
+    :param test_durations: Setup, call and teardown time of every test, in seconds
+    :return: Dict with settings, collections, seconds, test_collections, test_gc_seconds, test_seconds, time_share,
+             generations (collections, seconds, collected and uncollectable by generation), tests, functions
+             (collections, seconds and share by name, slowest first) and slowest (longest pauses) keys
+    """
+    test_seconds = sum(test_durations.values())
+    total = sum(collection["seconds"] for collection in collections)
+    during_tests = [collection for collection in collections if collection["test"] is not None]
+    test_gc_seconds = sum(collection["seconds"] for collection in during_tests)
+    generations = {}
+    tests = {}
+    functions = {}
+    for collection in collections:
+        generation = generations.setdefault(str(collection["generation"]), {"collections": 0, "seconds": 0.0,
+                                                                            "collected": 0, "uncollectable": 0})
+        generation["collections"] += 1
+        generation["seconds"] += collection["seconds"]
+        generation["collected"] += collection["collected"]
+        generation["uncollectable"] += collection["uncollectable"]
+        for owners, owner in ((tests, collection["test"]), (functions, collection["function"])):
+            if owner is not None:
+                entry = owners.setdefault(owner, {"collections": 0, "seconds": 0.0})
+                entry["collections"] += 1
+                entry["seconds"] += collection["seconds"]
+    for test, entry in tests.items():
+        entry["share"] = 100 * entry["seconds"] / test_durations[test] if test_durations.get(test) else 0.0
+    for entry in functions.values():
+        entry["share"] = 100 * entry["seconds"] / total if total else 0.0
+    return {"settings": {"threshold": list(gc.get_threshold()), "frozen": gc.get_freeze_count()},
+            "collections": len(collections), "seconds": total, "test_collections": len(during_tests),
+            "test_gc_seconds": test_gc_seconds, "test_seconds": test_seconds,
+            "time_share": 100 * test_gc_seconds / test_seconds if test_seconds else 0.0, "generations": generations,
+            "tests": _slowest(tests), "functions": _slowest(functions),
+            "slowest": sorted(collections, key=lambda collection: -collection["seconds"])[:TOP_ENTRIES]}
+
+
+def format_gc_report(summary: dict[str, Any]) -> str:
+    """
+    Format the garbage collection summary.
+
+    :param summary: Summary as returned by summarize_gc
+    :return: Human readable report
+    """
+    settings = summary["settings"]
+    lines = [(f"Garbage collection: {summary['collections']} collections, {_ms(summary['seconds'])} paused "
+              f"(thresholds {tuple(settings['threshold'])}, {settings['frozen']} frozen objects)"),
+             (f"    while tests ran: {summary['test_collections']} collections, {_ms(summary['test_gc_seconds'])}, "
+              f"{summary['time_share']:.1f}% of the {summary['test_seconds']:.3f} s of tests")]
+    for generation, entry in sorted(summary["generations"].items()):
+        lines.append(f"    generation {generation}: {entry['collections']} collections, {_ms(entry['seconds'])}, "
+                     f"{entry['collected']} objects collected, {entry['uncollectable']} uncollectable")
+    if summary["tests"]:
+        lines += ["", "GC pauses by test (share of the test's time):"]
+        lines += [f"    {_ms(entry['seconds'])}  {entry['share']:5.1f}%  {entry['collections']} collections  {name}"
+                  for name, entry in summary["tests"].items()]
+    if summary["functions"]:
+        lines += ["", "GC pauses by innermost profiled function on the stack (share of all GC time):"]
+        lines += [f"    {_ms(entry['seconds'])}  {entry['share']:5.1f}%  {entry['collections']} collections  {name}"
+                  for name, entry in summary["functions"].items()]
+    if summary["slowest"]:
+        lines += ["", "Longest pauses:"]
+        lines += [f"    {_ms(collection['seconds'])}  generation {collection['generation']}, "
+                  f"{collection['collected']} collected, in {collection['function'] or 'no profiled function'} "
+                  f"({collection['test'] or 'outside of tests'})"
+                  for collection in summary["slowest"]]
+    return "\n".join(lines)
+
+
+def format_gc_comparison(baseline: dict[str, Any], tuned: dict[str, Any]) -> str:
+    """
+    Compare the garbage collection of a run with default settings and a run with tuned settings.
+
+    :param baseline: Summary of the run with the default settings, as returned by summarize_gc
+    :param tuned: Summary of the run with the tuned settings
+    :return: Human readable comparison
+    """
+    lines = [(f"Tuned GC settings (thresholds {tuple(tuned['settings']['threshold'])}, "
+              f"{tuned['settings']['frozen']} frozen objects) vs default "
+              f"(thresholds {tuple(baseline['settings']['threshold'])}):")]
+    for key, label, formatter in (("test_collections", "collections while tests ran", str),
+                                  ("test_gc_seconds", "GC pauses while tests ran", _ms),
+                                  ("time_share", "GC time share", lambda value: f"{value:.1f}%"),
+                                  ("test_seconds", "test time", lambda value: f"{value:.3f} s")):
+        change = f" ({100 * (tuned[key] / baseline[key] - 1):+.1f}%)" if baseline[key] else ""
+        lines.append(f"    {label}: {formatter(baseline[key])} -> {formatter(tuned[key])}{change}")
+    return "\n".join(lines)
+
+
+def _slowest(entries: dict[str, dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """The entries with the most GC time."""
+    return dict(sorted(entries.items(), key=lambda item: -item[1]["seconds"])[:TOP_ENTRIES])
+
+
+def _ms(seconds: float) -> str:
+    """Format seconds as milliseconds."""
+    return f"{seconds * 1000:.3f} ms"
+
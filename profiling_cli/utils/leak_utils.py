@@ -0,0 +1,149 @@
+import gc
+import math
+import os
+import tracemalloc
+from collections.abc import Callable
+from itertools import pairwise
+from typing import Any
+
+from profiling_cli.utils.selection_utils import function_spans
+from profiling_cli.utils.timing_utils import format_bytes
+
+# Frames kept per allocation, enough to reach the registered functions from deep library code
+LEAK_STACK_DEPTH = 25
+# Share of the iterations a site must grow in to be a steady grower rather than a cache filling up once
+STEADY_GROWTH_SHARE = 0.8
+# Number of allocation sites reported per test
+TOP_SITES = 10
+
+# Allocations of the snapshots themselves and of the import machinery are not the test's
+SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<unknown>"),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")]
+
+
+def track_heap_growth(run_once: Callable[[], Any], iterations: int,
+                      warmup: int = 0) -> dict[tuple[tuple[str, int], ...], list[int]]:
+    """
+    Run a test body repeatedly in the current process and measure the memory each allocation site retains.
+
+    A heap snapshot is taken after a full collection before the first measured iteration and after every one, so
+    memory allocated and freed within an iteration does not count, however large.
+
+    :param run_once: Runs one iteration of the test body
+    :param iterations: Number of measured iterations
+    :param warmup: Number of iterations run first, to fill the caches the code legitimately keeps
+    :return: Size retained by every allocation site, keyed by its stack ((file, line) innermost first), after each
+             of the iterations + 1 snapshots
+    """
+    # Tracing slows down all the code that runs, it only lasts for the check unless it was already on
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(LEAK_STACK_DEPTH)
+    try:
+        for _ in range(warmup):
+            run_once()
+        sizes = {}
+        for index in range(iterations + 1):
+            if index:
+                run_once()
+            gc.collect()
+            snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            for statistic in snapshot.statistics("traceback"):
+                # Traceback frames go from the oldest to the most recent
+                key = tuple((frame.filename, frame.lineno) for frame in reversed(statistic.traceback))
+                sizes.setdefault(key, [0] * (iterations + 1))[index] = statistic.size
+            del snapshot
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return sizes
+
+
+def find_growing_sites(sizes: dict[tuple[tuple[str, int], ...], list[int]],
+                       steady_share: float = STEADY_GROWTH_SHARE) -> list[dict[str, Any]]:
+    """
+    Allocation sites whose retained memory grows steadily from iteration to iteration.
+
+    :param sizes: Retained sizes as returned by track_heap_growth
+    :param steady_share: Share of the iterations a site must grow in
+    :return: Sites by decreasing growth, with stack, sizes, growth (bytes over all iterations), per_iteration and
+             grown_iterations keys
+    """
+    sites = []
+    for stack, site_sizes in sizes.items():
+        iterations = len(site_sizes) - 1
+        growth = site_sizes[-1] - site_sizes[0]
+        grown = sum(after > before for before, after in pairwise(site_sizes))
+        if growth > 0 and grown >= math.ceil(steady_share * iterations):
+            sites.append({"stack": list(stack), "sizes": site_sizes, "growth": growth,
+                          "per_iteration": growth / iterations, "grown_iterations": grown})
+    return sorted(sites, key=lambda site: -site["growth"])
+
+
+def attribute_sites(sites: list[dict[str, Any]], registered_functions: dict[tuple[str, int], str]) -> None:
+    """
+    Add the innermost registered function on the stack of every site, under the function key (None if there is
+    none).
+
+    :param sites: Sites as returned by find_growing_sites, updated in place
+    :param registered_functions: Qualified name of every registered function by (file, first line)
+    :return: None
+    """
+    spans = {}
+    for filename in {filename for filename, _ in registered_functions}:
+        spans[filename] = [(first, last, registered_functions[(filename, first)])
+                           for _, first, last in function_spans(filename) if (filename, first) in registered_functions]
+    for site in sites:
+        site["function"] = None
+        for filename, lineno in site["stack"]:
+            # Nested functions are listed after the function containing them, the last match is the innermost one
+            matches = [name for first, last, name in spans.get(filename, []) if first <= lineno <= last]
+            if matches:
+                site["function"] = matches[-1]
+                break
+
+
+def summarize_test_growth(nodeid: str, sites: list[dict[str, Any]], iterations: int, warmup: int,
+                          threshold: int | None = None) -> dict[str, Any]:
+    """
+    Summarize the steady growth of a test.
+
+    :param nodeid: The test
+    :param sites: Its steadily growing sites, attributed with attribute_sites
+    :param iterations: Number of measured iterations
+    :param warmup: Number of warmup iterations
+    :param threshold: Optional growth per iteration, in bytes, over which the test leaks
+    :return: Dict with test, iterations, warmup, per_iteration (bytes), threshold, exceeded and sites (the
+             largest ones) keys
+    """
+    per_iteration = sum(site["per_iteration"] for site in sites)
+    return {"test": nodeid, "iterations": iterations, "warmup": warmup, "per_iteration": per_iteration,
+            "threshold": threshold, "exceeded": threshold is not None and per_iteration > threshold,
+            "sites": sites[:TOP_SITES]}
+
+
+def format_leak_report(results: list[dict[str, Any]]) -> str:
+    """
+    Format the steady memory growth of the tests.
+
+    :param results: Tests as returned by summarize_test_growth
+    :return: Human readable report, growing tests first
+    """
+    results = sorted(results, key=lambda result: -result["per_iteration"])
+    growing = [result for result in results if result["sites"]]
+    lines = [(f"Memory growth across repeated iterations: {len(growing)} of {len(results)} tests retain more memory "
+              f"at every iteration")]
+    for result in growing:
+        status = "EXCEEDED" if result["exceeded"] else "grows"
+        threshold = f" > threshold {format_bytes(result['threshold'])}" if result["exceeded"] else ""
+        lines += ["", (f"{status} {result['test']}: {format_bytes(result['per_iteration'])} per iteration{threshold} "
+                       f"over {result['iterations']} iterations after {result['warmup']} warmup")]
+        for site in result["sites"]:
+            filename, lineno = site["stack"][0]
+            lines.append(f"    +{format_bytes(site['per_iteration'])}/iteration, grew in {site['grown_iterations']} "
+                         f"of {len(site['sizes']) - 1}: {os.path.basename(filename)}:{lineno} in "
+                         f"{site['function'] or 'no profiled function'}")
+            lines += [f"        {os.path.basename(frame_file)}:{frame_line}"
+                      for frame_file, frame_line in site["stack"][1:4]]
+    return "\n".join(lines)
@@ -0,0 +1,112 @@
+import json
+import os
+from typing import Any
+
+from memray import FileReader
+
+from profiling_cli.consts import LINE_MEMORY_FILE
+from profiling_cli.utils.selection_utils import function_spans
+
+
+def measure_line_memory(result_files: list[str],
+                        function_names: dict[tuple[str, int], str]) -> dict[tuple[str, int], dict[str, int]]:
+    """
+    Attribute the memory of memray results to the lines of the registered functions on the allocation stacks.
+
+    Like the time of a line, the memory of a line includes what the functions it calls allocated. Allocated bytes and
+    allocations are those live at the high watermark, for the test where the line held the most. Retained bytes are
+    those still allocated when the tests or the program ended, summed over the tests.
+
+    :param result_files: Memray result files, one per test or one for a program
+    :param function_names: Qualified name of every registered function by (file, first line)
+    :return: Dict with allocated, allocations and retained keys by (file, line number)
+    """
+    # Span of every function of the files with a registered one and whether it is registered, to tell whether a
+    # frame runs one of them
+    functions = {}
+    for filename in {filename for filename, _ in function_names}:
+        functions[filename] = [(first, last, (filename, first) in function_names)
+                               for _, first, last in function_spans(filename)]
+
+    line_memory = {}
+    for result_file in result_files:
+        reader = FileReader(result_file)
+        peak = _memory_by_line(reader.get_high_watermark_allocation_records(merge_threads=True), functions)
+        for key, (size, count) in peak.items():
+            line = line_memory.setdefault(key, {"allocated": 0, "allocations": 0, "retained": 0})
+            if size > line["allocated"]:
+                line["allocated"], line["allocations"] = size, count
+        for key, (size, _) in _memory_by_line(reader.get_leaked_allocation_records(merge_threads=True),
+                                              functions).items():
+            line_memory.setdefault(key, {"allocated": 0, "allocations": 0, "retained": 0})["retained"] += size
+    return line_memory
+
+
+def attach_line_memory(profile_data: list[dict], line_memory: dict[tuple[str, int], dict[str, int]]) -> None:
+    """
+    Add the memory of every line to the parsed line stats, in place.
+
+    :param profile_data: Parsed stats as returned by parse_line_profiler_output
+    :param line_memory: Memory by (file, line number) as returned by measure_line_memory
+    :return: None
+    """
+    for function in profile_data:
+        for line in function['lines']:
+            memory = line_memory.get((function['file'], line['line_number']))
+            if memory is not None:
+                line.update(memory)
+
+
+def dump_line_memory(line_memory: dict[tuple[str, int], dict[str, int]], output_dir: str) -> None:
+    """
+    Save the memory of the lines to the output directory.
+
+    :param line_memory: Memory by (file, line number) as returned by measure_line_memory
+    :param output_dir: The profiling output directory
+    :return: None
+    """
+    with open(os.path.join(output_dir, LINE_MEMORY_FILE), 'w') as f:
+        json.dump([{"file": filename, "line": lineno, **memory}
+                   for (filename, lineno), memory in line_memory.items()], f)
+
+
+def load_line_memory(output_dir: str) -> dict[tuple[str, int], dict[str, int]]:
+    """
+    Load the memory of the lines saved by dump_line_memory.
+
+    :param output_dir: The profiling output directory
+    :return: Memory by (file, line number), empty if the memory was not tracked
+    """
+    memory_path = os.path.join(output_dir, LINE_MEMORY_FILE)
+    if not os.path.exists(memory_path):
+        return {}
+    with open(memory_path) as f:
+        return {(entry.pop("file"), entry.pop("line")): entry for entry in json.load(f)}
+
+
+def _memory_by_line(records: Any,
+                    functions: dict[str, list[tuple[int, int, bool]]]) -> dict[tuple[str, int], list[int]]:
+    """Size and number of the allocations of memray records by line of the registered functions on their stack."""
+    memory = {}
+    registered_lines = {}
+    for record in records:
+        try:
+            stack = record.stack_trace()
+        except NotImplementedError:
+            continue
+        # A recursive function counts an allocation once per line
+        lines = set()
+        for _, filename, lineno in stack:
+            registered = registered_lines.get((filename, lineno))
+            if registered is None:
+                # Nested functions are listed after the function containing them, the last match is the innermost one
+                matches = [registered for first, last, registered in functions.get(filename, ())
+                           if first <= lineno <= last]
+                registered = registered_lines[(filename, lineno)] = bool(matches) and matches[-1]
+            if registered:
+                lines.add((filename, lineno))
+        for key in lines:
+            size_and_count = memory.setdefault(key, [0, 0])
+            size_and_count[0] += record.size
+            size_and_count[1] += record.n_allocations
+    return memory
@@ -1,3 +1,5 @@
+import os
+import sys
 from pathlib import Path
 from typing import Optional
 
@@ -89,3 +91,17 @@ def infer_test_module(test_path: Path | str) -> str:
         test_module = ".".join(test_module[:-3].split(".")[:-1])
 
     return test_module
+
+
+def is_project_file(path: str | None, root: str) -> bool:
+    """
+    :param path: File of a module
+    :param root: Project directory
+    :return: True if the file is Python source of the project, outside of environments
+    """
+    if not path or not path.endswith(".py"):
+        return False
+    path = os.path.abspath(path)
+    excluded = tuple(os.path.abspath(prefix) + os.sep for prefix in {sys.prefix, sys.base_prefix})
+    return (path.startswith(os.path.abspath(root) + os.sep) and not path.startswith(excluded) and
+            "site-packages" not in path)
@@ -1,5 +1,366 @@
+import ast
+import importlib
+import inspect
+import json
+import linecache
+import os
+import pickle
+import textwrap
 from typing import Any
 
+from line_profiler import LineProfiler, show_text
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.consts import (
+    PROFILE_BUDGETS,
+    PROFILE_ENTRY_POINTS,
+    PROFILE_FUNCTIONS,
+    PROFILE_GC_FREEZE,
+    PROFILE_GC_THRESHOLD,
+    PROFILE_LEAK_ITERATIONS,
+    PROFILE_LEAK_THRESHOLD,
+    PROFILE_LEAK_WARMUP,
+    PROFILE_MODULES,
+    PROFILE_TARGETS,
+    PROFILE_THREADS,
+    PROFILE_TIMER,
+    TimerConst,
+)
+from profiling_cli.utils.thread_utils import ThreadLineTracer
+from profiling_cli.utils.timing_utils import format_bytes
+
+
+def get_profile_targets() -> tuple[list[str], list[str]]:
+    """
+    Read the modules and functions to profile from the plugin's environment variables.
+
+    :return: Tuple (modules_to_profile, functions_to_profile)
+    """
+    modules_to_profile = os.environ.get(PROFILE_MODULES).split(',') if os.environ.get(PROFILE_MODULES) else []
+    functions_to_profile = os.environ.get(PROFILE_FUNCTIONS).split(',') if os.environ.get(PROFILE_FUNCTIONS) else []
+    return modules_to_profile, functions_to_profile
+
+
+def get_batch_targets() -> list[dict[str, Any]] | None:
+    """
+    Read the batch profiling targets from the plugin's environment variables.
+
+    :return: Targets as returned by config_utils.load_profiling_targets, None when not running a batch
+    """
+    targets = os.environ.get(PROFILE_TARGETS)
+    return json.loads(targets) if targets else None
+
+
+def get_budgets() -> dict[str, dict[str, dict[str, float]]]:
+    """
+    Read the performance budgets from the plugin's environment variables.
+
+    :return: Budgets as returned by config_utils.load_budgets, empty when none are configured
+    """
+    budgets = os.environ.get(PROFILE_BUDGETS)
+    return json.loads(budgets) if budgets else {"functions": {}, "tests": {}}
+
+
+def is_target_test(test_path: str, nodeid: str, target: dict[str, Any]) -> bool:
+    """
+    Check whether a test belongs to a batch profiling target.
+
+    :param test_path: Absolute path of the test file
+    :param nodeid: pytest node id of the test, e.g. tests/test_parser.py::test_parse
+    :param target: The profiling target, its tests are absolute paths optionally followed by ::test_name
+    :return: True if the test is one of the target's tests or lives under one of its test directories
+    """
+    test_name = nodeid.partition("::")[2]
+    for target_test in target["tests"]:
+        path, separator, target_test_name = target_test.partition("::")
+        if separator:
+            if test_path == path and (test_name == target_test_name or
+                                      test_name.startswith((target_test_name + "::", target_test_name + "["))):
+                return True
+        elif test_path == path or test_path.startswith(path.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+def get_entry_points() -> list[str]:
+    """
+    Read the entry points gating the profiler from the plugin's environment variables.
+
+    :return: Qualified names of the entry-point functions, empty when every call is profiled
+    """
+    return os.environ.get(PROFILE_ENTRY_POINTS).split(',') if os.environ.get(PROFILE_ENTRY_POINTS) else []
+
+
+def get_gc_settings() -> tuple[str | None, bool]:
+    """
+    Get the tuned garbage collector settings from the environment variables.
+
+    :return: Tuple (comma separated thresholds or None, whether to freeze the objects alive after collection)
+    """
+    return os.environ.get(PROFILE_GC_THRESHOLD) or None, bool(os.environ.get(PROFILE_GC_FREEZE))
+
+
+def get_leak_settings() -> tuple[int, int, int | None]:
+    """
+    Get the memory growth check configuration from the environment variables.
+
+    :return: Tuple (measured iterations of every test, 0 when the check is off, warmup iterations, growth per
+             iteration in bytes over which the run fails or None)
+    """
+    threshold = os.environ.get(PROFILE_LEAK_THRESHOLD)
+    return (int(os.environ.get(PROFILE_LEAK_ITERATIONS) or 0), int(os.environ.get(PROFILE_LEAK_WARMUP) or 0),
+            int(threshold) if threshold else None)
+
+
+def create_profiler() -> LineProfiler | ThreadLineTracer:
+    """
+    Create the profiler configured through the plugin's environment variables.
+
+    :return: A ThreadLineTracer when a thread breakdown or a CPU timer is requested, a LineProfiler otherwise
+    """
+    timer = get_timer()
+    if os.environ.get(PROFILE_THREADS) or timer != TimerConst.WALL:
+        return ThreadLineTracer(timer=timer)
+    return LineProfiler()
+
+
+def get_timer() -> str:
+    """
+    Read the line timer from the plugin's environment variables.
+
+    :return: One of the TimerConst values, wall by default
+    """
+    return os.environ.get(PROFILE_TIMER) or TimerConst.WALL
+
+
+def get_cpu_stats(profiler: Any) -> LineStats | None:
+    """
+    Get the CPU time line stats that accompany the primary stats when both timers are used.
+
+    :param profiler: Profiler created by create_profiler
+    :return: CPU time stats, or None when the profiler only measures one timer
+    """
+    if getattr(profiler, 'timer', None) == TimerConst.BOTH:
+        return profiler.get_stats(timer=TimerConst.CPU)
+    return None
+
+
+def attach_cpu_times(profile_data: list[dict], cpu_profile_data: list[dict], io_bound_ratio: float = 3.0) -> None:
+    """
+    Add the CPU time of every line to the parsed wall time profile data, in place.
+
+    Lines whose wall time is much larger than their CPU time spend it waiting (I/O, sleeps, locks)
+    and are flagged as io_bound.
+
+    :param profile_data: Parsed wall time stats as returned by parse_line_profiler_output
+    :param cpu_profile_data: Parsed CPU time stats of the same run
+    :param io_bound_ratio: Wall to CPU time ratio above which a line is flagged
+    :return: None
+    """
+    cpu_times = {(function['file'], function['function_name'], line['line_number']): line['time']
+                 for function in cpu_profile_data for line in function['lines']}
+    for function in profile_data:
+        for line in function['lines']:
+            cpu_time = cpu_times.get((function['file'], function['function_name'], line['line_number']))
+            if cpu_time is None or line['time'] is None:
+                continue
+            line['cpu_time'] = cpu_time
+            line['io_bound'] = line['time'] > io_bound_ratio * max(cpu_time, 1.0)
+
+
+def format_profile_data(profile_data: list[dict]) -> str:
+    """
+    Format parsed line stats as a compact table with one row per source line.
+
+    :param profile_data: Parsed stats as returned by parse_line_profiler_output
+    :return: The table, with the CPU time of every line when it was measured and the memory of every line when it
+             was tracked
+    """
+    rows = []
+    for function in profile_data:
+        has_cpu_time = any('cpu_time' in line for line in function['lines'])
+        has_memory = any('allocated' in line for line in function['lines'])
+        rows.append(f"Function {function['function_name']} at line {function['line_number']} "
+                    f"(file {function['file']}, total time {function['total_time']})")
+        rows.append("line | hits | time | per hit | % time | " + ("cpu time | " if has_cpu_time else "") +
+                    ("allocated | allocs | retained | " if has_memory else "") + "code")
+        base_indentation = min((line['indentation'] for line in function['lines']), default=0)
+        for line in function['lines']:
+            metrics = [line['hits'], line['time'], line['per_hit'], line['percent_time']]
+            if has_cpu_time:
+                metrics.append(line.get('cpu_time'))
+            cells = ["" if metric is None else f"{metric:g}" for metric in metrics]
+            if line.get('io_bound'):
+                cells[-1] += " io_bound"
+            if has_memory:
+                cells += [format_bytes(line['allocated']) if line.get('allocated') else "",
+                          str(line['allocations']) if line.get('allocations') else "",
+                          format_bytes(line['retained']) if line.get('retained') else ""]
+            code = " " * (line['indentation'] - base_indentation) + line['code']
+            rows.append(f"{line['line_number']} | {' | '.join(cells)} | {code}")
+    return "\n".join(rows)
+
+
+def register_functions(profiler: Any, modules_to_profile: list[str], functions_to_profile: list[str],
+                       verbose: bool = True) -> dict[tuple[str, int], str]:
+    """
+    Import the given modules and register the target functions with the profiler.
+
+    :param profiler: Profiler instance exposing add_function e.g. LineProfiler
+    :param modules_to_profile: Names of the modules to import
+    :param functions_to_profile: Function or Class.method names, all public functions are registered when empty
+    :param verbose: Whether to print every registration
+    :return: Mapping of (file, first line) of every registered code object to its qualified name
+    """
+    registered = {}
+
+    def _register(func: Any, name: str) -> None:
+        profiler.add_function(func)
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            registered[(code.co_filename, code.co_firstlineno)] = name
+        if verbose:
+            print(f"Registered {name} for line profiling")
+
+    for module_name in modules_to_profile:
+        try:
+            # Import the module
+            module = importlib.import_module(module_name)
+
+            # If specific functions are listed, profile only those
+            if functions_to_profile:
+                for func_name in functions_to_profile:
+                    # Check if it's a class method (contains a dot)
+                    if '.' in func_name:
+                        class_name, method_name = func_name.split('.')
+
+                        # Get the class from the module
+                        if hasattr(module, class_name):
+                            cls = getattr(module, class_name)
+                            if inspect.isclass(cls) and hasattr(cls, method_name):
+                                method = getattr(cls, method_name)
+                                if callable(method):
+                                    _register(method, f"{module_name}.{func_name}")
+                    elif hasattr(module, func_name):
+                        _register(getattr(module, func_name), f"{module_name}.{func_name}")
+            else:
+                # Otherwise, profile all non-private functions in the module
+                if verbose:
+                    print("No function to profile")
+                for name, obj in inspect.getmembers(module):
+                    if inspect.isfunction(obj) and not name.startswith('_'):
+                        _register(obj, f"{module_name}.{name}")
+        except Exception as e:
+            print(f"Error registering module {module_name}: {e}")
+    return registered
+
+
+def merge_line_stats(stats_list: list[LineStats]) -> LineStats:
+    """
+    Merge several line profiler stats into one, summing hits and time per line.
+
+    :param stats_list: Stats objects e.g. from the parent process and its children
+    :return: The merged stats, expressed in the timer unit of the first stats object
+    """
+    unit = stats_list[0].unit if stats_list else 1e-9
+    merged = {}
+    for stats in stats_list:
+        scale = stats.unit / unit
+        for key, entries in stats.timings.items():
+            lines = merged.setdefault(key, {})
+            for lineno, nhits, time_value in entries:
+                hits_and_time = lines.setdefault(lineno, [0, 0])
+                hits_and_time[0] += nhits
+                hits_and_time[1] += time_value * scale
+    timings = {key: [(lineno, hits, int(time_value)) for lineno, (hits, time_value) in sorted(lines.items())]
+               for key, lines in merged.items()}
+    return LineStats(timings, unit)
+
+
+def filter_line_stats(stats: LineStats, code_keys: set[tuple[str, int]]) -> LineStats:
+    """
+    Keep only the stats of the given functions.
+
+    :param stats: Stats to filter
+    :param code_keys: (file, first line) of the functions to keep, as returned by register_functions
+    :return: The filtered stats
+    """
+    return LineStats({key: entries for key, entries in stats.timings.items() if key[:2] in code_keys}, stats.unit)
+
+
+def subtract_line_stats(stats: LineStats, baseline: LineStats) -> LineStats:
+    """
+    Remove a baseline from line profiler stats, e.g. the stats a forked child inherited from its parent.
+
+    :param stats: Stats collected so far
+    :param baseline: Stats snapshot to subtract, must use the same timer unit
+    :return: Stats only covering what happened after the baseline was taken
+    """
+    timings = {}
+    for key, entries in stats.timings.items():
+        base = {lineno: (nhits, time_value) for lineno, nhits, time_value in baseline.timings.get(key, [])}
+        lines = []
+        for lineno, nhits, time_value in entries:
+            base_hits, base_time = base.get(lineno, (0, 0))
+            if nhits - base_hits > 0:
+                lines.append((lineno, nhits - base_hits, time_value - base_time))
+        if lines:
+            timings[key] = lines
+    return LineStats(timings, stats.unit)
+
+
+def write_line_stats(stats: LineStats, stats_file: str) -> None:
+    """
+    Write line profiler stats in the standard line_profiler text format.
+
+    :param stats: Stats to write
+    :param stats_file: Path of the output text file
+    :return: None
+    """
+    with open(stats_file, 'w') as f:
+        show_text(stats.timings, stats.unit, stream=f, stripzeros=True)
+
+
+def dump_line_stats(stats: LineStats, stats_file: str) -> None:
+    """
+    Save line profiler stats as a pickle, keeping the raw timings for later aggregation.
+
+    :param stats: Stats to save
+    :param stats_file: Path of the output file
+    :return: None
+    """
+    with open(stats_file, 'wb') as f:
+        pickle.dump(stats, f)
+
+
+def load_line_stats(stats_file: str) -> LineStats:
+    """
+    Load line profiler stats saved by dump_line_stats.
+
+    :param stats_file: Path of the saved stats
+    :return: The stats
+    """
+    with open(stats_file, 'rb') as f:
+        return pickle.load(f)
+
+
+def parse_function_source(filename: str, firstlineno: int) -> ast.FunctionDef | ast.AsyncFunctionDef | None:
+    """
+    Parse the source of a profiled function.
+
+    :param filename: File the function is defined in
+    :param firstlineno: First line of the function, its first decorator if it has any
+    :return: The function node with line numbers matching the file, None if the source is unavailable
+    """
+    lines = linecache.getlines(filename)
+    try:
+        tree = ast.parse(textwrap.dedent("".join(inspect.getblock(lines[firstlineno - 1:]))))
+    except (SyntaxError, IndexError, inspect.EndOfBlock):
+        return None
+    if not tree.body or not isinstance(tree.body[0], (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return None
+    return ast.increment_lineno(tree.body[0], firstlineno - 1)
+
 
 def parse_line_profiler_output(output_text: str) -> tuple:
     """
@@ -25,6 +386,10 @@ def parse_line_profiler_output(output_text: str) -> tuple:
     function_sections = []
     current_section = []
     function_headers = []
+    # Total time and file of each section, they are printed right before its "Function:" header
+    section_metadata = []
+    current_metadata = {}
+    pending_metadata = {}
 
     # Check if this is a standard line_profiler output or a different format
     is_standard_format = any(line.startswith('Function:') for line in lines)
@@ -32,11 +397,17 @@ def parse_line_profiler_output(output_text: str) -> tuple:
     if is_standard_format:
         # Standard format with "Function:" headers
         for line in lines:
+            if line.startswith('Total time:'):
+                pending_metadata['total_time'] = line.split(':', 1)[1].strip()
+            elif line.startswith('File:'):
+                pending_metadata['file'] = line.split(':', 1)[1].strip()
             if line.startswith('Function:'):
                 if current_section:
                     function_sections.append(current_section)
+                    section_metadata.append(current_metadata)
                 current_section = [line]
                 function_headers.append(line)
+                current_metadata, pending_metadata = pending_metadata, {}
             else:
                 current_section.append(line)
     else:
@@ -45,6 +416,7 @@ def parse_line_profiler_output(output_text: str) -> tuple:
             if line.startswith('Function ') and ':' in line:
                 if current_section:
                     function_sections.append(current_section)
+                    section_metadata.append(current_metadata)
                 current_section = [line]
                 function_headers.append(line)
             else:
@@ -53,6 +425,7 @@ def parse_line_profiler_output(output_text: str) -> tuple:
     # Add the last section if not empty
     if current_section:
         function_sections.append(current_section)
+        section_metadata.append(current_metadata)
 
     function_texts = []
     profile_data = []
@@ -98,11 +471,12 @@ def parse_line_profiler_output(output_text: str) -> tuple:
             except Exception:
                 func_name = f"function_{section_idx + 1}"
 
+        function_metadata = section_metadata[section_idx]
         function_info = {
             'function_name': func_name,
             'line_number': line_num,
-            'file': metadata.get('file', ''),
-            'total_time': metadata.get('total_time', ''),
+            'file': function_metadata.get('file', metadata.get('file', '')),
+            'total_time': function_metadata.get('total_time', metadata.get('total_time', '')),
             'lines': []
         }
 
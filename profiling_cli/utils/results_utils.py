@@ -0,0 +1,132 @@
+import json
+import os
+from typing import Any
+
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.consts import (
+    ANTIPATTERNS_FILE,
+    CPU_LINE_STATS_FILE,
+    CPU_LINE_STATS_RAW_FILE,
+    LINE_MEMORY_FILE,
+    LINE_STATS_FILE,
+    LINE_STATS_RAW_FILE,
+    LINE_TABLE_FILE,
+    PROCESS_STATS_FILE,
+    RUN_METADATA_FILE,
+    THREAD_STATS_FILE,
+    TIMER_METRIC_LABELS,
+)
+from profiling_cli.utils.antipattern_utils import (
+    find_antipatterns,
+    format_antipattern_report,
+)
+from profiling_cli.utils.memory_utils import (
+    attach_line_memory,
+    dump_line_memory,
+    load_line_memory,
+)
+from profiling_cli.utils.plugin_utils import (
+    attach_cpu_times,
+    dump_line_stats,
+    format_profile_data,
+    get_cpu_stats,
+    get_timer,
+    merge_line_stats,
+    parse_line_profiler_output,
+    write_line_stats,
+)
+from profiling_cli.utils.subprocess_utils import (
+    collect_child_stats,
+    format_process_breakdown,
+)
+from profiling_cli.utils.thread_utils import format_thread_report
+
+
+def write_line_profiling_results(profiler: Any, output_dir: str, profile_subprocesses: bool = False,
+                                 profile_threads: bool = False,
+                                 line_memory: dict[tuple[str, int], dict[str, int]] | None = None
+                                 ) -> tuple[LineStats, list[dict[str, Any]]]:
+    """
+    Save the line stats of a profiled run, and the reports derived from them, to the output directory.
+
+    The pytest plugin and the program runner both write their results this way, so the CLI loads and analyzes
+    them the same way.
+
+    :param profiler: Profiler created by create_profiler, disabled
+    :param output_dir: Absolute path of the profiling output directory, it must exist
+    :param profile_subprocesses: Whether child processes wrote stats to merge
+    :param profile_threads: Whether to write the per-thread breakdown
+    :param line_memory: Memory of the lines as returned by measure_line_memory, when it was tracked
+    :return: Tuple (line stats merged with those of the child processes, child stats as returned by
+             collect_child_stats)
+    """
+    stats = profiler.get_stats()
+    cpu_stats = get_cpu_stats(profiler)
+    if profile_threads:
+        with open(f"{output_dir}/{THREAD_STATS_FILE}", 'w') as f:
+            f.write(format_thread_report(profiler.get_thread_stats()))
+
+    children = []
+    if profile_subprocesses:
+        # Merge the partial stats written by child processes into the parent run
+        children = collect_child_stats(output_dir)
+        with open(f"{output_dir}/{PROCESS_STATS_FILE}", 'w') as f:
+            f.write(format_process_breakdown(stats, children))
+        stats = merge_line_stats([stats] + [child["stats"] for child in children])
+        if cpu_stats is not None:
+            cpu_stats = merge_line_stats([cpu_stats] + [child["cpu_stats"] for child in children
+                                                        if "cpu_stats" in child])
+        print(f"Merged line profiling results of {len(children)} child processes")
+
+    # Save the profiling stats
+    stats_file = f"{output_dir}/{LINE_STATS_FILE}"
+    write_line_stats(stats, stats_file)
+    # Raw timings, to aggregate repeated runs
+    dump_line_stats(stats, f"{output_dir}/{LINE_STATS_RAW_FILE}")
+    if cpu_stats is not None:
+        write_line_stats(cpu_stats, f"{output_dir}/{CPU_LINE_STATS_FILE}")
+        dump_line_stats(cpu_stats, f"{output_dir}/{CPU_LINE_STATS_RAW_FILE}")
+
+    # Flag textbook anti-patterns on the hot lines, without waiting for the model
+    with open(stats_file) as f:
+        _, profile_data = parse_line_profiler_output(f.read())
+    with open(f"{output_dir}/{ANTIPATTERNS_FILE}", 'w') as f:
+        f.write(format_antipattern_report(find_antipatterns(profile_data)))
+
+    # One table with the time and the memory of every line
+    if line_memory:
+        dump_line_memory(line_memory, output_dir)
+    elif os.path.exists(f"{output_dir}/{LINE_MEMORY_FILE}"):
+        os.remove(f"{output_dir}/{LINE_MEMORY_FILE}")
+    write_line_table(output_dir)
+
+    # Record how the line stats were measured
+    timer = get_timer()
+    with open(f"{output_dir}/{RUN_METADATA_FILE}", 'w') as f:
+        json.dump({"timer": timer, "line_stats_metric": TIMER_METRIC_LABELS[timer]}, f)
+    return stats, children
+
+
+def write_line_table(output_dir: str) -> str | None:
+    """
+    Save the line stats of the output directory as one table joining the time and the memory of every line.
+
+    :param output_dir: The profiling output directory
+    :return: The table, None if there are no line stats
+    """
+    stats_path = os.path.join(output_dir, LINE_STATS_FILE)
+    if not os.path.exists(stats_path):
+        return None
+    with open(stats_path) as f:
+        _, profile_data = parse_line_profiler_output(f.read())
+    cpu_stats_path = os.path.join(output_dir, CPU_LINE_STATS_FILE)
+    if os.path.exists(cpu_stats_path):
+        with open(cpu_stats_path) as f:
+            _, cpu_profile_data = parse_line_profiler_output(f.read())
+        attach_cpu_times(profile_data, cpu_profile_data)
+    attach_line_memory(profile_data, load_line_memory(output_dir))
+    table = format_profile_data(profile_data)
+    with open(os.path.join(output_dir, LINE_TABLE_FILE), 'w') as f:
+        f.write(table + "\n")
+    return table
@@ -0,0 +1,263 @@
+import builtins
+import contextlib
+import importlib
+import os
+import re
+import runpy
+import shutil
+import signal
+import sys
+import traceback
+from importlib.metadata import entry_points
+from typing import Any
+
+from memray import FileReader, Tracker
+
+from profiling_cli.consts import (
+    DEFAULT_OUTPUT_DIR,
+    LINE_STATS_FILE,
+    MEMORY_REPORT_FILE,
+    MEMORY_REPORT_STACK_FRAMES,
+    MEMORY_REPORT_TOP_ALLOCATIONS,
+    MEMORY_RESULT_FILE,
+    PROFILE_MEMORY,
+    PROFILE_OUTPUT_DIR,
+    PROFILE_SUBPROCESSES,
+    PROFILE_THREADS,
+)
+from profiling_cli.utils.memory_utils import measure_line_memory
+from profiling_cli.utils.plugin_utils import (
+    create_profiler,
+    get_profile_targets,
+    register_functions,
+)
+from profiling_cli.utils.results_utils import write_line_profiling_results
+from profiling_cli.utils.subprocess_utils import enable_subprocess_profiling
+from profiling_cli.utils.timing_utils import format_bytes
+
+# Run with -c in the interpreter of the CLI, the program command line follows
+RUN_DRIVER_SOURCE = '''import sys
+
+from profiling_cli.utils.run_utils import profile_program
+
+sys.exit(profile_program(sys.argv[1:]))
+'''
+
+# python, python3, python3.12, python.exe
+PYTHON_EXECUTABLE_PATTERN = re.compile(r"python(\d+(\.\d+)*)?(\.exe)?$")
+
+# Signals that stop the program once its results are saved, SIGINT already raises KeyboardInterrupt
+STOP_SIGNALS = [signal.SIGTERM] + ([signal.SIGHUP] if hasattr(signal, "SIGHUP") else [])
+
+
+def parse_program(command: list[str]) -> dict[str, Any]:
+    """
+    Tell how to run a program given as a command line.
+
+    :param command: python -m module, python -c code or python script.py, a script, an installed console script or
+                    an entry point (package.module:function), followed by the arguments of the program
+    :return: Dict with kind (module, code, script or entry_point), target and argv (sys.argv as the program sees it)
+             keys
+    :raises ValueError: If the command is not a Python program
+    """
+    if not command:
+        raise ValueError("No program to run")
+    first, *args = command
+    if PYTHON_EXECUTABLE_PATTERN.match(os.path.basename(first)):
+        if not args:
+            raise ValueError("The interactive interpreter cannot be profiled, give a module, code or a script")
+        option, *rest = args
+        if option in ("-m", "-c"):
+            if not rest:
+                raise ValueError(f"Argument expected for the {option} option")
+            kind = "module" if option == "-m" else "code"
+            return {"kind": kind, "target": rest[0], "argv": [rest[0] if kind == "module" else "-c"] + rest[1:]}
+        if option.startswith("-"):
+            raise ValueError(f"Unsupported Python option {option}, the program runs with -m module, -c code or a "
+                             f"script")
+        return {"kind": "script", "target": option, "argv": args}
+    if first.endswith(".py") or (os.path.isfile(first) and _is_python_script(first)):
+        return {"kind": "script", "target": first, "argv": command}
+    if ":" in first:
+        return {"kind": "entry_point", "target": first, "argv": command}
+    for entry_point in entry_points(group="console_scripts", name=first):
+        return {"kind": "entry_point", "target": entry_point.value, "argv": command}
+    path = shutil.which(first)
+    if path and _is_python_script(path):
+        return {"kind": "script", "target": path, "argv": command}
+    raise ValueError(f"{first} is neither a Python module, script, entry point nor an installed console script")
+
+
+def run_program(program: dict[str, Any]) -> Any:
+    """
+    Run a program in the current interpreter as the python command would, sys.argv must already be set.
+
+    :param program: Program as returned by parse_program
+    :return: What the entry point returned, None for the other kinds
+    """
+    if program["kind"] == "module":
+        runpy.run_module(program["target"], run_name="__main__", alter_sys=True)
+    elif program["kind"] == "script":
+        runpy.run_path(program["target"], run_name="__main__")
+    elif program["kind"] == "code":
+        # The code given with -c, run the way python -c runs it
+        exec(compile(program["target"], "<string>", "exec"),  # noqa: S102
+             {"__name__": "__main__", "__builtins__": builtins})
+    else:
+        module_name, _, attribute = program["target"].partition(":")
+        # Console script values may end with extras, e.g. package.cli:main [color]
+        function = importlib.import_module(module_name.strip())
+        for name in attribute.split("[")[0].strip().split("."):
+            function = getattr(function, name)
+        return function()
+    return None
+
+
+def profile_program(command: list[str]) -> int:
+    """
+    Run a program with the configured functions line profiled and its memory tracked.
+
+    The results are saved to the output directory in the format of the pytest plugin when the program ends, also
+    when it is interrupted (Ctrl+C) or terminated (SIGTERM, SIGHUP), e.g. to stop a long-running job or server.
+
+    :param command: The program, as accepted by parse_program
+    :return: Exit code of the program
+    """
+    program = parse_program(command)
+    output_dir = os.path.abspath(os.environ.get(PROFILE_OUTPUT_DIR, DEFAULT_OUTPUT_DIR))
+    os.makedirs(output_dir, exist_ok=True)
+    sys.argv = program["argv"]
+    if program["kind"] == "script":
+        # As the interpreter would, the directory of the script comes first on the path instead of the current one
+        sys.path[0] = os.path.dirname(os.path.abspath(program["target"]))
+
+    profiler = create_profiler()
+    modules_to_profile, functions_to_profile = get_profile_targets()
+    print(f"Modules to profile : {modules_to_profile}")
+    print(f"Functions to profile : {functions_to_profile}")
+    registered = register_functions(profiler, modules_to_profile, functions_to_profile)
+    if program["kind"] == "module":
+        # The module runs again as __main__ like with python -m, its functions have the same code as the registered
+        # ones and are profiled too
+        sys.modules.pop(program["target"], None)
+    if os.environ.get(PROFILE_SUBPROCESSES):
+        enable_subprocess_profiling(profiler, output_dir)
+
+    memory_file = os.path.join(output_dir, MEMORY_RESULT_FILE) if os.environ.get(PROFILE_MEMORY) else None
+    if memory_file and os.path.exists(memory_file):
+        os.remove(memory_file)
+    _stop_on_signals()
+    exit_code = 0
+    try:
+        with _track_memory(memory_file):
+            profiler.enable_by_count()
+            try:
+                exit_code = _exit_code(run_program(program))
+            finally:
+                profiler.disable_by_count()
+    except SystemExit as e:
+        exit_code = _exit_code(e.code)
+    except KeyboardInterrupt:
+        print("\nInterrupted, saving the profiling results", file=sys.stderr)
+        exit_code = 128 + signal.SIGINT
+    except Exception:  # noqa: BLE001 - the program may raise anything, reported as Python does before saving
+        traceback.print_exc()
+        exit_code = 1
+
+    # A second interrupt would leave partial results
+    for signum in STOP_SIGNALS + [signal.SIGINT]:
+        signal.signal(signum, signal.SIG_IGN)
+    tracked = bool(memory_file and os.path.exists(memory_file))
+    line_memory = measure_line_memory([memory_file], registered) if tracked and registered else None
+    write_line_profiling_results(profiler, output_dir, profile_subprocesses=bool(os.environ.get(PROFILE_SUBPROCESSES)),
+                                 profile_threads=bool(os.environ.get(PROFILE_THREADS)), line_memory=line_memory)
+    if tracked:
+        with open(os.path.join(output_dir, MEMORY_REPORT_FILE), 'w') as f:
+            f.write(format_memory_report(memory_file, " ".join(command)))
+    print(f"Line profiling results saved to {output_dir}/{LINE_STATS_FILE}")
+    return exit_code
+
+
+def format_memory_report(result_file: str, command: str, top: int = MEMORY_REPORT_TOP_ALLOCATIONS,
+                         stack_frames: int = MEMORY_REPORT_STACK_FRAMES) -> str:
+    """
+    Summarize the memory of a program at its high watermark, in the layout of the pytest-memray report.
+
+    :param result_file: Memray result file of the program
+    :param command: Command line of the program
+    :param top: Number of biggest allocations listed
+    :param stack_frames: Number of frames of the stack of every allocation
+    :return: The report, starting with a MEMRAY REPORT header
+    """
+    reader = FileReader(result_file)
+    records = sorted(reader.get_high_watermark_allocation_records(merge_threads=True),
+                     key=lambda record: record.size, reverse=True)
+    lines = ["MEMRAY REPORT", f"Allocation results for {command} at the high watermark", "",
+             f"\t 📦 Total memory allocated: {format_bytes(reader.metadata.peak_memory)}",
+             f"\t 📏 Total allocations: {reader.metadata.total_allocations}",
+             "\t 🥇 Biggest allocating functions:"]
+    listed = 0
+    for record in records:
+        if listed == top:
+            break
+        try:
+            stack = _program_frames(record.stack_trace())[:stack_frames]
+        except NotImplementedError:
+            # Stack traces for deallocations aren't captured
+            continue
+        if not stack:
+            continue
+        listed += 1
+        (function, filename, lineno), *callers = stack
+        lines.append(f"\t\t- {function}:{filename}:{lineno} -> {format_bytes(record.size)} in "
+                     f"{record.n_allocations} allocations")
+        lines += [f"\t\t    called from {function}:{filename}:{lineno}" for function, filename, lineno in callers]
+    return "\n".join(lines) + "\n"
+
+
+def _program_frames(stack: list[tuple[str, str, int]]) -> list[tuple[str, str, int]]:
+    """Frames of an allocation stack above the runner, empty when only the runner and the import system allocated."""
+    frames = []
+    for frame in stack:
+        if frame[1] in (__file__, runpy.__file__, "<frozen runpy>"):
+            break
+        frames.append(frame)
+    return frames if any(not filename.startswith("<frozen ") for _, filename, _ in frames) else []
+
+
+def _track_memory(memory_file: str | None) -> Any:
+    """Memray tracker writing to the file, or no tracking."""
+    if memory_file is None:
+        return contextlib.nullcontext()
+    return Tracker(memory_file)
+
+
+def _stop_on_signals() -> None:
+    """Stop the program on a terminate or hangup signal, the way an interrupt does, so its results are saved."""
+    def _handler(signum, frame):
+        raise SystemExit(128 + signum)
+
+    for signum in STOP_SIGNALS:
+        # The program may install its own handler later on, which is then expected to exit cleanly
+        if signal.getsignal(signum) is signal.SIG_DFL:
+            signal.signal(signum, _handler)
+
+
+def _exit_code(code: Any) -> int:
+    """Exit code of the process for a SystemExit code or a value returned by an entry point."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _is_python_script(path: str) -> bool:
+    """Whether a file is a script run by a Python interpreter, according to its shebang."""
+    try:
+        with open(path, 'rb') as f:
+            first_line = f.readline()
+    except OSError:
+        return False
+    return first_line.startswith(b"#!") and b"python" in first_line
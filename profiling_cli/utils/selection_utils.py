@@ -0,0 +1,428 @@
+import ast
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any
+
+from profiling_cli.consts import (
+    CACHE_DIR,
+    PROFILE_TEST_MAP_FILE,
+    TEST_MAP_FILE,
+    TEST_MAP_PLUGIN_MODULE,
+)
+
+# Version of the cached test map layout, older caches are rebuilt
+TEST_MAP_VERSION = 1
+
+HUNK_PATTERN = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# pytest exit codes of a mapping run that ran the tests: all passed, some failed, none collected
+PYTEST_MAPPED_EXIT_CODES = (0, 1, 5)
+
+
+class FunctionCallRecorder:
+    """
+    Records which functions of the project run, e.g. during a test.
+
+    With sys.monitoring (Python 3.12+) only the first call of each function is reported until reset, so the
+    overhead is one callback per function and test. Older versions fall back to a call-only sys.setprofile hook.
+    Qualified names are resolved from the source as function_spans names them, on every Python version.
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: Project directory, only functions defined under it and outside of environments are recorded
+        """
+        self.root = os.path.abspath(root) + os.sep
+        self._calls = set()
+        self._spans = {}
+        self._excluded = tuple(os.path.abspath(prefix) + os.sep for prefix in {sys.prefix, sys.base_prefix})
+        self._included_files = {}
+        self._tool_id = None
+
+    def start(self) -> None:
+        """Start recording in every thread."""
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is not None:
+            for tool_id in (monitoring.COVERAGE_ID, monitoring.OPTIMIZER_ID):
+                if monitoring.get_tool(tool_id) is None:
+                    self._tool_id = tool_id
+                    break
+        if self._tool_id is not None:
+            sys.monitoring.use_tool_id(self._tool_id, "profiling-cli")
+            sys.monitoring.register_callback(self._tool_id, sys.monitoring.events.PY_START, self._on_start)
+            sys.monitoring.set_events(self._tool_id, sys.monitoring.events.PY_START)
+        else:
+            threading.setprofile(self._on_profile_event)
+            sys.setprofile(self._on_profile_event)
+
+    def stop(self) -> None:
+        """Stop recording."""
+        if self._tool_id is not None:
+            sys.monitoring.set_events(self._tool_id, 0)
+            sys.monitoring.free_tool_id(self._tool_id)
+            self._tool_id = None
+        else:
+            sys.setprofile(None)
+            threading.setprofile(None)
+
+    def reset(self) -> set[tuple[str, str]]:
+        """
+        Start a new recording.
+
+        :return: (file, qualified name) of the functions recorded since the last reset
+        """
+        calls, self._calls = self._calls, set()
+        if self._tool_id is not None:
+            sys.monitoring.restart_events()
+        return {(filename, self._qualname(filename, first_line, name)) for filename, first_line, name in calls}
+
+    def _on_start(self, code: Any, offset: int) -> Any:
+        self._record(code)
+        return sys.monitoring.DISABLE
+
+    def _on_profile_event(self, frame: Any, event: str, arg: Any) -> None:
+        if event == "call":
+            self._record(frame.f_code)
+
+    def _record(self, code: Any) -> None:
+        filename = code.co_filename
+        included = self._included_files.get(filename)
+        if included is None:
+            # Code compiled from strings and frozen modules has a pseudo file name like <string>
+            path = os.path.abspath(filename)
+            included = self._included_files[filename] = (not filename.startswith("<") and
+                                                         path.startswith(self.root) and
+                                                         not path.startswith(self._excluded) and
+                                                         "site-packages" not in path)
+        if included:
+            self._calls.add((os.path.abspath(filename), code.co_firstlineno, code.co_name))
+
+    def _qualname(self, filename: str, first_line: int, name: str) -> str:
+        """Qualified name of a code object, lambdas and comprehensions are named after their enclosing function."""
+        mtime = _mtime(filename)
+        if filename not in self._spans or self._spans[filename][0] != mtime:
+            # Files edited while recording, e.g. in watch mode, are parsed again
+            self._spans[filename] = (mtime, function_spans(filename))
+        enclosing = None
+        for qualname, start, end in self._spans[filename][1]:
+            if start == first_line and qualname.rsplit(".", 1)[-1] == name:
+                return qualname
+            if start <= first_line <= end and (enclosing is None or start >= enclosing[1]):
+                enclosing = (qualname, start)
+        return f"{enclosing[0]}.<locals>.{name}" if enclosing else name
+
+
+def file_digest(path: str) -> str | None:
+    """
+    :param path: File to hash
+    :return: SHA-256 of the file content, None if it does not exist
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def load_test_map(cache_file: Path) -> dict[str, Any]:
+    """
+    Load the cached map from tests to the functions they run.
+
+    :param cache_file: Cache file
+    :return: Dict with git_head, files (digest by path) and tests (path and functions by node id) keys, empty
+             when the cache is missing, unreadable or from another version
+    """
+    empty = {"version": TEST_MAP_VERSION, "git_head": None, "files": {}, "tests": {}}
+    try:
+        with open(cache_file) as f:
+            test_map = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    return test_map if test_map.get("version") == TEST_MAP_VERSION else empty
+
+
+def save_test_map(test_map: dict[str, Any], cache_file: Path) -> None:
+    """
+    Save the map from tests to the functions they run.
+
+    :param test_map: Map as returned by load_test_map
+    :param cache_file: Cache file, its directory is created if needed
+    :return: None
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(cache_file, 'w') as f:
+        json.dump(test_map, f)
+
+
+def find_test_files(test_path: str) -> list[str]:
+    """
+    :param test_path: Test file or directory
+    :return: Absolute paths of the pytest test files
+    """
+    path = Path(test_path).resolve()
+    if path.is_file():
+        return [str(path)]
+    return sorted(str(file) for pattern in ("test_*.py", "*_test.py") for file in path.rglob(pattern))
+
+
+def git_head(root: Path) -> str | None:
+    """
+    :param root: Directory inside the repository
+    :return: The commit checked out, None outside of a git repository
+    """
+    result = _git(root, ["rev-parse", "HEAD"])
+    return result.strip() if result is not None else None
+
+
+def git_changed_files(root: Path, since: str) -> set[str] | None:
+    """
+    Files that differ from a commit in the working tree, untracked files included.
+
+    :param root: Directory inside the repository
+    :param since: Commit or other git revision
+    :return: Absolute paths, None if git cannot tell (no repository, unknown revision)
+    """
+    top_level = _git(root, ["rev-parse", "--show-toplevel"])
+    changed = _git(root, ["diff", "--name-only", since])
+    untracked = _git(root, ["ls-files", "--others", "--exclude-standard", "--full-name"])
+    if top_level is None or changed is None or untracked is None:
+        return None
+    return {os.path.join(top_level.strip(), name) for name in (changed + untracked).splitlines() if name}
+
+
+def changed_files(test_map: dict[str, Any], root: Path) -> set[str]:
+    """
+    Files of the test map whose content changed since it was built.
+
+    When the map was built in a git repository, only the files git reports as changed since that commit are
+    hashed again, otherwise every file of the map is.
+
+    :param test_map: Map as returned by load_test_map
+    :param root: Project directory
+    :return: Absolute paths of the changed, or deleted, files
+    """
+    candidates = set(test_map["files"])
+    if test_map["git_head"]:
+        git_changed = git_changed_files(root, test_map["git_head"])
+        if git_changed is not None:
+            candidates &= git_changed
+    return {path for path in candidates if file_digest(path) != test_map["files"][path]}
+
+
+def stale_test_files(test_map: dict[str, Any], test_files: list[str], changed: set[str]) -> list[str]:
+    """
+    Test files whose tests must be mapped again.
+
+    :param test_map: Map as returned by load_test_map
+    :param test_files: Test files of the requested test path
+    :param changed: Files that changed since the map was built
+    :return: Test files never mapped, or with a test running a changed file
+    """
+    mapped = {test["path"] for test in test_map["tests"].values()}
+    stale = {test["path"] for test in test_map["tests"].values()
+             if test["path"] in changed or any(filename in changed for filename, _ in test["functions"])}
+    return [path for path in test_files if path not in mapped or path in stale]
+
+
+def update_test_map(test_map: dict[str, Any], test_files: list[str], root: Path,
+                    changed: set[str] = frozenset()) -> dict[str, Any]:
+    """
+    Map the tests of the given files by running them once with a call recorder, and merge them into the map.
+
+    :param test_map: Map as returned by load_test_map, updated in place
+    :param test_files: Test files to map
+    :param root: Project directory, pytest runs from it
+    :param changed: Files that changed since the map was built, the other tests running them are dropped
+    :return: The updated map
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, "test_map.json")
+        cmd = [sys.executable, '-m', 'pytest', '-p', TEST_MAP_PLUGIN_MODULE, *test_files, '-q', '--no-header',
+               '-p', 'no:cacheprovider']
+        result = subprocess.run(cmd, cwd=root, env={**os.environ, PROFILE_TEST_MAP_FILE: output_file},
+                                capture_output=True, text=True, check=False)
+        # Failing tests are mapped too, a usage or internal error is not
+        if result.returncode not in PYTEST_MAPPED_EXIT_CODES or not os.path.exists(output_file):
+            raise RuntimeError(f"Mapping the tests failed with exit code {result.returncode}:\n{result.stdout}")
+        with open(output_file) as f:
+            tests = json.load(f)
+
+    # Tests of other files that ran changed code are outdated, they are mapped again when they are requested
+    kept = {nodeid: test for nodeid, test in test_map["tests"].items()
+            if test["path"] not in test_files and not _referenced_files({nodeid: test}) & changed}
+    new_files = _referenced_files(tests)
+    test_map["files"] = {**{path: test_map["files"][path] for path in _referenced_files(kept) - new_files},
+                         **{path: file_digest(path) for path in new_files}}
+    test_map["tests"] = {**kept, **tests}
+    test_map["git_head"] = git_head(root)
+    return test_map
+
+
+def function_spans(path: str, source: str | None = None) -> list[tuple[str, int, int]]:
+    """
+    :param path: Python file
+    :param source: Optional content of the file, read from it when not provided
+    :return: (qualified name, first line, last line) of every function of the file, decorators included
+    """
+    try:
+        tree = ast.parse(Path(path).read_text() if source is None else source)
+    except (OSError, SyntaxError, ValueError):
+        return []
+    spans = []
+
+    def _visit(node: ast.AST, prefix: str) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = prefix + child.name
+                first_line = min([child.lineno] + [decorator.lineno for decorator in child.decorator_list])
+                spans.append((qualname, first_line, child.end_lineno))
+                _visit(child, qualname + ".<locals>.")
+            elif isinstance(child, ast.ClassDef):
+                _visit(child, prefix + child.name + ".")
+            else:
+                _visit(child, prefix)
+
+    _visit(tree, "")
+    return spans
+
+
+def changed_functions(root: Path, since: str) -> set[tuple[str, str]]:
+    """
+    Functions touched by the changes since a git revision, uncommitted and untracked files included.
+
+    :param root: Directory inside the repository
+    :param since: Commit or other git revision
+    :return: (absolute file, qualified name) of the changed functions, empty if git cannot tell
+    """
+    top_level = _git(root, ["rev-parse", "--show-toplevel"])
+    diff = _git(root, ["diff", "-U0", since, "--", "*.py"])
+    if top_level is None or diff is None:
+        return set()
+    changed_lines = {}
+    current_file = None
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            current_file = os.path.join(top_level.strip(), line[6:]) if line.startswith("+++ b/") else None
+        elif current_file and (hunk := HUNK_PATTERN.match(line)):
+            start, count = int(hunk.group(1)), int(hunk.group(2) or 1)
+            # Pure deletions have no new lines, the function around the deletion point changed
+            changed_lines.setdefault(current_file, []).append((start, start + max(count, 1) - 1))
+
+    functions = set()
+    for path, ranges in changed_lines.items():
+        for qualname, first_line, last_line in function_spans(path):
+            if any(start <= last_line and first_line <= end for start, end in ranges):
+                functions.add((path, qualname))
+    for path in git_changed_files(root, since) or set():
+        if path.endswith(".py") and path not in changed_lines:
+            # Untracked files are new, all their functions changed
+            functions.update((path, qualname) for qualname, _, _ in function_spans(path))
+    return functions
+
+
+def module_files(modules: list[str]) -> set[str]:
+    """
+    :param modules: Module names
+    :return: Absolute paths of the modules that can be found, without importing them
+    """
+    files = set()
+    for module in modules:
+        try:
+            spec = importlib.util.find_spec(module)
+        except (ImportError, ValueError):
+            spec = None
+        if spec is not None and spec.origin and spec.origin.endswith(".py"):
+            files.add(os.path.abspath(spec.origin))
+    return files
+
+
+def select_tests(test_map: dict[str, Any], test_files: list[str], target_files: set[str], functions: list[str],
+                 changed: set[tuple[str, str]] = frozenset()) -> list[str]:
+    """
+    Tests that run the profiled functions or changed functions.
+
+    :param test_map: Map as returned by load_test_map
+    :param test_files: Test files of the requested test path, tests elsewhere are not selected
+    :param target_files: Files of the profiled modules
+    :param functions: Profiled function or Class.method names, every function of the target files when empty
+    :param changed: (file, qualified name) of changed functions whose tests are selected too
+    :return: Node ids of the selected tests, with absolute paths so that pytest can run them from anywhere
+    """
+    test_files = set(test_files)
+    selected = []
+    for nodeid, test in test_map["tests"].items():
+        if test["path"] not in test_files:
+            continue
+        if any((filename in target_files and (not functions or qualname in functions)) or
+               (filename, qualname) in changed for filename, qualname in test["functions"]):
+            selected.append(nodeid)
+    return selected
+
+
+def select_profiled_tests(test_path: str, modules: list[str], functions: list[str], root: Path,
+                          changed_since: str | None = None) -> list[str]:
+    """
+    Select the tests of a test path that run the profiled functions, or functions changed since a git revision.
+
+    The map from tests to the functions they run is cached in the project, only the test files never mapped or
+    running code that changed since are mapped again.
+
+    :param test_path: Test file or directory
+    :param modules: Profiled modules
+    :param functions: Profiled function or Class.method names, every function of the modules when empty
+    :param root: Project directory, where pytest runs and the cache is kept
+    :param changed_since: Optional git revision, the tests running functions changed since are selected too
+    :return: pytest arguments, a test file when all of its tests are selected, node ids otherwise
+    """
+    cache_file = root / CACHE_DIR / TEST_MAP_FILE
+    test_map = load_test_map(cache_file)
+    test_files = find_test_files(test_path)
+    changed = changed_files(test_map, root)
+    stale = stale_test_files(test_map, test_files, changed)
+    if stale:
+        print(f"Mapping the functions run by the tests of {len(stale)} of {len(test_files)} test files")
+        update_test_map(test_map, stale, root, changed)
+        save_test_map(test_map, cache_file)
+
+    changed_since_functions = changed_functions(root, changed_since) if changed_since else set()
+    selected = select_tests(test_map, test_files, module_files(modules), functions, changed_since_functions)
+    # Whole files keep the command line short
+    tests_by_file = {}
+    for nodeid, test in test_map["tests"].items():
+        tests_by_file.setdefault(test["path"], set()).add(nodeid)
+    selected_by_file = {}
+    for nodeid in selected:
+        selected_by_file.setdefault(test_map["tests"][nodeid]["path"], []).append(nodeid)
+    return [arg for path, nodeids in selected_by_file.items()
+            for arg in ([path] if set(nodeids) == tests_by_file[path] else nodeids)]
+
+
+def _referenced_files(tests: dict[str, Any]) -> set[str]:
+    """Test files and files of the functions run by the given tests."""
+    return {test["path"] for test in tests.values()} | {filename for test in tests.values()
+                                                        for filename, _ in test["functions"]}
+
+
+def _git(root: Path, args: list[str]) -> str | None:
+    """Output of a git command, None if it fails."""
+    try:
+        result = subprocess.run(["git", *args], cwd=root, capture_output=True, text=True, check=False)
+    except OSError:
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _mtime(path: str) -> int | None:
+    """Modification time of a file, None if it does not exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,378 @@
+import json
+import linecache
+import os
+import statistics
+import subprocess
+import sys
+import time
+from importlib.metadata import entry_points
+from typing import Any
+
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.utils.antipattern_utils import HOT_LINE_PERCENT
+from profiling_cli.utils.path_utils import is_project_file
+from profiling_cli.utils.plugin_utils import load_line_stats
+from profiling_cli.utils.stats_utils import median_absolute_deviation
+
+# Module-level statements faster than this are never reported as heavy
+MIN_HEAVY_STATEMENT_SECONDS = 0.001
+
+# Written to stderr right before the import, the -X importtime lines before it are the interpreter's own startup
+IMPORT_MARKER = "profiling-cli: import starts"
+# Written to stderr right after the import, the -X importtime lines after it are the driver's own imports
+IMPORT_END_MARKER = "profiling-cli: import done"
+
+# Run with -X importtime in a fresh interpreter, the module name is the first argument. The last stdout line
+# reports the import time measured in process and the file of every module the import loaded. json is imported
+# after the target so that the modules they share are cold when the target imports them.
+IMPORT_DRIVER_SOURCE = f'''import sys
+import time
+
+_before = set(sys.modules)
+sys.stderr.write("{IMPORT_MARKER}\\n")
+sys.stderr.flush()
+_started = time.perf_counter()
+# importlib.import_module would bypass the C import that -X importtime reports, for the modules it imports itself
+__import__(sys.argv[1])
+_seconds = time.perf_counter() - _started
+_files = {{name: getattr(module, "__file__", None) for name, module in list(sys.modules.items())
+          if name not in _before}}
+sys.stderr.write("{IMPORT_END_MARKER}\\n")
+sys.stderr.flush()
+import json
+print()
+print(json.dumps({{"import_seconds": _seconds, "files": _files}}))
+'''
+
+# Line profiles the module-level code of a module while a fresh interpreter imports it, the module name and the
+# output file are the arguments. The module is executed by its own import, after its parent packages, so that what
+# it imports is as cold as in a real start, apart from the modules line_profiler itself needs.
+MODULE_PROFILE_DRIVER_SOURCE = '''import importlib
+import importlib.machinery
+import pickle
+import sys
+import types
+
+from line_profiler import LineProfiler
+
+_name, _output_file = sys.argv[1:3]
+_profiler = LineProfiler()
+
+
+class _ProfilingFinder:
+    @staticmethod
+    def find_spec(fullname, path=None, target=None):
+        if fullname != _name:
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or not isinstance(spec.loader, importlib.machinery.SourceFileLoader):
+            return spec
+        loader = spec.loader
+
+        def exec_module(module):
+            execute = types.FunctionType(loader.get_code(fullname), module.__dict__)
+            _profiler.add_function(execute)
+            _profiler.runcall(execute)
+
+        spec.loader = types.SimpleNamespace(create_module=loader.create_module, exec_module=exec_module)
+        return spec
+
+
+sys.meta_path.insert(0, _ProfilingFinder)
+importlib.import_module(_name)
+with open(_output_file, "wb") as f:
+    pickle.dump(_profiler.get_stats(), f)
+'''
+
+
+def resolve_startup_target(target: str) -> str:
+    """
+    Module to import for a module, an entry point or a console script.
+
+    :param target: A module (pkg.cli), an entry point (pkg.cli:main) or the name of an installed console script
+    :return: The module name, only the import is measured, the entry point function is not called
+    """
+    if ":" in target:
+        return target.split(":", 1)[0]
+    for entry_point in entry_points(group="console_scripts", name=target):
+        return entry_point.module
+    return target
+
+
+def parse_importtime(output: str) -> list[dict[str, Any]]:
+    """
+    Parse the -X importtime report into the import tree.
+
+    The report lists a module once its import finished, after the modules it imported, which are indented one
+    level deeper.
+
+    :param output: Lines of the report, e.g. the stderr of `python -X importtime -c "import mod"`
+    :return: Root modules in import order, each with name, self, cumulative (in seconds) and children keys
+    """
+    pending = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2][1:].rstrip()
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        node = {"name": name.strip(), "self": int(parts[0]) / 1e6, "cumulative": int(parts[1]) / 1e6,
+                "children": []}
+        while pending and pending[-1][0] > depth:
+            node["children"].insert(0, pending.pop()[1])
+        pending.append((depth, node))
+    return [node for _, node in pending]
+
+
+def run_import_passes(module: str, repeat: int, cwd: str | None = None) -> list[dict[str, Any]]:
+    """
+    Import a module in fresh interpreters, each one reporting its import tree.
+
+    :param module: Module to import
+    :param repeat: Number of interpreters
+    :param cwd: Optional directory the interpreters run in, the current one if not provided
+    :return: One dict per interpreter with process_seconds (whole run, interpreter startup included),
+             interpreter_seconds (same interpreter doing nothing), import_seconds, tree and files (file of every
+             module the import loaded) keys
+    :raises RuntimeError: If the module cannot be imported
+    """
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], cwd=cwd, check=True)
+        interpreter_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_DRIVER_SOURCE, module],
+                                 cwd=cwd, capture_output=True, text=True, check=False)
+        process_seconds = time.perf_counter() - started
+        if process.returncode:
+            raise RuntimeError(f"Could not import {module}:\n{process.stderr.split(IMPORT_MARKER)[-1].strip()}")
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        runs.append({"process_seconds": process_seconds, "interpreter_seconds": interpreter_seconds,
+                     "import_seconds": result["import_seconds"],
+                     "tree": parse_importtime(process.stderr.split(IMPORT_MARKER)[-1].split(IMPORT_END_MARKER)[0]),
+                     "files": result["files"]})
+    return runs
+
+
+def aggregate_import_runs(runs: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Median import tree of several interpreters.
+
+    :param runs: Interpreters as returned by run_import_passes
+    :return: Dict with runs, process_seconds, interpreter_seconds, import_seconds (each with median and mad keys),
+             tree (the tree of the first run with the median times) and modules (self, cumulative, depth and file
+             by module name) keys
+    """
+    times = {}
+    for run in runs:
+        for node, _ in _walk(run["tree"]):
+            module_times = times.setdefault(node["name"], {"self": [], "cumulative": []})
+            module_times["self"].append(node["self"])
+            module_times["cumulative"].append(node["cumulative"])
+
+    def _median_tree(nodes: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        return [{"name": node["name"], "self": statistics.median(times[node["name"]]["self"]),
+                 "cumulative": statistics.median(times[node["name"]]["cumulative"]),
+                 "children": _median_tree(node["children"])} for node in nodes]
+
+    tree = _median_tree(runs[0]["tree"])
+    modules = {node["name"]: {"self": node["self"], "cumulative": node["cumulative"], "depth": depth,
+                              "file": runs[0]["files"].get(node["name"])}
+               for node, depth in _walk(tree)}
+    return {"runs": len(runs), "tree": tree, "modules": modules,
+            **{key: {"median": statistics.median(run[key] for run in runs),
+                     "mad": median_absolute_deviation([run[key] for run in runs])}
+               for key in ("process_seconds", "interpreter_seconds", "import_seconds")}}
+
+
+def slowest_modules(aggregate: dict[str, Any], top: int, root: str | None = None) -> list[str]:
+    """
+    Modules with the most time spent in their own module-level code.
+
+    :param aggregate: Aggregated runs as returned by aggregate_import_runs
+    :param top: Number of modules
+    :param root: Optional project directory, only the Python files under it and outside of environments count
+    :return: Module names, slowest first
+    """
+    names = sorted(aggregate["modules"], key=lambda name: -aggregate["modules"][name]["self"])
+    if root is not None:
+        names = [name for name in names if is_project_file(aggregate["modules"][name]["file"], root)]
+    return names[:top]
+
+
+def profile_module_execution(module: str, output_file: str, cwd: str | None = None) -> LineStats | None:
+    """
+    Line profile the module-level statements of a module while a fresh interpreter imports it.
+
+    :param module: Module to profile
+    :param output_file: File the stats are saved to
+    :param cwd: Optional directory the interpreter runs in, the current one if not provided
+    :return: The stats, None if the module could not be profiled
+    """
+    process = subprocess.run([sys.executable, "-c", MODULE_PROFILE_DRIVER_SOURCE, module, output_file], cwd=cwd,
+                             capture_output=True, text=True, check=False)
+    if process.returncode or not os.path.exists(output_file):
+        print(f"Could not line profile the module-level code of {module}: {process.stderr.strip()}")
+        return None
+    return load_line_stats(output_file)
+
+
+def format_module_line_stats(stats: LineStats) -> str:
+    """
+    Format module-level line stats in the line_profiler text format.
+
+    line_profiler only prints the first block of code from the line a function starts at, for a module that is
+    its first statement, so every statement that ran is printed here.
+
+    :param stats: Stats with one <module> entry per profiled module
+    :return: Stats in line_profiler text format
+    """
+    lines = [f"Timer unit: {stats.unit:g} s", ""]
+    for (filename, start_lineno, name), timings in stats.timings.items():
+        total_time = sum(time_value for _, _, time_value in timings)
+        lines += [f"Total time: {total_time * stats.unit:g} s", f"File: {filename}",
+                  f"Function: {name} at line {start_lineno}", "",
+                  f"{'Line #':>6} {'Hits':>9} {'Time':>12} {'Per Hit':>8} {'% Time':>8}  Line Contents",
+                  "=" * 62]
+        for lineno, nhits, time_value in sorted(timings):
+            percent = 100 * time_value / total_time if total_time else 0.0
+            lines.append(f"{lineno:>6} {nhits:>9} {time_value:>12.1f} {time_value / nhits:>8.1f} {percent:>8.1f}  "
+                         f"{linecache.getline(filename, lineno).rstrip()}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def find_heavy_statements(stats: LineStats, hot_percent: float = HOT_LINE_PERCENT,
+                          min_seconds: float = MIN_HEAVY_STATEMENT_SECONDS) -> list[dict[str, Any]]:
+    """
+    Module-level statements taking a large share of their module's execution.
+
+    :param stats: Stats with one <module> entry per profiled module
+    :param hot_percent: Share of the module's execution from which a statement is heavy
+    :param min_seconds: Time under which a statement is not heavy, whatever its share of a small module
+    :return: Statements by decreasing time, with file, line, code, seconds and percent keys
+    """
+    statements = []
+    for (filename, _, _), timings in stats.timings.items():
+        total_time = sum(time_value for _, _, time_value in timings)
+        for lineno, _, time_value in timings:
+            percent = 100 * time_value / total_time if total_time else 0.0
+            if percent >= hot_percent and time_value * stats.unit >= min_seconds:
+                statements.append({"file": filename, "line": lineno,
+                                   "code": linecache.getline(filename, lineno).strip(),
+                                   "seconds": time_value * stats.unit, "percent": percent})
+    return sorted(statements, key=lambda statement: -statement["seconds"])
+
+
+def format_startup_report(module: str, aggregate: dict[str, Any], top: int,
+                          heavy_statements: list[dict[str, Any]] | None = None, min_percent: float = 1.0) -> str:
+    """
+    Format the import time of a module: cold start, import tree, slowest modules and heavy statements.
+
+    :param module: The imported module
+    :param aggregate: Aggregated runs as returned by aggregate_import_runs
+    :param top: Number of slowest modules listed
+    :param heavy_statements: Optional heavy module-level statements, as returned by find_heavy_statements
+    :param min_percent: Share of the import time under which the modules are left out of the tree
+    :return: Human readable report
+    """
+    import_seconds = aggregate["import_seconds"]["median"]
+    lines = [(f"Cold start of {module} over {aggregate['runs']} fresh interpreters (median ± MAD, under "
+              f"-X importtime): process {_ms_spread(aggregate['process_seconds'])}, of which interpreter startup "
+              f"{_ms_spread(aggregate['interpreter_seconds'])} and import {_ms_spread(aggregate['import_seconds'])}"),
+             "", f"Import tree (cumulative, self), modules over {min_percent:g}% of the import time:"]
+    for node, depth in _walk(aggregate["tree"]):
+        if import_seconds and 100 * node["cumulative"] / import_seconds >= min_percent:
+            lines.append(f"    {_ms(node['cumulative'])} {_ms(node['self'])}  {'  ' * depth}{node['name']}")
+
+    lines += ["", "Slowest modules by self time (their own module-level code):"]
+    for name in slowest_modules(aggregate, top):
+        entry = aggregate["modules"][name]
+        share = 100 * entry["self"] / import_seconds if import_seconds else 0.0
+        location = f" ({entry['file']})" if entry["file"] else ""
+        lines.append(f"    {_ms(entry['self'])}  {share:5.1f}%  {name}{location}")
+
+    if heavy_statements is not None:
+        lines += ["", (f"Heavy module-level statements (at least {HOT_LINE_PERCENT:g}% of their module's "
+                       "execution, line profiled so slower than without the tracing):")]
+        lines += [f"    {_ms(statement['seconds'])}  {statement['percent']:5.1f}%  "
+                  f"{os.path.basename(statement['file'])}:{statement['line']}  {statement['code']}"
+                  for statement in heavy_statements] or ["    none"]
+    return "\n".join(lines)
+
+
+def save_startup_baseline(aggregate: dict[str, Any], path: str) -> None:
+    """
+    Save the import times to compare later runs with.
+
+    :param aggregate: Aggregated runs as returned by aggregate_import_runs
+    :param path: Baseline file
+    :return: None
+    """
+    with open(path, 'w') as f:
+        json.dump({key: aggregate[key] for key in ("runs", "process_seconds", "interpreter_seconds",
+                                                   "import_seconds", "modules")}, f, indent=2)
+
+
+def load_startup_baseline(path: str) -> dict[str, Any]:
+    """
+    :param path: Baseline file written by save_startup_baseline
+    :return: The baseline
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def format_baseline_diff(aggregate: dict[str, Any], baseline: dict[str, Any], top: int) -> str:
+    """
+    Compare the import times with a baseline.
+
+    :param aggregate: Aggregated runs as returned by aggregate_import_runs
+    :param baseline: Baseline as returned by load_startup_baseline
+    :param top: Number of modules listed per kind of change
+    :return: Human readable comparison
+    """
+    lines = ["Compared with the baseline (median, the MAD gives the run-to-run noise):"]
+    for key, label in (("process_seconds", "process"), ("import_seconds", "import")):
+        before, after = baseline[key]["median"], aggregate[key]["median"]
+        change = f" ({100 * (after / before - 1):+.1f}%)" if before else ""
+        lines.append(f"    {label}: {_ms(before)} -> {_ms(after)}{change}, "
+                     f"MAD {_ms(baseline[key]['mad'])} -> {_ms(aggregate[key]['mad'])}")
+
+    modules, baseline_modules = aggregate["modules"], baseline["modules"]
+    new = sorted(set(modules) - set(baseline_modules), key=lambda name: -modules[name]["self"])
+    removed = sorted(set(baseline_modules) - set(modules), key=lambda name: -baseline_modules[name]["self"])
+    changed = sorted(set(modules) & set(baseline_modules),
+                     key=lambda name: -abs(modules[name]["self"] - baseline_modules[name]["self"]))
+    if new:
+        lines += ["", f"Newly imported modules ({len(new)}), by self time:"]
+        lines += [f"    {_ms(modules[name]['self'])}  {name}" for name in new[:top]]
+    if removed:
+        lines += ["", f"No longer imported modules ({len(removed)}), by self time:"]
+        lines += [f"    {_ms(baseline_modules[name]['self'])}  {name}" for name in removed[:top]]
+    lines += ["", "Largest self time changes:"]
+    lines += [f"    {_ms(baseline_modules[name]['self'])} -> {_ms(modules[name]['self'])}  {name}"
+              for name in changed[:top]] or ["    none"]
+    return "\n".join(lines)
+
+
+def _walk(nodes: list[dict[str, Any]], depth: int = 0):
+    """Every node of an import tree depth first, with its depth."""
+    for node in nodes:
+        yield node, depth
+        yield from _walk(node["children"], depth + 1)
+
+
+def _ms_spread(measure: dict[str, float]) -> str:
+    """Format a median and its MAD in milliseconds."""
+    return f"{measure['median'] * 1000:.1f} ± {measure['mad'] * 1000:.1f} ms"
+
+
+def _ms(seconds: float) -> str:
+    """Format seconds as milliseconds."""
+    return f"{seconds * 1000:9.3f} ms"
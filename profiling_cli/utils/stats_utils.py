@@ -0,0 +1,174 @@
+import linecache
+import math
+import os
+import statistics
+from typing import Any
+
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.utils.antipattern_utils import HOT_LINE_PERCENT
+
+DEFAULT_CONFIDENCE = 0.95
+
+
+def median_absolute_deviation(values: list[float]) -> float:
+    """
+    Median absolute deviation, a spread estimate that a single slow run cannot blow up.
+
+    :param values: Measurements
+    :return: The MAD, in the unit of the measurements
+    """
+    median = statistics.median(values)
+    return statistics.median(abs(value - median) for value in values)
+
+
+def median_confidence_interval(values: list[float],
+                               confidence: float = DEFAULT_CONFIDENCE) -> tuple[float, float, float]:
+    """
+    Distribution-free confidence interval of the median, from order statistics.
+
+    Timings are skewed (noise only ever slows a run down), so no normality is assumed: the interval between the
+    k-th smallest and k-th largest of n values covers the median with probability 1 - 2 P(Binomial(n, 1/2) < k).
+
+    :param values: Measurements
+    :param confidence: Requested coverage
+    :return: Tuple (low, high, coverage), the narrowest interval reaching the confidence, [min, max] with its
+             actual coverage when there are too few values to reach it
+    """
+    ordered = sorted(values)
+    n = len(ordered)
+    k = _order_statistic_rank(n, confidence)
+    return ordered[k - 1], ordered[n - k], _order_statistic_coverage(n, k)
+
+
+def aggregate_line_stats(runs: list[LineStats], confidence: float = DEFAULT_CONFIDENCE,
+                         hot_percent: float = HOT_LINE_PERCENT) -> dict[str, Any]:
+    """
+    Aggregate the line stats of independent runs of the same tests.
+
+    Lines whose median share of their function's time reaches hot_percent are hotspot candidates. A candidate is
+    robust when the lower bound of the confidence interval of its share still reaches hot_percent, its rank is
+    unstable when the confidence interval of its time overlaps the one of a neighbour in the ranking.
+
+    :param runs: Stats of every run
+    :param confidence: Coverage of the confidence intervals
+    :param hot_percent: Share of its function's time from which a line is a hotspot candidate
+    :return: Dict with runs, coverage, stats (median line stats), functions (name, file, line, median, mad,
+             ci_low, ci_high in seconds) and hotspots (candidates by decreasing median, with function, file, line,
+             code, median, mad, ci_low, ci_high, percent, ci_percent_low, ci_percent_high, rank, rank_low,
+             rank_high, unstable and robust keys)
+    """
+    unit = runs[0].unit
+    line_times = {}
+    line_hits = {}
+    for index, stats in enumerate(runs):
+        for key, entries in stats.timings.items():
+            for lineno, nhits, time_value in entries:
+                line_times.setdefault(key, {}).setdefault(lineno, [0.0] * len(runs))[index] += time_value * stats.unit
+                line_hits.setdefault(key, {}).setdefault(lineno, [0] * len(runs))[index] += nhits
+
+    median_timings = {}
+    functions = []
+    candidates = []
+    for key, lines in line_times.items():
+        totals = [sum(times[index] for times in lines.values()) for index in range(len(runs))]
+        function = _summarize(totals, confidence)
+        functions.append({"name": key[2], "file": key[0], "line": key[1], **function})
+        median_timings[key] = [(lineno, int(statistics.median(line_hits[key][lineno])),
+                                round(statistics.median(times) / unit))
+                               for lineno, times in sorted(lines.items())
+                               if statistics.median(line_hits[key][lineno]) >= 1]
+        if not function["median"]:
+            continue
+        for lineno, times in sorted(lines.items()):
+            # Share of the function's time in each run, so that a run slowed down as a whole does not count
+            shares = [100 * time_value / total if total else 0.0 for time_value, total in zip(times, totals)]
+            if statistics.median(shares) < hot_percent:
+                continue
+            share = _summarize(shares, confidence)
+            candidates.append({"function": key[2], "file": key[0], "line": lineno,
+                               "code": linecache.getline(key[0], lineno).strip(), **_summarize(times, confidence),
+                               "percent": share["median"], "ci_percent_low": share["ci_low"],
+                               "ci_percent_high": share["ci_high"], "times": times})
+
+    candidates.sort(key=lambda candidate: -candidate["median"])
+    run_ranks = [sorted(range(len(candidates)), key=lambda position: -candidates[position]["times"][index])
+                 for index in range(len(runs))]
+    for position, candidate in enumerate(candidates):
+        ranks = [ranking.index(position) + 1 for ranking in run_ranks]
+        neighbours = candidates[max(position - 1, 0):position] + candidates[position + 1:position + 2]
+        candidate.update(rank=position + 1, rank_low=min(ranks), rank_high=max(ranks),
+                         unstable=any(_overlap(candidate, neighbour) for neighbour in neighbours),
+                         robust=candidate["ci_percent_low"] >= hot_percent)
+        del candidate["times"]
+
+    functions.sort(key=lambda function: -function["median"])
+    coverage = _order_statistic_coverage(len(runs), _order_statistic_rank(len(runs), confidence))
+    return {"runs": len(runs), "coverage": coverage, "stats": LineStats(median_timings, unit),
+            "functions": functions, "hotspots": candidates}
+
+
+def format_repeat_report(aggregate: dict[str, Any], hot_percent: float = HOT_LINE_PERCENT) -> str:
+    """
+    Format the aggregated runs: per function spread, robust hotspots and candidates within the noise.
+
+    :param aggregate: Aggregated runs as returned by aggregate_line_stats
+    :param hot_percent: Share of its function's time from which a line is a hotspot candidate
+    :return: Human readable report
+    """
+    lines = [(f"Aggregated over {aggregate['runs']} runs: median ± MAD with the distribution-free "
+              f"{100 * aggregate['coverage']:.1f}% confidence interval (CI) of the median"),
+             "", "Functions:"]
+    for function in aggregate["functions"]:
+        lines.append(f"    {_ms(function['median'])} ± {_ms(function['mad'])} "
+                     f"(CI {_ms(function['ci_low'])} to {_ms(function['ci_high'])})  "
+                     f"{function['name']} ({os.path.basename(function['file'])}:{function['line']})")
+
+    robust = [hotspot for hotspot in aggregate["hotspots"] if hotspot["robust"]]
+    noise = [hotspot for hotspot in aggregate["hotspots"] if not hotspot["robust"]]
+    lines += ["", f"Robust hotspots (at least {hot_percent:g}% of their function's time over the whole CI):"]
+    lines += [_format_hotspot(hotspot) for hotspot in robust] or ["    none"]
+    if noise:
+        lines += ["", (f"Not significant (their CI reaches under {hot_percent:g}%, differences within the "
+                       "run-to-run noise are not findings):")]
+        lines += [_format_hotspot(hotspot) for hotspot in noise]
+    return "\n".join(lines)
+
+
+def _format_hotspot(hotspot: dict[str, Any]) -> str:
+    """One line of the report per hotspot candidate."""
+    stability = f", rank unstable (ranked {hotspot['rank_low']} to {hotspot['rank_high']} across runs)" \
+        if hotspot["unstable"] else ""
+    return (f"    #{hotspot['rank']} {os.path.basename(hotspot['file'])}:{hotspot['line']} in {hotspot['function']}: "
+            f"{hotspot['percent']:.1f}% (CI {hotspot['ci_percent_low']:.1f}% to {hotspot['ci_percent_high']:.1f}%), "
+            f"{_ms(hotspot['median'])} ± {_ms(hotspot['mad'])}{stability}  {hotspot['code']}")
+
+
+def _summarize(values: list[float], confidence: float) -> dict[str, float]:
+    """Median, MAD and confidence interval of the median of measurements."""
+    ci_low, ci_high, _ = median_confidence_interval(values, confidence)
+    return {"median": statistics.median(values), "mad": median_absolute_deviation(values), "ci_low": ci_low,
+            "ci_high": ci_high}
+
+
+def _overlap(first: dict[str, Any], second: dict[str, Any]) -> bool:
+    """Whether the confidence intervals of two hotspots overlap, their order is then not established."""
+    return first["ci_low"] <= second["ci_high"] and second["ci_low"] <= first["ci_high"]
+
+
+def _order_statistic_rank(n: int, confidence: float) -> int:
+    """Largest k whose order statistic interval over n values still reaches the confidence, at least 1."""
+    k = 1
+    while k + 1 <= n // 2 and _order_statistic_coverage(n, k + 1) >= confidence:
+        k += 1
+    return k
+
+
+def _order_statistic_coverage(n: int, k: int) -> float:
+    """Probability that the k-th smallest and k-th largest of n values enclose their median."""
+    return 1 - 2 * sum(math.comb(n, i) for i in range(k)) / 2 ** n
+
+
+def _ms(seconds: float) -> str:
+    """Format seconds as milliseconds."""
+    return f"{seconds * 1000:.3f} ms"
@@ -0,0 +1,235 @@
+import atexit
+import os
+import pickle
+import signal
+import sys
+from pathlib import Path
+from typing import Any
+
+from profiling_cli.consts import (
+    CHILD_STATS_DIR,
+    PROFILE_OUTPUT_DIR,
+    PROFILE_SUBPROCESSES,
+    SUBPROCESS_BOOTSTRAP_DIR,
+)
+from profiling_cli.utils.plugin_utils import (
+    create_profiler,
+    get_batch_targets,
+    get_cpu_stats,
+    get_profile_targets,
+    register_functions,
+    subtract_line_stats,
+)
+
+# Python runs sitecustomize on startup, putting this file first on PYTHONPATH lets every child interpreter
+# start profiling before any user code runs. Any sitecustomize it shadows is imported afterwards.
+BOOTSTRAP_SOURCE = '''# Generated by profiling-cli to line profile child Python processes
+import importlib
+import os
+import sys
+
+if os.environ.get("{env_var}"):
+    # The project and profiling-cli directories the parent imports from, e.g. the rootdir pytest put on its path,
+    # come last so that they never shadow the modules of the child
+    sys.path.extend(path for path in {parent_path!r} if path not in sys.path)
+    try:
+        from profiling_cli.utils.subprocess_utils import start_child_profiling
+        start_child_profiling()
+    except Exception as e:
+        print(f"Could not start child process profiling: {{e}}", file=sys.stderr)
+
+# Chain to the sitecustomize this file shadows, if there is one
+_bootstrap_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path[:] = [path for path in sys.path if os.path.abspath(path or os.curdir) != _bootstrap_dir]
+_bootstrap_module = sys.modules.pop("sitecustomize")
+try:
+    importlib.import_module("sitecustomize")
+except ImportError:
+    # Nothing to chain to, the import of this module by site must still find it
+    sys.modules["sitecustomize"] = _bootstrap_module
+'''
+
+# Per process profiling state, keyed by pid so a parent never dumps its own stats as a child
+_child_profilers: dict[int, tuple[Any, Any]] = {}
+
+
+def enable_subprocess_profiling(profiler: Any, output_dir: str) -> None:
+    """
+    Propagate the profiler configuration into child Python processes.
+
+    Forked children keep the parent's registered functions and only report what ran after the fork.
+    Spawned children and subprocess based Python workers pick up the configuration through a generated
+    sitecustomize module and register the same functions on startup.
+
+    :param profiler: The parent process profiler
+    :param output_dir: Absolute path of the profiling output directory
+    :return: None
+    """
+    bootstrap_dir = Path(output_dir) / SUBPROCESS_BOOTSTRAP_DIR
+    bootstrap_dir.mkdir(parents=True, exist_ok=True)
+    (bootstrap_dir / "sitecustomize.py").write_text(BOOTSTRAP_SOURCE.format(env_var=PROFILE_SUBPROCESSES,
+                                                                           parent_path=_parent_path(bootstrap_dir)))
+
+    # Only children inherit these, the current process is already set up
+    os.environ[PROFILE_OUTPUT_DIR] = output_dir
+    python_path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = os.pathsep.join([str(bootstrap_dir)] + ([python_path] if python_path else []))
+
+    os.register_at_fork(after_in_child=lambda: _track_child(profiler, baseline=_snapshot(profiler)))
+    _patch_multiprocessing()
+
+
+def start_child_profiling() -> None:
+    """Register the configured functions and start profiling in a freshly started child interpreter."""
+    profiler = create_profiler()
+    batch_targets = get_batch_targets()
+    # Children cannot tell which test they run for, they profile the functions of every batch target
+    for modules, functions in ([(target["modules"], target["functions"]) for target in batch_targets]
+                               if batch_targets else [get_profile_targets()]):
+        register_functions(profiler, modules, functions, verbose=False)
+    profiler.enable_by_count()
+    _track_child(profiler, baseline=None)
+    _patch_multiprocessing()
+
+
+def dump_child_stats() -> None:
+    """Write the stats of the current child process to the child stats directory, at most once."""
+    profiler, baseline = _child_profilers.pop(os.getpid(), (None, None))
+    if profiler is None:
+        return
+    # The child is exiting, its profiler must not outlive the modules its sys.monitoring hooks use (Python 3.12+)
+    while profiler.enable_count:
+        profiler.disable_by_count()
+
+    snapshot = _snapshot(profiler)
+    if baseline is not None:
+        snapshot = {name: subtract_line_stats(stats, baseline[name]) for name, stats in snapshot.items()}
+    if not snapshot["stats"].timings:
+        return
+
+    stats_dir = Path(os.environ[PROFILE_OUTPUT_DIR]) / CHILD_STATS_DIR
+    stats_dir.mkdir(parents=True, exist_ok=True)
+    stats_file = stats_dir / f"{os.getpid()}.lprof"
+    # Write atomically so the parent never reads a partial file
+    tmp_file = stats_file.with_suffix(".tmp")
+    with open(tmp_file, "wb") as f:
+        command = " ".join([os.path.basename(sys.argv[0])] + sys.argv[1:]) if sys.argv else "python"
+        pickle.dump({"pid": os.getpid(), "parent_pid": os.getppid(), "command": command, **snapshot}, f)
+    os.replace(tmp_file, stats_file)
+
+
+def collect_child_stats(output_dir: str) -> list[dict[str, Any]]:
+    """
+    Load the partial stats written by child processes.
+
+    :param output_dir: The profiling output directory
+    :return: One dict per child process with pid, parent_pid, command, stats and, when both timers are used,
+             cpu_stats keys
+    """
+    children = []
+    for stats_file in sorted((Path(output_dir) / CHILD_STATS_DIR).glob("*.lprof")):
+        try:
+            with open(stats_file, "rb") as f:
+                children.append(pickle.load(f))
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            print(f"Error loading child stats {stats_file}: {e}")
+    return children
+
+
+def format_process_breakdown(parent_stats: Any, children: list[dict[str, Any]]) -> str:
+    """
+    Format the time spent in profiled functions per process.
+
+    :param parent_stats: Stats of the parent (pytest) process
+    :param children: Child stats as returned by collect_child_stats
+    :return: Human readable per process breakdown
+    """
+    processes = [{"pid": os.getpid(), "parent_pid": None, "command": "pytest", "stats": parent_stats}] + children
+    total = sum(_total_seconds(process["stats"]) for process in processes) or 1.0
+
+    lines = []
+    for process in processes:
+        stats = process["stats"]
+        process_total = _total_seconds(stats)
+        role = f"child of {process['parent_pid']}" if process['parent_pid'] else "parent"
+        lines.append(f"Process {process['pid']} ({role}, {process['command'][:80]}): {process_total:.6f} s, "
+                     f"{100 * process_total / total:.1f}% of profiled time")
+        function_times = sorted(((sum(entry[2] for entry in entries) * stats.unit, key)
+                                 for key, entries in stats.timings.items()), reverse=True)
+        for seconds, (filename, lineno, func_name) in function_times:
+            if seconds:
+                lines.append(f"    {seconds:.6f} s  {func_name} ({os.path.basename(filename)}:{lineno})")
+    return "\n".join(lines)
+
+
+def _snapshot(profiler: Any) -> dict[str, Any]:
+    """Current stats of the profiler, plus the CPU time stats when both timers are used."""
+    snapshot = {"stats": profiler.get_stats()}
+    cpu_stats = get_cpu_stats(profiler)
+    if cpu_stats is not None:
+        snapshot["cpu_stats"] = cpu_stats
+    return snapshot
+
+
+def _parent_path(bootstrap_dir: Path) -> list[str]:
+    """Directories on the path of the current process, without those of the Python environment."""
+    excluded = tuple(os.path.abspath(prefix) + os.sep for prefix in {sys.prefix, sys.base_prefix})
+    paths = []
+    for path in sys.path:
+        path = os.path.abspath(path or os.curdir)
+        if (os.path.isdir(path) and not (path + os.sep).startswith(excluded) and path != str(bootstrap_dir)
+                and path not in paths):
+            paths.append(path)
+    return paths
+
+
+def _total_seconds(stats: Any) -> float:
+    """Total time recorded in a stats object, in seconds."""
+    return sum(entry[2] for entries in stats.timings.values() for entry in entries) * stats.unit
+
+
+def _track_child(profiler: Any, baseline: Any) -> None:
+    """Remember the profiler of the current child process and dump its stats on exit."""
+    _child_profilers[os.getpid()] = (profiler, baseline)
+    atexit.register(dump_child_stats)
+    _dump_on_terminate()
+
+
+def _dump_on_terminate() -> None:
+    """
+    Dump stats before a child is terminated, e.g. multiprocessing.Pool workers are stopped with SIGTERM.
+    """
+    if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+        # The program installed its own handler which is expected to exit cleanly
+        return
+
+    def _handler(signum, frame):
+        dump_child_stats()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    try:
+        signal.signal(signal.SIGTERM, _handler)
+    except ValueError:
+        # Signal handlers can only be installed from the main thread
+        pass
+
+
+def _patch_multiprocessing() -> None:
+    """
+    Dump stats when a multiprocessing child finishes, since it exits through os._exit and skips atexit.
+    """
+    from multiprocessing.process import BaseProcess
+
+    original_bootstrap = BaseProcess._bootstrap
+    if getattr(original_bootstrap, "_profiling_cli_patched", False):
+        return
+
+    def _bootstrap(self, *args, **kwargs):
+        try:
+            return original_bootstrap(self, *args, **kwargs)
+        finally:
+            dump_child_stats()
+
+    _bootstrap._profiling_cli_patched = True
+    BaseProcess._bootstrap = _bootstrap
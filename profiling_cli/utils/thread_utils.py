@@ -0,0 +1,237 @@
+import os
+import sys
+import threading
+import time
+from typing import Any
+
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.consts import TimerConst
+
+# Share of wall time spent off-CPU above which a thread is reported as starved
+STARVED_THREAD_THRESHOLD = 0.5
+
+
+class ThreadLineTracer:
+    """
+    Line tracer recording wall time and per-thread CPU time for every line of the registered functions,
+    separately for each thread.
+
+    It mirrors the parts of the LineProfiler API the plugin uses, so it can replace it when a thread
+    breakdown or a CPU timer is requested. It is implemented in Python on top of sys.settrace and is slower
+    than line_profiler, only the registered functions pay the per-line cost.
+    """
+
+    def __init__(self, timer: str = TimerConst.WALL) -> None:
+        """
+        :param timer: Timer reported by get_stats by default, wall or cpu time (both reports wall time)
+        """
+        self.timer = timer
+        self.functions = []
+        self.enable_count = 0
+        self._codes = set()
+        # (thread ident, thread name) -> code key -> line number -> [hits, wall ns, cpu ns]
+        self._line_timings: dict[tuple[int, str], dict[tuple, dict[int, list[int]]]] = {}
+        # (thread ident, thread name) -> code key -> number of calls
+        self._calls: dict[tuple[int, str], dict[tuple, int]] = {}
+        # (thread ident, thread name) -> [first call, last return] wall clock in ns, to detect concurrency
+        self._active: dict[tuple[int, str], list[int]] = {}
+        # Trace functions installed before enable, e.g. coverage's, put back by disable
+        self._previous_traces: tuple[Any, Any] = (None, None)
+
+    def add_function(self, func: Any) -> None:
+        """
+        Register a function, method or classmethod to trace.
+        :param func: The callable to trace
+        :return: None
+        """
+        code = getattr(getattr(func, '__func__', func), '__code__', None)
+        if code is None:
+            print(f"Cannot trace {func}, it has no Python code")
+            return
+        self.functions.append(func)
+        self._codes.add(code)
+
+    def enable_by_count(self) -> None:
+        """Enable tracing, nested calls must be matched by disable_by_count."""
+        if self.enable_count == 0:
+            self.enable()
+        self.enable_count += 1
+
+    def disable_by_count(self) -> None:
+        """Disable tracing once every enable_by_count call has been matched."""
+        if self.enable_count > 0:
+            self.enable_count -= 1
+            if self.enable_count == 0:
+                self.disable()
+
+    def enable(self) -> None:
+        """
+        Start tracing the current thread and the threads started from now on. Threads already running are traced
+        from Python 3.12, before it they cannot be traced from another thread.
+        """
+        self._previous_traces = (sys.gettrace(), threading.gettrace())
+        if hasattr(threading, 'settrace_all_threads'):
+            threading.settrace_all_threads(self._trace_call)
+        else:
+            threading.settrace(self._trace_call)
+        sys.settrace(self._trace_call)
+
+    def disable(self) -> None:
+        """Stop tracing and put back the trace functions installed before enable."""
+        previous_trace, previous_thread_trace = self._previous_traces
+        if hasattr(threading, 'settrace_all_threads'):
+            # Other threads get the hook new threads start with, coverage's installs their own tracer again
+            threading.settrace_all_threads(previous_thread_trace)
+        else:
+            threading.settrace(previous_thread_trace)
+        sys.settrace(previous_trace)
+        self._previous_traces = (None, None)
+
+    def get_stats(self, timer: str | None = None) -> LineStats:
+        """
+        Get the line stats of all threads combined, in the same format as LineProfiler.get_stats.
+        :param timer: cpu for CPU time, wall for wall time, defaults to the tracer's timer
+        :return: Line stats with times in nanoseconds
+        """
+        return LineStats(self._aggregate_timings(cpu=(timer or self.timer) == TimerConst.CPU), 1e-9)
+
+    def get_thread_stats(self) -> list[dict[str, Any]]:
+        """
+        Get the statistics of every thread that ran registered code.
+        :return: One dict per thread with thread, calls, wall, cpu (seconds), active (first and last ns
+                 timestamps in registered code) and functions keys, where functions maps each code key to its
+                 calls, wall, cpu and lines
+        """
+        thread_stats = []
+        for thread, functions in self._line_timings.items():
+            thread_functions = {}
+            for key, lines in functions.items():
+                thread_functions[key] = {
+                    'calls': self._calls.get(thread, {}).get(key, 0),
+                    'wall': sum(entry[1] for entry in lines.values()) * 1e-9,
+                    'cpu': sum(entry[2] for entry in lines.values()) * 1e-9,
+                    'lines': {lineno: (entry[0], entry[1] * 1e-9, entry[2] * 1e-9) for lineno, entry in lines.items()}
+                }
+            thread_stats.append({
+                'thread': thread[1],
+                'thread_id': thread[0],
+                'calls': sum(function['calls'] for function in thread_functions.values()),
+                'wall': sum(function['wall'] for function in thread_functions.values()),
+                'cpu': sum(function['cpu'] for function in thread_functions.values()),
+                'active': tuple(self._active.get(thread, (0, 0))),
+                'functions': thread_functions
+            })
+        return thread_stats
+
+    def _aggregate_timings(self, cpu: bool = False) -> dict[tuple, list[tuple[int, int, int]]]:
+        """Combine the per-thread wall or CPU times into line_profiler's timings format."""
+        combined = {}
+        for functions in self._line_timings.values():
+            for key, lines in functions.items():
+                combined_lines = combined.setdefault(key, {})
+                for lineno, (hits, wall, cpu_time) in lines.items():
+                    hits_and_time = combined_lines.setdefault(lineno, [0, 0])
+                    hits_and_time[0] += hits
+                    hits_and_time[1] += cpu_time if cpu else wall
+        return {key: [(lineno, hits, time_value) for lineno, (hits, time_value) in sorted(lines.items())]
+                for key, lines in combined.items()}
+
+    def _trace_call(self, frame: Any, event: str, arg: Any) -> Any:
+        """Global trace function, only returns a line tracer for frames of registered code."""
+        code = frame.f_code
+        if event != 'call' or code not in self._codes or self.enable_count == 0:
+            return None
+
+        current_thread = threading.current_thread()
+        thread = (current_thread.ident, current_thread.name)
+        key = (code.co_filename, code.co_firstlineno, code.co_name)
+        lines = self._line_timings.setdefault(thread, {}).setdefault(key, {})
+        calls = self._calls.setdefault(thread, {})
+        calls[key] = calls.get(key, 0) + 1
+        active = self._active.setdefault(thread, [time.perf_counter_ns(), 0])
+
+        # Last line seen in this frame and the clocks when it started, the tracer's own work is not counted
+        state = [None, time.perf_counter_ns(), time.thread_time_ns()]
+
+        def _trace_line(frame: Any, event: str, arg: Any) -> Any:
+            # Clocks read in the reverse order of the start, so the CPU time of a line never exceeds its wall time
+            cpu = time.thread_time_ns()
+            wall = time.perf_counter_ns()
+            if state[0] is not None:
+                entry = lines[state[0]]
+                entry[1] += wall - state[1]
+                entry[2] += cpu - state[2]
+            if event == 'line':
+                entry = lines.get(frame.f_lineno)
+                if entry is None:
+                    entry = lines[frame.f_lineno] = [0, 0, 0]
+                entry[0] += 1
+                state[0] = frame.f_lineno
+            elif event == 'return':
+                state[0] = None
+                active[1] = wall
+            state[1] = time.perf_counter_ns()
+            state[2] = time.thread_time_ns()
+            return _trace_line
+
+        return _trace_line
+
+
+def format_thread_report(thread_stats: list[dict[str, Any]], top_lines: int = 5) -> str:
+    """
+    Format the per-thread breakdown with CPU vs wall time and GIL contention indicators.
+
+    The contention score of a thread is the share of its wall time in profiled code spent off-CPU. It is only
+    computed for threads that ran profiled code at the same time as other threads, in which case that time is
+    mostly spent waiting for the GIL (or for I/O), a thread waiting on its own is just doing I/O.
+
+    :param thread_stats: Stats as returned by ThreadLineTracer.get_thread_stats
+    :param top_lines: Number of slowest lines to show per thread
+    :return: Human readable report
+    """
+    if not thread_stats:
+        return "No thread ran the profiled functions"
+
+    def _is_concurrent(thread: dict[str, Any]) -> bool:
+        start, end = thread['active']
+        return any(other is not thread and other['active'][0] < end and start < other['active'][1]
+                   for other in thread_stats)
+
+    concurrent_threads = [thread for thread in thread_stats if _is_concurrent(thread)]
+    lines = [f"Threads that ran profiled code: {len(thread_stats)}, concurrently: {len(concurrent_threads)}",
+             f"{'Thread':<32} {'Calls':>8} {'Wall (s)':>12} {'CPU (s)':>12} {'Off-CPU %':>10} {'Contention':>11}"]
+
+    weighted_contention = 0.0
+    total_wall = 0.0
+    starved = []
+    for thread in sorted(thread_stats, key=lambda stats: stats['wall'], reverse=True):
+        off_cpu = max(0.0, 1 - thread['cpu'] / thread['wall']) if thread['wall'] else 0.0
+        contention = off_cpu if thread in concurrent_threads else 0.0
+        weighted_contention += contention * thread['wall']
+        total_wall += thread['wall']
+        flag = ''
+        if contention >= STARVED_THREAD_THRESHOLD:
+            flag = '  STARVED'
+            starved.append(thread['thread'])
+        lines.append(f"{thread['thread'][:32]:<32} {thread['calls']:>8} {thread['wall']:>12.6f} "
+                     f"{thread['cpu']:>12.6f} {100 * off_cpu:>9.1f}% {contention:>11.2f}{flag}")
+
+    if concurrent_threads:
+        overall = weighted_contention / total_wall if total_wall else 0.0
+        lines.append(f"\nOverall contention score: {overall:.2f} (0 = always on CPU, 1 = always waiting)")
+        if starved:
+            lines.append(f"Starved threads: {', '.join(starved)}. Their profiled code mostly waits instead of "
+                         f"running, which under threads usually means GIL contention, moving this work to "
+                         f"processes is likely to help if it is CPU bound")
+
+    lines.append("\nPer-thread functions and slowest lines:")
+    for thread in thread_stats:
+        lines.append(f"{thread['thread']}:")
+        for (filename, lineno, func_name), function in thread['functions'].items():
+            lines.append(f"    {func_name} ({os.path.basename(filename)}:{lineno}): {function['calls']} calls, "
+                         f"wall {function['wall']:.6f} s, cpu {function['cpu']:.6f} s")
+            slowest = sorted(function['lines'].items(), key=lambda item: item[1][1], reverse=True)[:top_lines]
+            for line_number, (hits, wall, cpu) in slowest:
+                lines.append(f"        line {line_number}: {hits} hits, wall {wall:.6f} s, cpu {cpu:.6f} s")
+    return "\n".join(lines)
@@ -0,0 +1,126 @@
+import json
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, the peak RSS is reported as unavailable there
+    resource = None
+
+
+def peak_rss(children: bool = False) -> int | None:
+    """
+    Peak resident set size of the current process or of its terminated children.
+
+    :param children: Measure the terminated children instead of the current process
+    :return: Peak RSS in bytes, the largest child for children, None where the platform does not report it
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class StageTimer:
+    """
+    Per-stage trace of a profiling-cli run: wall time of every stage and the peak RSS once it finished.
+
+    Stages are recorded in the order they end, a stage run several times (e.g. agent turns) is recorded
+    every time.
+    """
+
+    def __init__(self, start: float | None = None):
+        """
+        :param start: time.perf_counter() value the run started at, now if not provided
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the wrapped block as a stage, it is recorded even when the block raises.
+
+        :param name: Stage name, see StageConst
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float) -> None:
+        """
+        Record a stage measured by the caller.
+
+        :param name: Stage name, see StageConst
+        :param seconds: Wall time of the stage
+        :return: None
+        """
+        self.stages.append({"stage": name, "seconds": seconds, "peak_rss": peak_rss()})
+
+    def since_start(self) -> float:
+        """
+        :return: Seconds elapsed since the run started
+        """
+        return time.perf_counter() - self.start
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        :return: The trace with total_seconds, peak_rss, children_peak_rss (pytest and other subprocesses)
+                 and stages keys, sizes in bytes or None where the platform does not report them
+        """
+        return {"total_seconds": self.since_start(), "peak_rss": peak_rss(),
+                "children_peak_rss": peak_rss(children=True), "stages": list(self.stages)}
+
+    def write_json(self, path: str) -> None:
+        """
+        Write the trace as JSON.
+
+        :param path: Output file
+        :return: None
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def format(self) -> str:
+        """
+        :return: Human readable trace with one line per stage
+        """
+        trace = self.to_dict()
+        total = trace["total_seconds"] or 1.0
+        lines = ["Stage timings:"]
+        for stage in trace["stages"]:
+            lines.append(f"  {stage['stage']:<18} {stage['seconds']:>9.3f} s  {100 * stage['seconds'] / total:5.1f}%"
+                         f"  peak RSS {_format_rss(stage['peak_rss'])}")
+        lines.append(f"  {'total':<18} {trace['total_seconds']:>9.3f} s")
+        lines.append(f"Peak RSS: {_format_rss(trace['peak_rss'])}, "
+                     f"largest subprocess {_format_rss(trace['children_peak_rss'])}")
+        return "\n".join(lines)
+
+
+def _format_rss(size: int | None) -> str:
+    """
+    :param size: Peak RSS as returned by peak_rss
+    :return: The formatted size, "unavailable" where the platform does not report it
+    """
+    return "unavailable" if size is None else format_bytes(size)
+
+
+def format_bytes(size: float) -> str:
+    """
+    Format a size in bytes with a binary unit.
+
+    :param size: Size in bytes
+    :return: e.g. "12.5 MiB"
+    """
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
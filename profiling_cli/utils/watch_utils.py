@@ -0,0 +1,199 @@
+import difflib
+import importlib
+import inspect
+import os
+import sys
+import textwrap
+from types import ModuleType
+from typing import Any
+
+from profiling_cli.utils.path_utils import is_project_file
+from profiling_cli.utils.selection_utils import function_spans
+
+
+def project_modules(root: str) -> dict[str, list[ModuleType]]:
+    """
+    :param root: Project directory
+    :return: Imported modules of the project by absolute file, a file imported under two names has two modules
+    """
+    modules = {}
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if is_project_file(path, root):
+            modules.setdefault(str(path), []).append(module)
+    return modules
+
+
+def function_lines(path: str, source: str) -> dict[str, dict[int, str]]:
+    """
+    :param path: Python file
+    :param source: Content of the file
+    :return: Lines of every function of the file, {line number: code} by qualified name
+    """
+    lines = source.splitlines()
+    return {qualname: {lineno: lines[lineno - 1] for lineno in range(first_line, last_line + 1)}
+            for qualname, first_line, last_line in function_spans(path, source)}
+
+
+def changed_function_names(path: str, old_source: str, new_source: str) -> set[str]:
+    """
+    Functions whose code differs between two versions of a file, ignoring the functions that only moved.
+
+    :param path: Python file
+    :param old_source: Previous content of the file
+    :param new_source: Current content of the file
+    :return: Qualified names of the changed or new functions
+    """
+    old_functions = function_lines(path, old_source)
+    changed = set()
+    for qualname, lines in function_lines(path, new_source).items():
+        old_lines = old_functions.get(qualname)
+        if old_lines is None or textwrap.dedent("\n".join(lines.values())) != \
+                textwrap.dedent("\n".join(old_lines.values())):
+            changed.add(qualname)
+    return changed
+
+
+def reload_module(module: ModuleType) -> None:
+    """
+    Execute the changed source of a module again, updating its functions and classes in place.
+
+    The functions keep their identity and get the new code, so that the references other modules, fixtures and
+    the collected tests took run the new code too. When the module fails to execute its previous namespace is
+    restored.
+
+    :param module: The module
+    :return: None
+    :raises Exception: Any error raised by the new source
+    """
+    old_namespace = dict(vars(module))
+    # The bytecode cache is checked against the modification time in seconds, a quick save may look unchanged
+    if getattr(module, "__cached__", None):
+        try:
+            os.remove(module.__cached__)
+        except OSError:
+            pass
+    try:
+        importlib.reload(module)
+    except Exception:
+        vars(module).update(old_namespace)
+        raise
+    for name, old in old_namespace.items():
+        new = vars(module).get(name)
+        if new is None or new is old or getattr(old, "__module__", None) != module.__name__:
+            continue
+        if inspect.isfunction(old) and inspect.isfunction(new):
+            if update_function(old, new):
+                setattr(module, name, old)
+        elif inspect.isclass(old) and inspect.isclass(new):
+            update_class(old, new)
+            setattr(module, name, old)
+
+
+def update_function(old: Any, new: Any) -> bool:
+    """
+    Give a function the code of its new version.
+
+    :param old: Function the references point to
+    :param new: New version of the function
+    :return: False if the function cannot take the new code, e.g. its closure changed
+    """
+    # Decorators wrap the function, its closure points to the wrapped function
+    old_wrapped, new_wrapped = getattr(old, "__wrapped__", None), getattr(new, "__wrapped__", None)
+    if inspect.isfunction(old_wrapped) and inspect.isfunction(new_wrapped) and \
+            not update_function(old_wrapped, new_wrapped):
+        return False
+    try:
+        old.__code__ = new.__code__
+    except ValueError:
+        return False
+    old.__defaults__, old.__kwdefaults__ = new.__defaults__, new.__kwdefaults__
+    old.__annotations__ = new.__annotations__
+    old.__dict__.update({key: value for key, value in new.__dict__.items() if key != "__wrapped__"})
+    return True
+
+
+def update_class(old: type, new: type) -> None:
+    """
+    Give a class the methods and attributes of its new version, existing instances included.
+
+    :param old: Class the references and instances point to
+    :param new: New version of the class
+    :return: None
+    """
+    for name, new_value in vars(new).items():
+        if name in ("__dict__", "__weakref__"):
+            continue
+        old_value = vars(old).get(name)
+        # Static and class methods hold their function in __func__
+        old_function = getattr(old_value, "__func__", old_value)
+        new_function = getattr(new_value, "__func__", new_value)
+        if type(old_value) is type(new_value) and inspect.isfunction(old_function) and \
+                inspect.isfunction(new_function) and update_function(old_function, new_function):
+            continue
+        try:
+            setattr(old, name, new_value)
+        except (AttributeError, TypeError):
+            pass
+
+
+def line_time_delta(before_times: dict[int, float], before_lines: dict[int, str], after_times: dict[int, float],
+                    after_lines: dict[int, str]) -> list[dict[str, Any]]:
+    """
+    Match the lines of two versions of a function by their code and compare their time.
+
+    :param before_times: Seconds spent on every line of the previous version
+    :param before_lines: Code of every line of the previous version
+    :param after_times: Seconds spent on every line of the current version
+    :param after_lines: Code of every line of the current version
+    :return: Rows with line (None for a removed line), code, before and after (seconds, None when the line does not
+             exist in that version) keys, in the order of the current version, removed lines last
+    """
+    before_numbers, after_numbers = list(before_lines), list(after_lines)
+    matcher = difflib.SequenceMatcher(None, [before_lines[number].strip() for number in before_numbers],
+                                      [after_lines[number].strip() for number in after_numbers], autojunk=False)
+    matched = {}
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            matched[after_numbers[block.b + offset]] = before_numbers[block.a + offset]
+    rows = [{"line": number, "code": after_lines[number],
+             "before": before_times.get(matched[number], 0.0) if number in matched else None,
+             "after": after_times.get(number, 0.0)} for number in after_numbers]
+    kept = set(matched.values())
+    rows += [{"line": None, "code": before_lines[number], "before": before_times[number], "after": None}
+             for number in before_numbers if number not in kept and before_times.get(number)]
+    return rows
+
+
+def format_function_delta(name: str, tests: int, before_times: dict[int, float], after_times: dict[int, float],
+                          rows: list[dict[str, Any]] | None = None) -> str:
+    """
+    Format the time of a function before and after a change, over the same tests.
+
+    :param name: Qualified name of the function
+    :param tests: Number of tests the times were measured over
+    :param before_times: Seconds spent on every line before the change
+    :param after_times: Seconds spent on every line after the change
+    :param rows: Optional lines as returned by line_time_delta, the lines that took time or changed are listed
+    :return: Human readable delta
+    """
+    before, after = sum(before_times.values()), sum(after_times.values())
+    change = f" ({(after - before) / before * 100:+.1f}%)" if before else ""
+    lines = [f"{name}: {_ms(before)} -> {_ms(after)}{change} over {tests} tests"]
+    if rows:
+        lines.append(f"{'Line':>6} {'Before':>11} {'After':>11} {'Delta':>11}  Code")
+        for row in rows:
+            if row["before"] is not None and row["after"] is not None and not (row["before"] or row["after"]):
+                # Unchanged line that took no time
+                continue
+            before_text = _ms(row["before"]) if row["before"] is not None else "new"
+            after_text = _ms(row["after"]) if row["after"] is not None else "removed"
+            delta = f"{(row['after'] or 0.0) * 1000 - (row['before'] or 0.0) * 1000:+.3f} ms"
+            line = row["line"] if row["line"] is not None else "-"
+            lines.append(f"{line:>6} {before_text:>11} {after_text:>11} {delta:>11}  {row['code'].strip()}")
+    return "\n".join(lines)
+
+
+def _ms(seconds: float) -> str:
+    """Format seconds as milliseconds."""
+    return f"{seconds * 1000:.3f} ms"
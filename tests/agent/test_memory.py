@@ -0,0 +1,74 @@
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from profiling_cli.agent.memory import (
+    PINNED_CONTEXT_NOTE,
+    ProfilingSessionMemory,
+    extract_latest_code,
+)
+
+PROFILING_CONTEXT = "LINE PROFILER RESULTS: slow_function spends 90% of its time on line 12"
+
+
+def test_extract_latest_code():
+    """Test that the last code block of a response is kept."""
+    response = "Before:\n```python\ndef old():\n    pass\n```\nAfter:\n```python\ndef new():\n    return 1\n```"
+    assert extract_latest_code(response) == "def new():\n    return 1"
+    assert extract_latest_code("No code here") is None
+
+
+def test_memory_pins_context_and_summarizes_old_turns():
+    """Test the pinned context, the sliding window and the summary of older turns."""
+    llm = FakeListChatModel(responses=["Summary of the first turns"] * 10)
+    memory = ProfilingSessionMemory(llm=llm, window_turns=2, profiling_context=PROFILING_CONTEXT)
+
+    assert memory.load_memory_variables({})["chat_history"] == []
+    memory.save_context({"input": f"Analyze this: {PROFILING_CONTEXT}"},
+                        {"output": "Use a set.\n```python\ndef slow_function():\n    return set()\n```"})
+    for turn in range(3):
+        memory.save_context({"input": f"Question {turn}"}, {"output": f"Answer {turn}"})
+
+    history = memory.load_memory_variables({})["chat_history"]
+    assert isinstance(history[0], SystemMessage)
+    assert PROFILING_CONTEXT in history[0].content
+    assert "Summary of the first turns" in history[0].content
+    assert "def slow_function():" in history[0].content
+    assert [message.content for message in history[1:]] == ["Question 1", "Answer 1", "Question 2", "Answer 2"]
+
+
+def test_memory_stays_under_token_limit():
+    """Test that long turns are summarized to stay under the token ceiling, keeping the latest turn."""
+    llm = FakeListChatModel(responses=["Short summary"] * 10)
+    memory = ProfilingSessionMemory(llm=llm, max_token_limit=200, profiling_context=PROFILING_CONTEXT)
+
+    memory.save_context({"input": f"Analyze this: {PROFILING_CONTEXT}"}, {"output": "x" * 400})
+    memory.save_context({"input": "Explain"}, {"output": "y" * 400})
+
+    history = memory.load_memory_variables({})["chat_history"]
+    assert memory.estimate_memory_tokens() <= 200
+    assert isinstance(history[1], HumanMessage) and history[1].content == "Explain"
+
+
+def test_memory_does_not_store_pinned_context_twice():
+    """Test that the profiling context of the first input is replaced by a reference to the pinned copy."""
+    memory = ProfilingSessionMemory(llm=FakeListChatModel(responses=["summary"]),
+                                    profiling_context=PROFILING_CONTEXT)
+    memory.save_context({"input": f"Analyze this: {PROFILING_CONTEXT}"}, {"output": "Done"})
+
+    assert memory.chat_memory.messages[0].content == f"Analyze this: {PINNED_CONTEXT_NOTE}"
+
+
+def test_memory_keeps_turns_when_pinned_context_is_over_token_limit(capsys):
+    """Test that a profiling context over the ceiling is pinned whole, with a warning, and still leaves the recent
+    turns within the ceiling."""
+    memory = ProfilingSessionMemory(llm=FakeListChatModel(responses=["summary"] * 10), max_token_limit=100)
+    memory.pin_profiling_context("x" * 1000)
+    assert "more than the memory token limit of 100" in capsys.readouterr().out
+
+    for turn in range(3):
+        memory.save_context({"input": f"Question {turn}"}, {"output": f"Answer {turn}"})
+
+    history = memory.load_memory_variables({})["chat_history"]
+    assert "x" * 1000 in history[0].content
+    assert [message.content for message in history[1:]] == ["Question 0", "Answer 0", "Question 1", "Answer 1",
+                                                           "Question 2", "Answer 2"]
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from profiling_cli.agent.routing import format_latency_report
+from profiling_cli.utils.agent_utils import initiate_router
+
+QUESTION = [HumanMessage(content="Why is slow_function slow?")]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI compatible chat completion endpoint, answering after a delay or failing."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        server.requests += 1
+        server.connections.add(self.client_address)
+        time.sleep(server.delay)
+        if server.requests <= server.failures:
+            body, status = json.dumps({"error": {"message": "overloaded"}}).encode(), 529
+        else:
+            body, status = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": server.answer},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}).encode(), 200
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The client gave up on the request
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_endpoint(monkeypatch):
+    """Start local endpoints, stub_endpoint(answer, delay, failures) returns one with its url."""
+    monkeypatch.setenv("OPENAI_API_KEY", "stub-key")
+    servers = []
+
+    def start(answer, delay=0.0, failures=0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        server.daemon_threads = True
+        server.answer, server.delay, server.failures, server.requests, server.connections = answer, delay, failures, \
+            0, set()
+        server.url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def router(*servers, **options):
+    """Router over the given endpoints, in fallback order."""
+    return initiate_router("model-0", "openai", base_url=servers[0].url,
+                           fallback_models=[f"openai:model-{index}@{server.url}"
+                                            for index, server in enumerate(servers[1:], 1)], **options)
+
+
+def test_race_keeps_first_answer(stub_endpoint):
+    """Test that the fastest model answers and the slower request is cancelled."""
+    slow, fast = stub_endpoint("slow answer", delay=2), stub_endpoint("fast answer")
+    llm = router(slow, fast, race=True)
+
+    started = time.perf_counter()
+    response = asyncio.run(llm.ainvoke(QUESTION))
+    assert response.content == "fast answer"
+    assert time.perf_counter() - started < 1.5
+    assert {(latency["model"], latency["status"]) for latency in llm.latencies} == {("openai:model-0", "cancelled"),
+                                                                                   ("openai:model-1", "ok")}
+
+
+def test_fallback_after_retries(stub_endpoint):
+    """Test that a failing model is retried, then the next model in the fallback order answers."""
+    failing, backup = stub_endpoint("never", failures=10), stub_endpoint("backup answer")
+    llm = router(failing, backup, max_retries=1)
+    llm.retry_backoff = 0.01
+
+    assert asyncio.run(llm.ainvoke(QUESTION)).content == "backup answer"
+    assert failing.requests == 2
+    assert [latency["status"] for latency in llm.latencies] == ["error", "error", "ok"]
+    # Synchronous calls follow the same fallback order
+    assert llm.invoke(QUESTION).content == "backup answer"
+    assert failing.requests == 4
+
+
+def test_request_timeout(stub_endpoint):
+    """Test that a model slower than the timeout is given up on, and that no answer at all is an error."""
+    slow, fast = stub_endpoint("slow answer", delay=1), stub_endpoint("fast answer")
+    llm = router(slow, fast, request_timeout=0.2, max_retries=0)
+
+    assert asyncio.run(llm.ainvoke(QUESTION)).content == "fast answer"
+    assert llm.latencies[0]["status"] == "timeout"
+
+    with pytest.raises(RuntimeError, match="No model answered"):
+        asyncio.run(router(slow, request_timeout=0.2, max_retries=0).ainvoke(QUESTION))
+
+
+def test_connections_reused_across_turns(stub_endpoint):
+    """Test that the turns of a session go through the same pooled connection."""
+    server = stub_endpoint("answer")
+    llm = router(server)
+
+    async def session():
+        for _ in range(3):
+            await llm.ainvoke(QUESTION)
+
+    asyncio.run(session())
+    assert server.requests == 3
+    assert len(server.connections) == 1
+
+
+def test_format_latency_report():
+    """Test the per-model summary of the attempts."""
+    latencies = [{"model": "ollama:llama3", "attempt": 0, "status": "timeout", "seconds": 30.0},
+                 {"model": "anthropic:claude", "attempt": 0, "status": "ok", "seconds": 2.0},
+                 {"model": "anthropic:claude", "attempt": 0, "status": "ok", "seconds": 4.0}]
+
+    report = format_latency_report(latencies)
+    assert "- ollama:llama3: 0 answers (no answer), 0 errors, 1 timeouts" in report
+    assert "- anthropic:claude: 2 answers (median 3.00 s, max 4.00 s), 0 errors" in report
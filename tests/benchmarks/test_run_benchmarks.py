@@ -0,0 +1,20 @@
+import importlib
+from pathlib import Path
+
+from profiling_cli.consts import StageConst
+
+BENCHMARKS_DIR = Path(__file__).parents[2] / "benchmarks"
+
+
+def test_pipeline_runs_the_session_with_the_fake_model(tmp_path, monkeypatch):
+    """Test that the benchmark profiles a small project through to the PR with the fake model and fake GitHub."""
+    monkeypatch.syspath_prepend(str(BENCHMARKS_DIR))
+    run_benchmarks = importlib.import_module("run_benchmarks")
+    synthetic_project = importlib.import_module("synthetic_project")
+    modules = synthetic_project.generate_project(tmp_path, **synthetic_project.PROJECT_SIZES["small"])
+
+    trace = run_benchmarks.run_pipeline(tmp_path, modules)
+
+    stages = [stage["stage"] for stage in trace["stages"]]
+    assert stages.count(StageConst.AGENT_TURN) == 1
+    assert stages[-1] == StageConst.PR_TOOLING
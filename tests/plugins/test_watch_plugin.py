@@ -0,0 +1,93 @@
+import os
+import queue
+import signal
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from pathlib import Path
+
+from profiling_cli.consts import (
+    PROFILE_FUNCTIONS,
+    PROFILE_MODULES,
+    PROFILE_WATCH_INTERVAL,
+    WATCH_PLUGIN_MODULE,
+)
+
+SOURCE = textwrap.dedent('''\
+    class Index:
+        def __init__(self, items):
+            self.items = list(items)
+
+        def find(self, item):
+            return item in self.items
+
+
+    def count(items):
+        return len(items)
+''')
+
+TESTS = textwrap.dedent('''\
+    from search import Index, count
+
+
+    def test_find(tmp_path):
+        assert not list(tmp_path.iterdir())
+        (tmp_path / "used").touch()
+        assert Index(range(1000)).find(999)
+
+
+    def test_count():
+        assert count([1, 2]) == 2
+''')
+
+
+def read_until(lines, text, output, timeout=30):
+    """Collect the output lines of the watch process until one contains the text."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            line = lines.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if line is None:
+            break
+        output.append(line)
+        if text in line:
+            return
+    raise AssertionError(f"{text!r} not printed:\n{''.join(output)}")
+
+
+def test_watch_profiles_tests_reaching_a_changed_method(tmp_path):
+    """Test that saving a change to a method reruns only the tests reaching it, with fresh fixtures, and prints the
+    time delta of its lines."""
+    (tmp_path / "search.py").write_text(SOURCE)
+    (tmp_path / "test_search.py").write_text(TESTS)
+    env = {**os.environ, PROFILE_MODULES: "search", PROFILE_FUNCTIONS: "Index.find", PROFILE_WATCH_INTERVAL: "0.05",
+           "PYTHONUNBUFFERED": "1", "PYTHONPATH": os.pathsep.join([str(tmp_path), str(Path(__file__).parents[2])])}
+    process = subprocess.Popen([sys.executable, "-m", "pytest", "-p", WATCH_PLUGIN_MODULE, "test_search.py", "-q",
+                                "-p", "no:cacheprovider"], cwd=tmp_path, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    lines = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line) for line in process.stdout] + [lines.put(None)],
+                     daemon=True).start()
+    output = []
+    try:
+        read_until(lines, "Watching", output)
+        (tmp_path / "search.py").write_text(SOURCE.replace("return item in self.items",
+                                                          "return item in set(self.items)"))
+        read_until(lines, "Profiled again", output)
+        read_until(lines, "return item in set(self.items)", output)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=30)
+        finally:
+            process.kill()
+    report = "".join(output)
+
+    # Methods are matched by qualified name whatever the Python version
+    assert "Changed search.py, running the 1 tests reaching it again" in report
+    assert "failed" not in report and "error" not in report.lower()
+    assert "search.Index.find:" in report
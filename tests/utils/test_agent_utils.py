@@ -6,7 +6,7 @@ from langchain_ollama import OllamaLLM
 from langchain_openai import ChatOpenAI
 
 from profiling_cli.consts import ModelProviderConst, ErrorMessages
-from profiling_cli.utils.agent_utils import initiate_model
+from profiling_cli.utils.agent_utils import initiate_model, parse_model_spec
 
 
 @pytest.mark.parametrize(
@@ -90,3 +90,13 @@ def test_initiate_model_errors(mocker, model, provider, error_type, error_msg):
     mocker.patch.dict(os.environ, clear=True)
     with pytest.raises(error_type, match=error_msg):
         initiate_model(model, provider)
+
+
+def test_parse_model_spec():
+    """Test the models given on the command line, with and without base URL."""
+    assert parse_model_spec("ollama:llama3@http://localhost:11434") == ("ollama", "llama3", "http://localhost:11434")
+    assert parse_model_spec("anthropic:claude-3-5-sonnet-20240620") == ("anthropic", "claude-3-5-sonnet-20240620",
+                                                                       None)
+    for spec in ["llama3", "unknown:model", "openai:"]:
+        with pytest.raises(ValueError, match="Invalid model"):
+            parse_model_spec(spec)
@@ -0,0 +1,74 @@
+import re
+
+import pytest
+
+from profiling_cli.consts import AntiPatternConst
+from profiling_cli.utils.antipattern_utils import (
+    find_antipatterns,
+    format_antipattern_report,
+)
+
+PATTERN_SEPARATOR = ","
+
+
+def slow_function(items, other):
+    seen = []
+    text = ""
+    queue = list(items)
+    for item in items:
+        if item not in seen:
+            seen.append(item)
+        text += str(item) + PATTERN_SEPARATOR
+    while queue:
+        queue.pop(0)
+    pattern = re.compile(r"\d+")
+    matches = [a for a in items for b in other if a == b]
+    return text, pattern, matches
+
+
+def fast_function(items):
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+    return seen
+
+
+def _profile_data(function, percent_time=10.0):
+    """Profile data of a function as parsed from line_profiler, every line taking percent_time."""
+    code = function.__code__
+    first_line = code.co_firstlineno
+    last_line = max(line for _, _, line in code.co_lines() if line)
+    return [{'function_name': code.co_name, 'line_number': first_line, 'file': code.co_filename, 'total_time': '',
+             'lines': [{'line_number': line, 'hits': 1, 'time': 1.0, 'per_hit': 1.0, 'percent_time': percent_time,
+                        'code': '', 'indentation': 0} for line in range(first_line + 1, last_line + 1)]}]
+
+
+def test_find_antipatterns():
+    """Test that each anti-pattern is flagged on its line."""
+    first_line = slow_function.__code__.co_firstlineno
+    findings = find_antipatterns(_profile_data(slow_function))
+
+    assert {(finding['line'] - first_line, finding['pattern']) for finding in findings} == {
+        (5, AntiPatternConst.LIST_MEMBERSHIP),
+        (7, AntiPatternConst.STRING_CONCATENATION),
+        (7, AntiPatternConst.REPEATED_LOOKUP),
+        (9, AntiPatternConst.LIST_POP_FRONT),
+        (10, AntiPatternConst.REGEX_COMPILE),
+        (11, AntiPatternConst.QUADRATIC_SCAN),
+    }
+
+
+@pytest.mark.parametrize(
+    "function, percent_time",
+    [
+        pytest.param(fast_function, 50.0, id="no_antipattern"),
+        pytest.param(slow_function, 1.0, id="cold_lines"),
+    ]
+)
+def test_find_antipatterns_nothing_to_flag(function, percent_time):
+    """Test that clean functions and cold lines are not flagged."""
+    findings = find_antipatterns(_profile_data(function, percent_time))
+
+    assert findings == []
+    assert format_antipattern_report(findings) == "No known performance anti-pattern found on the hot lines"
@@ -0,0 +1,95 @@
+import pytest
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.consts import BudgetConst
+from profiling_cli.utils.budget_utils import (
+    check_budget,
+    estimate_call_counts,
+    format_budget_report,
+    measure_functions,
+    normalize_budget,
+    parse_memory_size,
+)
+
+
+def looping_function(items):
+    """Docstring lines never run."""
+    for item in items:
+        item += 1
+    total = len(items)
+    return total
+
+
+def guarded_function(items):
+    if not items:
+        return 0
+    total = len(items)
+    return total
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        pytest.param(2048, 2048, id="bytes"),
+        pytest.param("2KiB", 2048, id="kibibytes"),
+        pytest.param("1.5 MB", 1_500_000, id="megabytes_with_space"),
+    ]
+)
+def test_parse_memory_size(value, expected):
+    """Test converting memory budgets to bytes."""
+    assert parse_memory_size(value) == expected
+
+
+def test_normalize_budget():
+    """Test accepting marker style names and rejecting unknown budgets."""
+    assert normalize_budget({"max_time_per_call": 1, "max-peak-memory": "1KiB"}, "test") == {
+        BudgetConst.MAX_TIME_PER_CALL: 1.0, BudgetConst.MAX_PEAK_MEMORY: 1024}
+    with pytest.raises(ValueError):
+        normalize_budget({"max-duration": 1}, "test")
+    with pytest.raises(ValueError):
+        normalize_budget({"max-peak-memory": "lots"}, "test")
+
+
+def test_estimate_call_counts_skips_loop_headers():
+    """Test that calls are counted on the first statement that runs once per call, not the loop header."""
+    code = looping_function.__code__
+    first = code.co_firstlineno
+    key = (code.co_filename, first, code.co_name)
+    # 3 calls of 4 items each: the for line is hit 5 times per call
+    stats = LineStats({key: [(first + 2, 15, 150), (first + 3, 12, 1200), (first + 4, 3, 30),
+                             (first + 5, 3, 30)]}, 1e-6)
+
+    assert estimate_call_counts(stats) == {key: 3}
+    metrics = measure_functions(stats, {key[:2]: "tests.looping_function"}, total_time=0.01)
+    assert metrics["tests.looping_function"][BudgetConst.MAX_TIME_PER_CALL] == pytest.approx(0.00047)
+    assert metrics["tests.looping_function"][BudgetConst.MAX_TIME_SHARE] == pytest.approx(14.1)
+
+
+def test_estimate_call_counts_with_early_return():
+    """Test that calls returning early from a guard are counted."""
+    code = guarded_function.__code__
+    first = code.co_firstlineno
+    key = (code.co_filename, first, code.co_name)
+    # 4 calls, 1 of them with no items
+    stats = LineStats({key: [(first + 1, 4, 4), (first + 2, 1, 1), (first + 3, 3, 3), (first + 4, 3, 3)]}, 1e-6)
+
+    assert estimate_call_counts(stats) == {key: 4}
+
+
+def test_check_budget_report():
+    """Test that exceeded budgets are reported first, with the measured value against the limit."""
+    results = check_budget("test", "tests/test_x.py::test_y",
+                           {BudgetConst.MAX_TIME_PER_CALL: 0.1, BudgetConst.MAX_ALLOCATIONS: 10,
+                            BudgetConst.MAX_PEAK_MEMORY: 2 * 1024 ** 2},
+                           {BudgetConst.MAX_TIME_PER_CALL: 0.05, BudgetConst.MAX_ALLOCATIONS: 20,
+                            BudgetConst.MAX_PEAK_MEMORY: 1536 * 1024})
+    results += check_budget("function", "pkg.missing", {BudgetConst.MAX_TIME_SHARE: 5.0}, None)
+
+    assert [result["exceeded"] for result in results] == [False, True, False, False]
+    assert format_budget_report(results).splitlines() == [
+        "Performance budgets: 1 exceeded, 2 met, 1 not measured",
+        "- EXCEEDED test tests/test_x.py::test_y: allocations 20 > budget 10 (+100.0%)",
+        "+ ok       test tests/test_x.py::test_y: time per call 50.000 ms <= budget 100.000 ms (-50.0%)",
+        "+ ok       test tests/test_x.py::test_y: peak memory 1.5 MiB <= budget 2.0 MiB (-25.0%)",
+        "?          function pkg.missing: time share not measured (budget 5.0%)",
+    ]
@@ -0,0 +1,93 @@
+import os
+import sys
+import textwrap
+
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.consts import (
+    ANTIPATTERNS_FILE,
+    LINE_STATS_FILE,
+    LINE_STATS_RAW_FILE,
+    LINE_TABLE_FILE,
+    MEMORY_REPORT_FILE,
+    PROFILE_OUTPUT_DIR,
+    PYTEST_LOG_FILE,
+    REPEAT_STATS_FILE,
+    AntiPatternConst,
+)
+from profiling_cli.utils.cli_utils import combine_repeated_runs, run_repeated_pytest
+from profiling_cli.utils.plugin_utils import dump_line_stats, parse_line_profiler_output
+
+WORK_SOURCE = textwrap.dedent('''\
+    def work(items):
+        seen = []
+        for item in items:
+            if item not in seen:
+                seen.append(item)
+        return seen
+''')
+
+# Prints the pass directory and a memray report, the second measured pass fails
+PASS_SOURCE = textwrap.dedent(f'''\
+    import os
+    import sys
+
+    run_dir = os.environ["{PROFILE_OUTPUT_DIR}"]
+    print("output of", os.path.basename(run_dir))
+    print("MEMRAY REPORT")
+    print("peak memory 1 MiB")
+    sys.exit(3 if run_dir.endswith("run_1") else 0)
+''')
+
+
+def make_run_dir(run_dir, work_file, membership_time, memory_report):
+    """Output directory of a pass: its raw line stats in microseconds and the results computed from them."""
+    os.makedirs(run_dir)
+    key = (str(work_file), 1, "work")
+    stats = LineStats({key: [(2, 1, 10), (3, 101, 50), (4, 100, membership_time), (5, 10, 40), (6, 1, 10)]}, 1e-6)
+    dump_line_stats(stats, os.path.join(run_dir, LINE_STATS_RAW_FILE))
+    for file_name, content in ((MEMORY_REPORT_FILE, memory_report), (ANTIPATTERNS_FILE, "findings of this pass"),
+                               (LINE_TABLE_FILE, "table of this pass")):
+        with open(os.path.join(run_dir, file_name), 'w') as f:
+            f.write(content)
+    return run_dir
+
+
+def test_run_repeated_pytest(tmp_path, capsys):
+    """Test that every pass profiles into its own directory and only the first measured pass output is shown."""
+    returncode, memray_output, run_dirs = run_repeated_pytest([sys.executable, "-c", PASS_SOURCE], str(tmp_path),
+                                                              repeat=2, warmup=1, jobs=2)
+
+    assert returncode == 3
+    assert memray_output == ["MEMRAY REPORT\n", "peak memory 1 MiB\n"]
+    assert [os.path.basename(run_dir) for run_dir in run_dirs] == ["run_0", "run_1"]
+    with open(os.path.join(tmp_path, "repeats", "warmup_0", PYTEST_LOG_FILE)) as f:
+        assert f.read().startswith("output of warmup_0")
+    output = capsys.readouterr().out
+    assert "output of run_0\n" in output and "output of run_1" not in output and "MEMRAY REPORT" not in output
+    assert "Profiling pass run_1 finished with exit code 3" in output
+
+
+def test_combine_repeated_runs(tmp_path):
+    """Test that the first pass results are copied and the median stats replace the ones derived from its stats."""
+    work_file = tmp_path / "work.py"
+    work_file.write_text(WORK_SOURCE)
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    run_dirs = [make_run_dir(str(tmp_path / "run_0"), work_file, 10, "memory of the first pass"),
+                make_run_dir(str(tmp_path / "run_1"), work_file, 1790, "memory of the second pass")]
+
+    report = combine_repeated_runs(run_dirs, str(output_dir))
+
+    assert report.startswith("Aggregated over 2 runs")
+    assert (output_dir / REPEAT_STATS_FILE).read_text() == report
+    assert (output_dir / MEMORY_REPORT_FILE).read_text() == "memory of the first pass"
+    _, profile_data = parse_line_profiler_output((output_dir / LINE_STATS_FILE).read_text())
+    [function] = profile_data
+    times = {line['line_number']: line['time'] for line in function['lines'] if line['time'] is not None}
+    # The membership test takes the median of 10 and 1790 us, 900 us out of the 1010 us of the function
+    assert times == {2: 10.0, 3: 50.0, 4: 900.0, 5: 40.0, 6: 10.0}
+    antipatterns = (output_dir / ANTIPATTERNS_FILE).read_text()
+    assert f"work line 4 (89.1% of its time) [{AntiPatternConst.LIST_MEMBERSHIP}]" in antipatterns
+    line_table = (output_dir / LINE_TABLE_FILE).read_text()
+    assert "4 | 100 | 900 | 9 | 89.1 |         if item not in seen:" in line_table
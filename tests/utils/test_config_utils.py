@@ -0,0 +1,65 @@
+import pytest
+
+from profiling_cli.utils.config_utils import load_profiling_targets, load_project_config
+from profiling_cli.utils.plugin_utils import is_target_test
+
+PYPROJECT = '''
+[tool.profiling-cli]
+[[tool.profiling-cli.targets]]
+name = "parser"
+tests = ["tests/test_parser.py::test_parse"]
+modules = ["mypkg.parser"]
+functions = ["parse"]
+min-percent-time = 5
+
+[[tool.profiling-cli.targets]]
+tests = "tests/io"
+modules = ["mypkg.io"]
+'''
+
+
+def test_load_profiling_targets(tmp_path):
+    """Test reading targets from pyproject.toml, with test paths made absolute."""
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+
+    targets = load_profiling_targets(load_project_config(tmp_path / "pyproject.toml"), base_dir=tmp_path)
+
+    assert targets == [
+        {"name": "parser", "tests": [f"{tmp_path}/tests/test_parser.py::test_parse"], "modules": ["mypkg.parser"],
+         "functions": ["parse"], "min_percent_time": 5.0},
+        {"name": "target_2", "tests": [f"{tmp_path}/tests/io"], "modules": ["mypkg.io"], "functions": [],
+         "min_percent_time": 0.0},
+    ]
+    assert [target["name"] for target in load_profiling_targets(
+        load_project_config(tmp_path / "pyproject.toml"), base_dir=tmp_path, names=("target_2",))] == ["target_2"]
+
+
+@pytest.mark.parametrize(
+    "project_config",
+    [
+        pytest.param({}, id="no_targets"),
+        pytest.param({"targets": [{"tests": ["tests"]}]}, id="no_modules"),
+        pytest.param({"targets": [{"modules": ["mypkg"]}]}, id="no_tests"),
+        pytest.param({"targets": [{"tests": ["tests"], "modules": ["mypkg"], "module": ["typo"]}]}, id="unknown_key"),
+    ]
+)
+def test_load_profiling_targets_invalid(project_config, tmp_path):
+    """Test that invalid targets are rejected."""
+    with pytest.raises(ValueError):
+        load_profiling_targets(project_config, base_dir=tmp_path)
+
+
+@pytest.mark.parametrize(
+    "test_path, nodeid, expected",
+    [
+        pytest.param("/p/tests/test_parser.py", "tests/test_parser.py::test_parse", True, id="named_test"),
+        pytest.param("/p/tests/test_parser.py", "tests/test_parser.py::test_parse[1]", True, id="parametrized"),
+        pytest.param("/p/tests/test_parser.py", "tests/test_parser.py::test_parse_all", False, id="other_test"),
+        pytest.param("/p/tests/io/test_read.py", "tests/io/test_read.py::test_read", True, id="directory"),
+        pytest.param("/p/tests/io_extra/test_x.py", "tests/io_extra/test_x.py::test_x", False, id="sibling_dir"),
+    ]
+)
+def test_is_target_test(test_path, nodeid, expected):
+    """Test matching tests against the tests declared by a target."""
+    target = {"tests": ["/p/tests/test_parser.py::test_parse", "/p/tests/io"]}
+    assert is_target_test(test_path, nodeid, target) is expected
@@ -0,0 +1,106 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+from profiling_cli.utils.gating_utils import EntryPointGate, resolve_entry_point
+
+
+class CountingProfiler:
+    """Records the enable count every time a profiled function runs."""
+
+    def __init__(self):
+        self.enable_count = 0
+        self.seen = []
+
+    def enable_by_count(self):
+        self.enable_count += 1
+
+    def disable_by_count(self):
+        self.enable_count -= 1
+
+
+@pytest.fixture
+def entry_module(monkeypatch):
+    """Module with an entry point, a method, a static method and a coroutine calling a helper."""
+    module = types.ModuleType("gated_app")
+    profiler = CountingProfiler()
+
+    def helper():
+        profiler.seen.append(profiler.enable_count)
+
+    def handle():
+        helper()
+
+    async def handle_async():
+        helper()
+
+    class Service:
+        def run(self):
+            helper()
+
+        @staticmethod
+        def run_static():
+            helper()
+
+    module.helper, module.handle, module.handle_async, module.Service = helper, handle, handle_async, Service
+    monkeypatch.setitem(sys.modules, "gated_app", module)
+    return module, profiler
+
+
+def test_gate_enables_only_under_open_entry_point(entry_module, monkeypatch):
+    """Test that the profiler is on while an entry point runs with the gate open, and off otherwise."""
+    module, profiler = entry_module
+    # A module that imported the entry point by name before the gate was installed
+    importer = types.ModuleType("gated_importer")
+    importer.handle = module.handle
+    monkeypatch.setitem(sys.modules, "gated_importer", importer)
+    gate = EntryPointGate(profiler)
+    gate.install(["gated_app.handle", "gated_app.handle_async"])
+
+    module.helper()
+    module.handle()
+    gate.open = True
+    module.handle()
+    importer.handle()
+    asyncio.run(module.handle_async())
+    module.helper()
+    gate.open = False
+    module.handle()
+
+    assert profiler.seen == [0, 0, 1, 1, 1, 0, 0]
+    assert profiler.enable_count == 0
+    assert module.handle.__name__ == "handle"
+
+
+def test_gate_methods(entry_module):
+    """Test that methods and static methods are gated."""
+    module, profiler = entry_module
+    gate = EntryPointGate(profiler)
+    gate.install(["gated_app.Service.run", "gated_app.Service.run_static"])
+    gate.open = True
+
+    module.Service().run()
+    module.Service.run_static()
+    assert profiler.seen == [1, 1]
+
+
+def test_resolve_entry_point(entry_module):
+    """Test that the module is the longest importable prefix of the name."""
+    module, _ = entry_module
+    assert resolve_entry_point("gated_app.handle") == (module, "handle")
+    assert resolve_entry_point("gated_app.Service.run") == (module.Service, "run")
+    assert resolve_entry_point("os.path.join")[1] == "join"
+    for name in ["gated_app.missing", "gated_app.Missing.run", "missing_module.handle"]:
+        with pytest.raises(ValueError):
+            resolve_entry_point(name)
+
+
+def test_install_rejects_entry_point_that_is_not_a_function(entry_module, monkeypatch):
+    """Test that an attribute which cannot be called is not wrapped."""
+    module, profiler = entry_module
+    monkeypatch.setattr(module, "settings", {"debug": False}, raising=False)
+    with pytest.raises(TypeError, match="gated_app.settings is not a function"):
+        EntryPointGate(profiler).install(["gated_app.settings"])
+    assert module.settings == {"debug": False}
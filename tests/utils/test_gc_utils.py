@@ -0,0 +1,96 @@
+import gc
+
+import pytest
+
+from profiling_cli.utils.gc_utils import (
+    GCRecorder,
+    apply_gc_settings,
+    format_gc_comparison,
+    format_gc_report,
+    parse_gc_threshold,
+    summarize_gc,
+)
+
+
+def collect_garbage():
+    gc.collect()
+
+
+def test_gc_recorder_attributes_collections():
+    """Test that a collection is recorded with its generation and attributed to the test and innermost function."""
+    code = collect_garbage.__code__
+    recorder = GCRecorder({(code.co_filename, code.co_firstlineno): "test_gc_utils.collect_garbage"})
+    recorder.current_test = "tests/test_work.py::test_heavy"
+    recorder.start()
+    try:
+        collect_garbage()
+    finally:
+        recorder.stop()
+    gc.collect()
+
+    collection = recorder.collections[-1]
+    assert collection["generation"] == 2
+    assert collection["seconds"] >= 0
+    assert collection["test"] == "tests/test_work.py::test_heavy"
+    assert collection["function"] == "test_gc_utils.collect_garbage"
+    assert recorder._callback not in gc.callbacks
+
+
+def test_summarize_gc():
+    """Test the GC time share overall, by generation, by test and by function."""
+    collections = [
+        {"generation": 0, "seconds": 0.01, "collected": 5, "uncollectable": 0, "test": "t1", "function": "m.f"},
+        {"generation": 2, "seconds": 0.03, "collected": 10, "uncollectable": 1, "test": "t1", "function": None},
+        {"generation": 0, "seconds": 0.01, "collected": 0, "uncollectable": 0, "test": None, "function": None},
+    ]
+    summary = summarize_gc(collections, {"t1": 0.2, "t2": 0.3})
+
+    assert summary["collections"] == 3
+    assert summary["seconds"] == pytest.approx(0.05)
+    assert summary["test_collections"] == 2
+    assert summary["time_share"] == pytest.approx(8.0)
+    assert summary["generations"]["0"]["collections"] == 2
+    assert summary["generations"]["2"]["uncollectable"] == 1
+    assert summary["tests"]["t1"]["share"] == pytest.approx(20.0)
+    assert summary["functions"]["m.f"]["share"] == pytest.approx(20.0)
+    assert summary["slowest"][0]["seconds"] == 0.03
+
+    report = format_gc_report(summary)
+    assert "3 collections" in report
+    assert "2 collections, 40.000 ms, 8.0% of the 0.500 s of tests" in report
+    assert "generation 2: 1 collections" in report
+    assert "m.f" in report
+    assert "no profiled function (t1)" in report
+
+
+def test_format_gc_comparison():
+    """Test that the comparison shows the change of every GC metric."""
+    baseline = summarize_gc([{"generation": 0, "seconds": 0.02, "collected": 0, "uncollectable": 0, "test": "t",
+                              "function": None}], {"t": 0.2})
+    tuned = summarize_gc([{"generation": 0, "seconds": 0.01, "collected": 0, "uncollectable": 0, "test": "t",
+                           "function": None}], {"t": 0.19})
+
+    comparison = format_gc_comparison(baseline, tuned)
+    assert "GC pauses while tests ran: 20.000 ms -> 10.000 ms (-50.0%)" in comparison
+    assert "GC time share: 10.0% -> 5.3%" in comparison
+
+
+def test_parse_gc_threshold():
+    """Test that up to three non negative integers are accepted."""
+    assert parse_gc_threshold("50000,20,20") == (50000, 20, 20)
+    assert parse_gc_threshold("1000") == (1000,)
+    for threshold in ("", "a,b", "1,2,3,4", "-1"):
+        with pytest.raises(ValueError):
+            parse_gc_threshold(threshold)
+
+
+def test_apply_gc_settings():
+    """Test that the thresholds are set and the objects alive are frozen."""
+    threshold = gc.get_threshold()
+    try:
+        apply_gc_settings("50000,20,20", True)
+        assert gc.get_threshold() == (50000, 20, 20)
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.set_threshold(*threshold)
+        gc.unfreeze()
@@ -0,0 +1,90 @@
+import textwrap
+import tracemalloc
+
+from profiling_cli.utils.leak_utils import (
+    attribute_sites,
+    find_growing_sites,
+    format_leak_report,
+    summarize_test_growth,
+    track_heap_growth,
+)
+
+_retained = []
+
+
+def leak():
+    _retained.append(bytearray(10000))
+
+
+def allocate_and_free():
+    return len(bytearray(1000000))
+
+
+def test_track_heap_growth_tells_leaks_from_freed_memory():
+    """Test that retained memory grows at every iteration while memory freed within an iteration does not count."""
+    def run_once():
+        leak()
+        allocate_and_free()
+
+    try:
+        sites = find_growing_sites(track_heap_growth(run_once, iterations=5, warmup=1))
+    finally:
+        _retained.clear()
+
+    # Tracing started for the check only, the code that runs next is not slowed down
+    assert not tracemalloc.is_tracing()
+    assert sites
+    assert sites[0]["stack"][0] == (__file__, leak.__code__.co_firstlineno + 1)
+    assert sites[0]["per_iteration"] >= 10000
+    assert sites[0]["grown_iterations"] == 5
+    assert sum(site["per_iteration"] for site in sites) < 1000000
+
+
+def test_find_growing_sites():
+    """Test that only the sites growing in most iterations are kept, largest growth first."""
+    sizes = {(("a.py", 1),): [0, 10, 20, 30, 40],
+             (("b.py", 2),): [0, 100, 100, 100, 100],
+             (("c.py", 3),): [0, 50, 100, 150, 200],
+             (("d.py", 4),): [40, 30, 20, 10, 0]}
+
+    sites = find_growing_sites(sizes)
+    assert [site["stack"][0][0] for site in sites] == ["c.py", "a.py"]
+    assert sites[0]["growth"] == 200
+    assert sites[0]["per_iteration"] == 50
+
+
+def test_attribute_sites(tmp_path):
+    """Test that a site is attributed to the innermost registered function on its stack."""
+    source = tmp_path / "mod.py"
+    source.write_text(textwrap.dedent('''\
+        def outer():
+            def inner():
+                return []
+            return inner()
+
+
+        def other():
+            return outer()
+    '''))
+    registered = {(str(source), 1): "mod.outer", (str(source), 2): "mod.outer.<locals>.inner"}
+    sites = [{"stack": [("lib.py", 10), (str(source), 3), (str(source), 4)]},
+             {"stack": [(str(source), 8)]}]
+
+    attribute_sites(sites, registered)
+    assert sites[0]["function"] == "mod.outer.<locals>.inner"
+    assert sites[1]["function"] is None
+
+
+def test_format_leak_report():
+    """Test that the growing tests are reported with their sites, over the threshold or not."""
+    site = {"stack": [("/src/mod.py", 3), ("/tests/test_mod.py", 7)], "sizes": [0, 2048, 4096], "growth": 4096,
+            "per_iteration": 2048, "grown_iterations": 2, "function": "mod.cache"}
+    results = [summarize_test_growth("test_mod.py::test_a", [site], 2, 1, threshold=1024),
+               summarize_test_growth("test_mod.py::test_b", [], 2, 1, threshold=1024)]
+
+    assert results[0]["exceeded"] and not results[1]["exceeded"]
+    report = format_leak_report(results)
+    assert "1 of 2 tests" in report
+    assert "EXCEEDED test_mod.py::test_a: 2.0 KiB per iteration > threshold 1.0 KiB" in report
+    assert "mod.py:3 in mod.cache" in report
+    assert "test_b" not in report
@@ -0,0 +1,85 @@
+from memray import Tracker
+
+from profiling_cli.utils.memory_utils import (
+    attach_line_memory,
+    dump_line_memory,
+    load_line_memory,
+    measure_line_memory,
+)
+from profiling_cli.utils.plugin_utils import format_profile_data
+
+retained_buffers = []
+
+
+def build_buffers():
+    scratch = [bytearray(1024 * 1024) for _ in range(4)]
+    retained_buffers.append(bytearray(2 * 1024 * 1024))
+    return len(scratch)
+
+
+def run_job():
+    return build_buffers()
+
+
+class Reader:
+    def run(self):
+        return Parser().run()
+
+
+class Parser:
+    def run(self):
+        return [bytearray(1024 * 1024) for _ in range(2)]
+
+
+def test_measure_line_memory(tmp_path):
+    """Test that allocations are attributed to the lines of the registered functions on their stack."""
+    result_file = tmp_path / "memory.bin"
+    with Tracker(result_file):
+        run_job()
+    retained_buffers.clear()
+    first_line = build_buffers.__code__.co_firstlineno
+    caller_line = run_job.__code__.co_firstlineno + 1
+
+    line_memory = measure_line_memory([str(result_file)], {(__file__, first_line): "build_buffers",
+                                                           (__file__, caller_line - 1): "run_job"})
+
+    scratch = line_memory[(__file__, first_line + 1)]
+    assert scratch["allocated"] >= 4 * 1024 * 1024 and scratch["allocations"] >= 4
+    assert scratch["retained"] < 1024 * 1024
+    assert line_memory[(__file__, first_line + 2)]["retained"] >= 2 * 1024 * 1024
+    # The calling line holds what its callee allocated
+    assert line_memory[(__file__, caller_line)]["allocated"] >= 6 * 1024 * 1024
+
+
+def test_measure_line_memory_tells_same_named_methods_apart(tmp_path):
+    """Test that a method with the name of a registered one, defined later in the file, is not attributed to it."""
+    result_file = tmp_path / "memory.bin"
+    with Tracker(result_file):
+        Reader().run()
+    reader_line = Reader.run.__code__.co_firstlineno
+    parser_line = Parser.run.__code__.co_firstlineno
+
+    line_memory = measure_line_memory([str(result_file)], {(__file__, reader_line): "Reader.run"})
+
+    assert line_memory[(__file__, reader_line + 1)]["allocated"] >= 2 * 1024 * 1024
+    assert (__file__, parser_line + 1) not in line_memory
+
+
+def test_line_memory_round_trip(tmp_path):
+    """Test that saved line memory is loaded back by (file, line) and joined with the line stats."""
+    line_memory = {("job.py", 3): {"allocated": 2048, "allocations": 2, "retained": 0}}
+    dump_line_memory(line_memory, str(tmp_path))
+    assert load_line_memory(str(tmp_path)) == line_memory
+    assert load_line_memory(str(tmp_path / "missing")) == {}
+
+    profile_data = [{"function_name": "build", "line_number": 2, "file": "job.py", "total_time": 0.5, "lines": [
+        {"line_number": 2, "hits": None, "time": None, "per_hit": None, "percent_time": None, "indentation": 0,
+         "code": "def build():"},
+        {"line_number": 3, "hits": 1, "time": 0.5, "per_hit": 0.5, "percent_time": 100.0, "indentation": 4,
+         "code": "return [0] * 256"}]}]
+    attach_line_memory(profile_data, line_memory)
+
+    table = format_profile_data(profile_data).splitlines()
+    assert table[1] == "line | hits | time | per hit | % time | allocated | allocs | retained | code"
+    assert table[2] == "2 |  |  |  |  |  |  |  | def build():"
+    assert table[3] == "3 | 1 | 0.5 | 0.5 | 100 | 2.0 KiB | 2 |  |     return [0] * 256"
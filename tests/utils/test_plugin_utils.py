@@ -0,0 +1,122 @@
+import pytest
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.utils.plugin_utils import (
+    attach_cpu_times,
+    dump_line_stats,
+    load_line_stats,
+    merge_line_stats,
+    parse_line_profiler_output,
+    subtract_line_stats,
+)
+
+FUNCTION_KEY = ("/project/module.py", 10, "slow_function")
+
+
+@pytest.mark.parametrize(
+    "stats_list, expected_timings",
+    [
+        pytest.param(
+            [LineStats({FUNCTION_KEY: [(11, 2, 100), (12, 4, 300)]}, 1e-9),
+             LineStats({FUNCTION_KEY: [(11, 1, 50), (13, 1, 10)]}, 1e-9)],
+            {FUNCTION_KEY: [(11, 3, 150), (12, 4, 300), (13, 1, 10)]},
+            id="same_unit"
+        ),
+        pytest.param(
+            [LineStats({FUNCTION_KEY: [(11, 1, 100)]}, 1e-9),
+             LineStats({FUNCTION_KEY: [(11, 1, 2)]}, 1e-6)],
+            {FUNCTION_KEY: [(11, 2, 2100)]},
+            id="different_units"
+        ),
+    ]
+)
+def test_merge_line_stats(stats_list, expected_timings):
+    """Test merging stats of several processes into the unit of the first one."""
+    merged = merge_line_stats(stats_list)
+    assert merged.unit == 1e-9
+    assert merged.timings == expected_timings
+
+
+def test_subtract_line_stats():
+    """Test removing the stats a forked child inherited from its parent."""
+    baseline = LineStats({FUNCTION_KEY: [(11, 2, 100), (12, 4, 300)]}, 1e-9)
+    stats = LineStats({FUNCTION_KEY: [(11, 5, 400), (12, 4, 300)],
+                       ("/project/other.py", 1, "other"): [(2, 1, 10)]}, 1e-9)
+
+    result = subtract_line_stats(stats, baseline)
+
+    assert result.timings == {FUNCTION_KEY: [(11, 3, 300)], ("/project/other.py", 1, "other"): [(2, 1, 10)]}
+
+
+def test_dump_and_load_line_stats(tmp_path):
+    """Test that raw stats survive a round trip, for the aggregation of repeated runs."""
+    stats = LineStats({FUNCTION_KEY: [(11, 2, 100), (12, 4, 300)]}, 1e-9)
+    dump_line_stats(stats, str(tmp_path / "line_stats.lprof"))
+    loaded = load_line_stats(str(tmp_path / "line_stats.lprof"))
+
+    assert loaded.timings == stats.timings
+    assert loaded.unit == stats.unit
+
+
+def test_attach_cpu_times():
+    """Test that lines waiting much longer than they compute are flagged as I/O bound."""
+    profile_data = [{'file': '/project/module.py', 'function_name': 'slow_function', 'lines': [
+        {'line_number': 11, 'time': 1000.0},
+        {'line_number': 12, 'time': 500.0},
+        {'line_number': 13, 'time': None},
+    ]}]
+    cpu_profile_data = [{'file': '/project/module.py', 'function_name': 'slow_function', 'lines': [
+        {'line_number': 11, 'time': 10.0},
+        {'line_number': 12, 'time': 450.0},
+    ]}]
+
+    attach_cpu_times(profile_data, cpu_profile_data)
+
+    lines = profile_data[0]['lines']
+    assert lines[0]['cpu_time'] == 10.0 and lines[0]['io_bound'] is True
+    assert lines[1]['cpu_time'] == 450.0 and lines[1]['io_bound'] is False
+    assert 'cpu_time' not in lines[2]
+
+
+def test_attach_cpu_times_keeps_same_named_functions_apart():
+    """Test that functions sharing a name and line numbers in different files get their own CPU times."""
+    profile_data = [{'file': f'/project/{name}.py', 'function_name': 'run', 'lines': [
+        {'line_number': 5, 'time': 1000.0}]} for name in ('reader', 'writer')]
+    cpu_profile_data = [
+        {'file': '/project/writer.py', 'function_name': 'run', 'lines': [{'line_number': 5, 'time': 900.0}]},
+        {'file': '/project/reader.py', 'function_name': 'run', 'lines': [{'line_number': 5, 'time': 10.0}]},
+    ]
+
+    attach_cpu_times(profile_data, cpu_profile_data)
+
+    reader, writer = (function['lines'][0] for function in profile_data)
+    assert reader['cpu_time'] == 10.0 and reader['io_bound'] is True
+    assert writer['cpu_time'] == 900.0 and writer['io_bound'] is False
+
+
+def test_parse_line_profiler_output_keeps_function_metadata():
+    """Test that every function gets its own file and total time."""
+    output = """Timer unit: 1e-09 s
+
+Total time: 0.5 s
+File: /project/first.py
+Function: first at line 1
+
+Line #      Hits         Time  Per Hit   % Time  Line Contents
+==============================================================
+     1                                           def first():
+     2         1        500.0    500.0    100.0      return 1
+
+Total time: 0.25 s
+File: /project/second.py
+Function: second at line 3
+
+Line #      Hits         Time  Per Hit   % Time  Line Contents
+==============================================================
+     3                                           def second():
+     4         1        250.0    250.0    100.0      return 2
+"""
+    _, profile_data = parse_line_profiler_output(output)
+
+    assert [(function['function_name'], function['file'], function['total_time']) for function in profile_data] == [
+        ("first", "/project/first.py", "0.5 s"), ("second", "/project/second.py", "0.25 s")]
@@ -0,0 +1,107 @@
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+
+from profiling_cli.consts import (
+    LINE_STATS_FILE,
+    LINE_TABLE_FILE,
+    MEMORY_REPORT_FILE,
+    PROFILE_MEMORY,
+    PROFILE_MODULES,
+    PROFILE_OUTPUT_DIR,
+)
+from profiling_cli.utils.run_utils import RUN_DRIVER_SOURCE, parse_program
+
+JOB_SOURCE = textwrap.dedent('''\
+    import sys
+    import time
+    from pathlib import Path
+
+
+    def crunch(n):
+        rows = []
+        for i in range(n):
+            rows.append(str(i * i))
+        return rows
+
+
+    def main():
+        rows = crunch(int(sys.argv[1]))
+        if "--forever" in sys.argv:
+            Path("started").touch()
+            while True:
+                time.sleep(0.01)
+        sys.exit(len(rows) % 7)
+
+
+    if __name__ == "__main__":
+        main()
+''')
+
+
+@pytest.mark.parametrize("command, expected", [
+    (["python", "-m", "pkg.job", "10"], {"kind": "module", "target": "pkg.job", "argv": ["pkg.job", "10"]}),
+    (["python3.12", "-c", "print(1)", "x"], {"kind": "code", "target": "print(1)", "argv": ["-c", "x"]}),
+    (["python", "job.py", "10"], {"kind": "script", "target": "job.py", "argv": ["job.py", "10"]}),
+    (["job.py", "10"], {"kind": "script", "target": "job.py", "argv": ["job.py", "10"]}),
+    (["pkg.cli:main", "10"], {"kind": "entry_point", "target": "pkg.cli:main", "argv": ["pkg.cli:main", "10"]}),
+])
+def test_parse_program(command, expected):
+    """Test that the command lines the python command accepts run the same program."""
+    assert parse_program(command) == expected
+
+
+@pytest.mark.parametrize("command, message", [
+    (["python"], "interactive interpreter"),
+    (["python", "-X", "importtime", "-m", "pkg"], "Unsupported Python option -X"),
+    (["surely-not-an-installed-command"], "neither a Python module"),
+])
+def test_parse_program_errors(command, message):
+    """Test that commands that are not Python programs are refused."""
+    with pytest.raises(ValueError, match=message):
+        parse_program(command)
+
+
+def start_job(tmp_path, *args):
+    """Run the job module through the program runner, with its functions line profiled and its memory tracked."""
+    (tmp_path / "job.py").write_text(JOB_SOURCE)
+    env = {**os.environ, PROFILE_MODULES: "job", PROFILE_OUTPUT_DIR: str(tmp_path / "results"), PROFILE_MEMORY: "1",
+           "PYTHONPATH": str(Path(__file__).parents[2])}
+    return subprocess.Popen([sys.executable, "-c", RUN_DRIVER_SOURCE, "python", "-m", "job", *args], cwd=tmp_path,
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def test_profile_program(tmp_path):
+    """Test that the functions of a module run as __main__ are profiled and the exit code of the program is kept."""
+    process = start_job(tmp_path, "1000")
+    output, _ = process.communicate(timeout=60)
+
+    assert process.returncode == 1000 % 7, output
+    stats = (tmp_path / "results" / LINE_STATS_FILE).read_text()
+    assert "Function: crunch at line 6" in stats
+    assert "rows.append(str(i * i))" in stats
+    memory_report = (tmp_path / "results" / MEMORY_REPORT_FILE).read_text()
+    assert "Allocation results for python -m job 1000 at the high watermark" in memory_report
+    assert "run_utils.py" not in memory_report
+    line_table = (tmp_path / "results" / LINE_TABLE_FILE).read_text()
+    assert "line | hits | time | per hit | % time | allocated | allocs | retained | code" in line_table
+    assert any(row.startswith("9 | 1000 |") and "KiB" in row for row in line_table.splitlines())
+
+
+def test_profile_program_saves_results_when_terminated(tmp_path):
+    """Test that a long-running program stopped with SIGTERM saves its results before exiting."""
+    process = start_job(tmp_path, "1000", "--forever")
+    deadline = time.monotonic() + 60
+    while not (tmp_path / "started").exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    process.send_signal(signal.SIGTERM)
+    output, _ = process.communicate(timeout=60)
+
+    assert process.returncode == 128 + signal.SIGTERM, output
+    assert "Function: main at line 13" in (tmp_path / "results" / LINE_STATS_FILE).read_text()
@@ -0,0 +1,136 @@
+import importlib
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from profiling_cli.utils.selection_utils import (
+    FunctionCallRecorder,
+    changed_files,
+    changed_functions,
+    file_digest,
+    function_spans,
+    load_test_map,
+    select_tests,
+    stale_test_files,
+)
+
+SOURCE = textwrap.dedent('''
+    import functools
+
+
+    def parse(text):
+        return text.split()
+
+
+    class Loader:
+        @functools.lru_cache
+        def load(self, path):
+            def read():
+                return path
+            return read()
+''')
+
+
+def make_test_map(tmp_path):
+    """Map of two tests, one running parse and one running Loader.load."""
+    source, test_file = str(tmp_path / "mod.py"), str(tmp_path / "test_mod.py")
+    (tmp_path / "mod.py").write_text(SOURCE)
+    (tmp_path / "test_mod.py").write_text("")
+    return {"version": 1, "git_head": None,
+            "files": {source: file_digest(source), test_file: file_digest(test_file)},
+            "tests": {f"{test_file}::test_parse": {"path": test_file, "functions": [[source, "parse"]]},
+                      f"{test_file}::test_load": {"path": test_file, "functions": [[source, "Loader.load"]]}}}
+
+
+def test_function_spans(tmp_path):
+    """Test qualified names and line spans, decorators included."""
+    (tmp_path / "mod.py").write_text(SOURCE)
+
+    assert function_spans(str(tmp_path / "mod.py")) == [("parse", 5, 6), ("Loader.load", 10, 14),
+                                                       ("Loader.load.<locals>.read", 12, 13)]
+
+
+@pytest.mark.parametrize(
+    "functions, changed, expected",
+    [
+        pytest.param(["parse"], set(), ["test_parse"], id="profiled_function"),
+        pytest.param([], set(), ["test_parse", "test_load"], id="whole_module"),
+        pytest.param(["parse"], {("mod.py", "Loader.load")}, ["test_parse", "test_load"], id="changed_function"),
+        pytest.param(["missing"], set(), [], id="nothing_reached"),
+    ]
+)
+def test_select_tests(tmp_path, functions, changed, expected):
+    """Test selecting the tests that reach the profiled or changed functions."""
+    test_map = make_test_map(tmp_path)
+    changed = {(str(tmp_path / filename), qualname) for filename, qualname in changed}
+
+    selected = select_tests(test_map, [str(tmp_path / "test_mod.py")], {str(tmp_path / "mod.py")}, functions,
+                            changed)
+
+    assert selected == [f"{tmp_path / 'test_mod.py'}::{name}" for name in expected]
+
+
+def test_stale_test_files(tmp_path):
+    """Test that edited and never mapped test files are mapped again."""
+    test_map = make_test_map(tmp_path)
+    new_test = str(tmp_path / "test_new.py")
+    test_files = [str(tmp_path / "test_mod.py"), new_test]
+
+    assert changed_files(test_map, tmp_path) == set()
+    assert stale_test_files(test_map, test_files, set()) == [new_test]
+
+    (tmp_path / "mod.py").write_text(SOURCE + "\n# edited\n")
+    changed = changed_files(test_map, tmp_path)
+    assert changed == {str(tmp_path / "mod.py")}
+    assert stale_test_files(test_map, test_files, changed) == test_files
+
+
+def test_load_test_map_rebuilds_other_versions(tmp_path):
+    """Test that a cache in another layout is ignored."""
+    (tmp_path / "test_map.json").write_text('{"version": 0, "tests": {"a": {}}}')
+
+    assert load_test_map(tmp_path / "test_map.json")["tests"] == {}
+
+
+def test_function_call_recorder(tmp_path, monkeypatch):
+    """Test that only the functions defined under the root are recorded, per recording, named as function_spans
+    names them."""
+    module_file = tmp_path / "recorded_module.py"
+    module_file.write_text(SOURCE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module("recorded_module")
+
+    recorder = FunctionCallRecorder(str(tmp_path))
+    recorder.start()
+    try:
+        module.parse("a b")
+        first = recorder.reset()
+        module.Loader().load("path")
+        second = recorder.reset()
+    finally:
+        recorder.stop()
+        sys.modules.pop("recorded_module", None)
+
+    assert first == {(str(module_file), "parse")}
+    assert {(str(module_file), "Loader.load"), (str(module_file), "Loader.load.<locals>.read")} <= second
+    assert (str(module_file), "parse") not in second
+
+
+def test_changed_functions(tmp_path):
+    """Test mapping a git diff to the functions it touches."""
+    def git(*args):
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=tmp_path,
+                       check=True, capture_output=True)
+
+    (tmp_path / "mod.py").write_text(SOURCE)
+    git("init", "-q")
+    git("add", "mod.py")
+    git("commit", "-q", "-m", "initial")
+    (tmp_path / "mod.py").write_text(SOURCE.replace("return path", "return path.strip()"))
+    (tmp_path / "new.py").write_text("def added():\n    pass\n")
+
+    assert changed_functions(tmp_path, "HEAD") == {(str(tmp_path / "mod.py"), "Loader.load"),
+                                                   (str(tmp_path / "mod.py"), "Loader.load.<locals>.read"),
+                                                   (str(tmp_path / "new.py"), "added")}
@@ -0,0 +1,121 @@
+import textwrap
+
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.utils.startup_utils import (
+    aggregate_import_runs,
+    find_heavy_statements,
+    format_baseline_diff,
+    format_module_line_stats,
+    format_startup_report,
+    parse_importtime,
+    profile_module_execution,
+    resolve_startup_target,
+    run_import_passes,
+    slowest_modules,
+)
+
+IMPORTTIME = textwrap.dedent('''\
+    import time: self [us] | cumulative | imported package
+    import time:       300 |        300 |     json.decoder
+    import time:       200 |        500 |   json
+    import time:      1000 |       1000 |   app.config
+    import time:       100 |       1600 | app
+    import time:        50 |         50 | argparse
+''')
+
+
+def make_run(config_self):
+    """One interpreter run whose app.config module takes config_self microseconds of its own."""
+    output = IMPORTTIME.replace("1000 |       1000", f"{config_self:>4} | {config_self:>10}")
+    return {"process_seconds": 0.1, "interpreter_seconds": 0.02, "import_seconds": 0.002,
+            "tree": parse_importtime(output), "files": {"app.config": "/project/app/config.py"}}
+
+
+def test_parse_importtime():
+    """Test that the modules are nested under the module importing them, in import order."""
+    tree = parse_importtime(IMPORTTIME)
+
+    assert [node["name"] for node in tree] == ["app", "argparse"]
+    assert [node["name"] for node in tree[0]["children"]] == ["json", "app.config"]
+    assert tree[0]["children"][0]["children"][0]["name"] == "json.decoder"
+    assert tree[0]["cumulative"] == 0.0016
+    assert tree[0]["self"] == 0.0001
+
+
+def test_aggregate_import_runs():
+    """Test that the tree keeps the median times and the slowest modules are ranked by self time."""
+    aggregate = aggregate_import_runs([make_run(1000), make_run(3000), make_run(2000)])
+
+    assert aggregate["runs"] == 3
+    assert aggregate["modules"]["app.config"]["self"] == 0.002
+    assert aggregate["modules"]["app.config"]["depth"] == 1
+    assert aggregate["modules"]["app.config"]["file"] == "/project/app/config.py"
+    assert aggregate["process_seconds"] == {"median": 0.1, "mad": 0.0}
+    assert slowest_modules(aggregate, 2) == ["app.config", "json.decoder"]
+    assert slowest_modules(aggregate, 2, root="/project") == ["app.config"]
+
+    report = format_startup_report("app", aggregate, 2, min_percent=5)
+    assert "Cold start of app over 3 fresh interpreters" in report
+    assert "    app.config" in report
+    assert "argparse" not in report.split("Slowest modules")[0]
+
+
+def test_format_baseline_diff():
+    """Test that new, removed and changed modules are reported."""
+    baseline = aggregate_import_runs([make_run(1000)])
+    current = aggregate_import_runs([make_run(3000)])
+    del current["modules"]["argparse"]
+    current["modules"]["yaml"] = {"self": 0.004, "cumulative": 0.004, "depth": 0, "file": None}
+
+    diff = format_baseline_diff(current, baseline, 5)
+    assert "Newly imported modules (1)" in diff
+    assert "No longer imported modules (1)" in diff
+    assert "1.000 ms ->     3.000 ms  app.config" in diff
+
+
+def test_resolve_startup_target():
+    """Test that entry points and console scripts resolve to their module."""
+    assert resolve_startup_target("app.cli:main") == "app.cli"
+    assert resolve_startup_target("app.cli") == "app.cli"
+    assert resolve_startup_target("profiling-cli") == "profiling_cli.cli"
+
+
+def test_module_line_stats(tmp_path):
+    """Test that every module-level statement is formatted and the heavy ones are found."""
+    module_file = tmp_path / "config.py"
+    module_file.write_text("import json\n\n\nTABLE = list(range(10))\nX = 1\n")
+    stats = LineStats({(str(module_file), 1, "<module>"): [(1, 1, 1000000), (4, 1, 9000000), (5, 1, 100)]}, 1e-9)
+
+    text = format_module_line_stats(stats)
+    assert "Function: <module> at line 1" in text
+    assert "TABLE = list(range(10))" in text
+    assert "X = 1" in text
+
+    heavy = find_heavy_statements(stats)
+    assert [statement["line"] for statement in heavy] == [4, 1]
+    assert heavy[0]["code"] == "TABLE = list(range(10))"
+
+
+def test_import_and_module_profiling(tmp_path):
+    """Test the import tree and the module-level line stats measured in fresh interpreters."""
+    (tmp_path / "slowmod.py").write_text("import json\nTABLE = [str(i) for i in range(100000)]\n")
+
+    runs = run_import_passes("slowmod", 2, cwd=str(tmp_path))
+    assert len(runs) == 2
+    assert runs[0]["tree"][-1]["name"] == "slowmod"
+    assert runs[0]["files"]["slowmod"].endswith("slowmod.py")
+    # The driver's own modules are not loaded before the import, what the module imports is measured cold
+    assert runs[0]["files"]["json"].endswith("__init__.py")
+    assert "json" in [node["name"] for node in runs[0]["tree"][-1]["children"]]
+
+    (tmp_path / "plainmod.py").write_text("X = 1\n")
+    [run] = run_import_passes("plainmod", 1, cwd=str(tmp_path))
+    assert [node["name"] for node in run["tree"]] == ["plainmod"]
+    assert list(run["files"]) == ["plainmod"]
+    assert runs[0]["import_seconds"] > 0
+
+    stats = profile_module_execution("slowmod", str(tmp_path / "slowmod.lprof"), cwd=str(tmp_path))
+    (_, _, name), timings = next(iter(stats.timings.items()))
+    assert name == "<module>"
+    assert [lineno for lineno, _, _ in timings] == [1, 2]
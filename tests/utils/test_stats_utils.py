@@ -0,0 +1,74 @@
+import pytest
+from line_profiler.line_profiler import LineStats
+
+from profiling_cli.utils.stats_utils import (
+    aggregate_line_stats,
+    format_repeat_report,
+    median_absolute_deviation,
+    median_confidence_interval,
+)
+
+KEY = ("work.py", 10, "work")
+
+
+def make_run(loop_time, jitter_time, rest_time):
+    """Stats of a run in microseconds: a hot loop, a line around the hot threshold and the rest of the function."""
+    return LineStats({KEY: [(11, 1, rest_time), (12, 100, loop_time), (13, 1, jitter_time)]}, 1e-6)
+
+
+def test_median_absolute_deviation():
+    """Test that a single outlier does not inflate the spread."""
+    assert median_absolute_deviation([10, 11, 9, 10, 100]) == 1
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        pytest.param([3, 1, 2, 5, 4], (1, 5, 0.9375), id="too_few_values_for_95"),
+        pytest.param(list(range(1, 11)), (2, 9, 1 - 22 / 1024), id="ten_values"),
+        pytest.param([7], (7, 7, 0.0), id="single_value"),
+    ]
+)
+def test_median_confidence_interval(values, expected):
+    """Test the order statistic bounds and their coverage."""
+    low, high, coverage = median_confidence_interval(values)
+    assert (low, high) == expected[:2]
+    assert coverage == pytest.approx(expected[2])
+
+
+def test_aggregate_line_stats():
+    """Test median stats, robust hotspots and lines within the noise."""
+    runs = [make_run(900, jitter, 50) for jitter in (20, 80, 40, 150, 60)]
+    aggregate = aggregate_line_stats(runs)
+
+    assert aggregate["runs"] == 5
+    assert aggregate["stats"].timings[KEY] == [(11, 1, 50), (12, 100, 900), (13, 1, 60)]
+    assert aggregate["functions"][0]["median"] == pytest.approx(1010e-6)
+
+    hotspots = {hotspot["line"]: hotspot for hotspot in aggregate["hotspots"]}
+    assert set(hotspots) == {12, 13}
+    assert hotspots[12]["robust"] and hotspots[12]["rank"] == 1 and not hotspots[12]["unstable"]
+    # Around 6% of the function in the median run, but only 2% in the fastest one
+    assert not hotspots[13]["robust"]
+    assert hotspots[13]["ci_percent_low"] < 5 <= hotspots[13]["percent"]
+
+
+def test_aggregate_line_stats_unstable_ranking():
+    """Test that two lines whose order changes between runs are flagged."""
+    stats = [LineStats({KEY: [(11, 1, first), (12, 1, second)]}, 1e-6)
+             for first, second in ((100, 90), (90, 100), (105, 95))]
+    hotspots = aggregate_line_stats(stats)["hotspots"]
+
+    assert [hotspot["line"] for hotspot in hotspots] == [11, 12]
+    assert all(hotspot["unstable"] for hotspot in hotspots)
+    assert (hotspots[0]["rank_low"], hotspots[0]["rank_high"]) == (1, 2)
+
+
+def test_format_repeat_report():
+    """Test that robust hotspots and noise are reported apart."""
+    report = format_repeat_report(aggregate_line_stats([make_run(900, jitter, 50) for jitter in (20, 80, 40, 150, 60)]))
+
+    robust, noise = report.split("Not significant")
+    assert "work.py:12 in work" in robust
+    assert "work.py:13 in work" in noise
+    assert "93.8% confidence interval" in report
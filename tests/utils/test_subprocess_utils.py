@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+from profiling_cli.consts import PROFILE_MODULES, PROFILE_SUBPROCESSES
+
+# Runs as the parent process: the project and profiling-cli directories are on its path the way pytest puts its
+# rootdir there, not through PYTHONPATH, so the child does not inherit them from the environment
+PARENT_SOURCE = textwrap.dedent('''\
+    import json
+    import subprocess
+    import sys
+
+    sys.path[:0] = [{project!r}, {package_root!r}]
+
+    from profiling_cli.utils.plugin_utils import create_profiler, register_functions
+    from profiling_cli.utils.subprocess_utils import collect_child_stats, enable_subprocess_profiling, \\
+        format_process_breakdown
+
+    profiler = create_profiler()
+    register_functions(profiler, ["worker"], [], verbose=False)
+    enable_subprocess_profiling(profiler, {output_dir!r})
+    child = subprocess.run([sys.executable, "-c", "import worker; worker.crunch(2000)"], cwd={child_dir!r},
+                           capture_output=True, text=True, check=False)
+    profiler.enable_by_count()
+    import worker
+    worker.crunch(10)
+    profiler.disable_by_count()
+    children = collect_child_stats({output_dir!r})
+    print(json.dumps({{"child_output": child.stdout + child.stderr, "returncode": child.returncode,
+                      "children": [{{"pid": c["pid"], "parent_pid": c["parent_pid"],
+                                    "functions": sorted(key[2] for key in c["stats"].timings)}} for c in children],
+                      "breakdown": format_process_breakdown(profiler.get_stats(), children)}}))
+''')
+
+
+def test_child_process_stats_are_collected(tmp_path):
+    """Test that a Python child started elsewhere profiles the registered functions and its stats are merged."""
+    project, child_dir = tmp_path / "project", tmp_path / "elsewhere"
+    project.mkdir()
+    child_dir.mkdir()
+    (project / "worker.py").write_text("def crunch(n):\n    return sum(i * i for i in range(n))\n")
+    source = PARENT_SOURCE.format(project=str(project), package_root=str(Path(__file__).parents[2]),
+                                  output_dir=str(tmp_path / "results"), child_dir=str(child_dir))
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONPATH"}
+    env.update({PROFILE_MODULES: "worker", PROFILE_SUBPROCESSES: "1"})
+
+    parent = subprocess.run([sys.executable, "-c", source], cwd=project, env=env, capture_output=True, text=True,
+                            check=True)
+    result = json.loads(parent.stdout.splitlines()[-1])
+
+    assert result["returncode"] == 0, result["child_output"]
+    assert result["child_output"] == ""
+    [child] = result["children"]
+    assert child["functions"] == ["crunch"]
+    assert f"Process {child['pid']} (child of {child['parent_pid']}" in result["breakdown"]
+    assert "crunch (worker.py:1)" in result["breakdown"]
@@ -0,0 +1,77 @@
+import sys
+import threading
+
+from profiling_cli.utils.thread_utils import ThreadLineTracer, format_thread_report
+
+
+def busy_function(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def test_thread_line_tracer_records_each_thread():
+    """Test that the tracer keeps separate stats per thread and combines them in get_stats."""
+    tracer = ThreadLineTracer()
+    tracer.add_function(busy_function)
+
+    tracer.enable_by_count()
+    threads = [threading.Thread(target=busy_function, args=(100,), name=f"worker-{i}") for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tracer.disable_by_count()
+
+    thread_stats = {stats['thread']: stats for stats in tracer.get_thread_stats()}
+    assert set(thread_stats) == {"worker-0", "worker-1"}
+    for stats in thread_stats.values():
+        assert stats['calls'] == 1
+        assert stats['wall'] >= stats['cpu'] >= 0
+
+    (key, lines), = tracer.get_stats().timings.items()
+    assert key[2] == "busy_function"
+    # The loop body ran 100 times in each thread
+    assert (busy_function.__code__.co_firstlineno + 3) in [lineno for lineno, hits, _ in lines if hits == 200]
+
+
+def test_thread_line_tracer_restores_previous_trace_functions():
+    """Test that tracers installed before profiling, e.g. coverage's, are put back when it stops."""
+    previous = sys.gettrace(), threading.gettrace()
+
+    def outer_trace(frame, event, arg):
+        return None
+
+    sys.settrace(outer_trace)
+    threading.settrace(outer_trace)
+    try:
+        tracer = ThreadLineTracer()
+        tracer.add_function(busy_function)
+        tracer.enable_by_count()
+        busy_function(10)
+        tracer.disable_by_count()
+
+        assert sys.gettrace() is outer_trace
+        assert threading.gettrace() is outer_trace
+    finally:
+        sys.settrace(previous[0])
+        threading.settrace(previous[1])
+    assert tracer.get_stats().timings
+
+
+def test_format_thread_report_flags_starved_threads():
+    """Test that only threads running concurrently get a contention score."""
+    thread_stats = [
+        {'thread': 'worker-0', 'thread_id': 1, 'calls': 1, 'wall': 1.0, 'cpu': 0.2, 'active': (0, 10),
+         'functions': {}},
+        {'thread': 'worker-1', 'thread_id': 2, 'calls': 1, 'wall': 1.0, 'cpu': 0.9, 'active': (5, 15),
+         'functions': {}},
+        {'thread': 'MainThread', 'thread_id': 3, 'calls': 1, 'wall': 1.0, 'cpu': 0.0, 'active': (20, 30),
+         'functions': {}},
+    ]
+
+    report = format_thread_report(thread_stats)
+
+    assert "concurrently: 2" in report
+    assert "Starved threads: worker-0." in report
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from profiling_cli.utils import timing_utils
+from profiling_cli.utils.timing_utils import StageTimer, format_bytes
+
+
+def test_stage_timer_records_stages_in_order(tmp_path):
+    """Test that every stage is recorded with its time and the peak RSS, even when it raises."""
+    stage_timer = StageTimer()
+    stage_timer.record("startup", 0.5)
+    with stage_timer.stage("pytest run"):
+        pass
+    with pytest.raises(RuntimeError), stage_timer.stage("agent turn"):
+        raise RuntimeError("model unavailable")
+
+    assert [stage["stage"] for stage in stage_timer.stages] == ["startup", "pytest run", "agent turn"]
+    assert stage_timer.stages[0]["seconds"] == 0.5
+    assert all(stage["peak_rss"] > 0 for stage in stage_timer.stages)
+
+    stage_timer.write_json(str(tmp_path / "timings.json"))
+    trace = json.loads((tmp_path / "timings.json").read_text())
+    assert trace["stages"] == stage_timer.stages
+    assert trace["peak_rss"] >= trace["stages"][-1]["peak_rss"]
+    assert "children_peak_rss" in trace
+
+
+def test_stage_timer_format():
+    """Test that the trace lists every stage, the total and the peak RSS."""
+    stage_timer = StageTimer()
+    stage_timer.record("stats parsing", 0.25)
+    report = stage_timer.format()
+
+    assert "stats parsing" in report
+    assert "0.250 s" in report
+    assert "total" in report
+    assert "Peak RSS" in report
+
+
+def test_stage_timer_without_resource_module(monkeypatch):
+    """Test that the trace is still recorded where the platform has no resource module, e.g. Windows."""
+    monkeypatch.setattr(timing_utils, "resource", None)
+    stage_timer = StageTimer()
+    stage_timer.record("startup", 0.5)
+
+    trace = stage_timer.to_dict()
+    assert trace["peak_rss"] is None and trace["children_peak_rss"] is None
+    assert trace["stages"][0]["peak_rss"] is None
+    assert "Peak RSS: unavailable, largest subprocess unavailable" in stage_timer.format()
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [
+        pytest.param(512, "512.0 B", id="bytes"),
+        pytest.param(1536, "1.5 KiB", id="kibibytes"),
+        pytest.param(3 * 1024 ** 3, "3.0 GiB", id="gibibytes"),
+    ]
+)
+def test_format_bytes(size, expected):
+    """Test formatting sizes with binary units."""
+    assert format_bytes(size) == expected
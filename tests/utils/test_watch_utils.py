@@ -0,0 +1,93 @@
+import importlib
+import sys
+import textwrap
+
+from profiling_cli.utils.watch_utils import (
+    changed_function_names,
+    format_function_delta,
+    line_time_delta,
+    reload_module,
+)
+
+SOURCE = textwrap.dedent('''\
+    import functools
+
+
+    def traced(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            return func(*args)
+        return wrapper
+
+
+    def double(n):
+        return n * 2
+
+
+    @traced
+    def triple(n):
+        return n * 3
+
+
+    class Counter:
+        def step(self):
+            return 1
+''')
+
+
+def test_reload_module_updates_references(tmp_path, monkeypatch):
+    """Test that references taken before the reload, decorated functions and existing instances run the new code."""
+    module_file = tmp_path / "watched_module.py"
+    module_file.write_text(SOURCE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module("watched_module")
+    try:
+        double, triple, counter = module.double, module.triple, module.Counter()
+
+        # Same size and same second as the first version
+        module_file.write_text(SOURCE.replace("n * 2", "n + n").replace("n * 3", "n * 4")
+                               .replace("return 1", "return 2"))
+        reload_module(module)
+        assert double(2) == 4 and double is module.double
+        assert triple(2) == 8 and triple is module.triple
+        assert counter.step() == 2 and isinstance(counter, module.Counter)
+
+        # A module failing to execute keeps its previous version
+        module_file.write_text(SOURCE + "\nraise RuntimeError('half saved')\n")
+        try:
+            reload_module(module)
+        except RuntimeError:
+            pass
+        assert module.triple(2) == 8
+    finally:
+        sys.modules.pop("watched_module", None)
+
+
+def test_changed_function_names():
+    """Test that edited and new functions are changed, functions that only moved are not."""
+    new_source = "\n\n" + SOURCE.replace("n * 3", "n * 4") + "\n\ndef added():\n    pass\n"
+
+    assert changed_function_names("watched_module.py", SOURCE, new_source) == {"triple", "added"}
+
+
+def test_line_time_delta():
+    """Test that lines are matched by code, whatever their line number."""
+    before_lines = {5: "def hot(items):", 6: "    found = 0", 7: "    for item in range(100):",
+                    8: "        if item in items:", 9: "            found += 1", 10: "    return found"}
+    after_lines = {5: "def hot(items):", 6: "    items = set(items)", 7: "    found = 0",
+                   8: "    for item in range(100):", 9: "        if item in items:", 10: "            found += 1",
+                   11: "    return found"}
+    rows = line_time_delta({7: 0.001, 8: 0.02, 9: 0.002}, before_lines, {6: 0.0001, 8: 0.001, 9: 0.001, 10: 0.002},
+                           after_lines)
+
+    by_code = {row["code"].strip(): row for row in rows}
+    assert by_code["items = set(items)"]["before"] is None
+    assert by_code["if item in items:"]["line"] == 9
+    assert (by_code["if item in items:"]["before"], by_code["if item in items:"]["after"]) == (0.02, 0.001)
+
+    report = format_function_delta("mod.hot", 2, {7: 0.001, 8: 0.02, 9: 0.002},
+                                   {6: 0.0001, 8: 0.001, 9: 0.001, 10: 0.002}, rows)
+    assert report.startswith("mod.hot: 23.000 ms -> 4.100 ms (-82.2%) over 2 tests")
+    assert "     9   20.000 ms    1.000 ms  -19.000 ms  if item in items:" in report
+    assert "     6         new    0.100 ms   +0.100 ms  items = set(items)" in report
+    assert "found = 0" not in report